@@ -0,0 +1,91 @@
+"""
+This is an executable script that measures the throughput of
+BOWParser, in utterances per second, at several catalogue sizes.
+
+The utterance corpus is the one of bench_utterance_latency.py. Only
+parsing is measured: no eval engine or player is involved.
+
+Execution:
+    cd intelligent-music-recommender/
+
+    python3 benchmarks/bench_bow_parser.py --sizes 1000 100000
+
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+
+sys.path.append('../')
+sys.path.append('.')
+from benchmarks import bench_utils
+from benchmarks.bench_utterance_latency import build_corpus
+from command_evaluation.bag_of_words_eval_engine import BOWEvalEngine
+from nlp.bag_of_words_parser import BOWParser
+from player_adaptor.null_adaptor import NullController
+
+
+def run(db_path, corpus, rounds):
+    """Parses the corpus `rounds` times over.
+
+    Returns:
+        (dict): throughput, in utterances per second, and per-utterance latency summary.
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        parser = BOWParser(db_path, BOWEvalEngine(db_path, NullController()).keywords)
+
+        # Warm up.
+        for text in corpus:
+            parser(text)
+
+        durations = []
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in corpus:
+                call_start = time.perf_counter()
+                parser(text)
+                durations.append(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start
+
+    return dict(
+        num_utterances=len(durations),
+        throughput_ups=len(durations) / elapsed,
+        latency=bench_utils.summarize_latencies(durations),
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000],
+                        help=" Catalogue sizes (number of nodes) to benchmark against.")
+    parser.add_argument("--utterances", type=int, default=200,
+                        help=" Number of distinct utterances in the corpus.")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help=" Number of times the corpus is parsed.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help=" Seed for the synthetic DBs and the corpus.")
+    parser.add_argument("--data-dir", type=str, default=bench_utils.DEFAULT_DATA_DIR,
+                        help=" Where synthetic DBs are stored and reused.")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        db_path = bench_utils.synthetic_db(size, data_dir=args.data_dir, seed=args.seed)
+        artists, songs = bench_utils.sample_entities(db_path, 64, seed=args.seed)
+        corpus = [text for _, text in build_corpus(artists, songs, args.utterances)]
+
+        print("Benchmarking BOWParser with {} nodes...".format(size), file=sys.stderr)
+        result = run(db_path, corpus, args.rounds)
+        result.update(size=size)
+        results.append(result)
+        print("  {:.0f} utterances/sec (p50 {:.3f} ms, p99 {:.3f} ms)".format(
+            result["throughput_ups"], result["latency"]["p50_ms"], result["latency"]["p99_ms"]), file=sys.stderr)
+
+    bench_utils.write_json(dict(meta=bench_utils.run_metadata(args), results=results), args.output_path)
+
+
+if __name__ == "__main__":
+    main()
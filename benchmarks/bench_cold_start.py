@@ -0,0 +1,139 @@
+"""
+This is an executable script that measures cold start: the time
+from launching a fresh Python process to the first response of
+SystemEntry, for each parser.
+
+Each run is a new interpreter, which imports SystemEntry, builds it
+against the DB (with a null player adaptor), and processes one
+utterance. The script reports the median, over several runs, of:
+    - import_ms: importing SystemEntry.
+    - init_ms: constructing SystemEntry.
+    - first_utterance_ms: processing the first utterance.
+    - first_response_ms: from launching the process to the first
+      response, as seen by this script (includes interpreter startup).
+
+If a --budget-ms is given, the script exits with a non-zero status
+when the median first_response_ms of any parser exceeds it.
+
+Execution:
+    cd intelligent-music-recommender/
+
+    python3 benchmarks/bench_cold_start.py --budget-ms 1500
+
+    # Against a synthetic catalogue with ~100k nodes:
+    python3 benchmarks/bench_cold_start.py --size 100000
+
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append('../')
+sys.path.append('.')
+from benchmarks import bench_utils
+
+PARSER_TYPES = ['BagOfWords', 'TREE']
+DEFAULT_DB = "./knowledge_base/knowledge_base.db"
+
+# Runs in the fresh interpreter. It must not import anything that
+# SystemEntry does not, so that it measures a real cold start.
+_CHILD_SCRIPT = """
+import json, os, sys, time
+from contextlib import redirect_stdout
+start = time.perf_counter()
+sys.path.append('.')
+with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+    from controller.system_entry import SystemEntry
+    from player_adaptor.null_adaptor import NullController
+    imported = time.perf_counter()
+    system_entry = SystemEntry(db_path=sys.argv[1], player_controller=NullController(), parser_type=sys.argv[2])
+    initialized = time.perf_counter()
+    system_entry(sys.argv[3])
+    responded = time.perf_counter()
+print(json.dumps(dict(
+    import_ms=(imported - start) * 1000.0,
+    init_ms=(initialized - imported) * 1000.0,
+    first_utterance_ms=(responded - initialized) * 1000.0,
+)), flush=True)
+"""
+
+
+def measure_cold_start(db_path, parser_type, utterance):
+    """Launches a fresh interpreter that builds SystemEntry and processes one utterance.
+
+    Returns:
+        (dict): import, init, first utterance and first response times, in ms.
+    """
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, "-c", _CHILD_SCRIPT, db_path, parser_type, utterance],
+                             stdout=subprocess.PIPE,
+                             )
+    line = child.stdout.readline()
+    first_response_ms = (time.perf_counter() - start) * 1000.0
+    child.stdout.close()
+    if child.wait() != 0 or not line:
+        raise RuntimeError("Cold start run failed for parser {}.".format(parser_type))
+
+    result = json.loads(line.decode("UTF-8"))
+    result.update(first_response_ms=first_response_ms)
+    return result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path",
+                        help=" DB to start against. Default: {}, or a synthetic DB if --size is given.".format(DEFAULT_DB))
+    parser.add_argument("--size", type=int,
+                        help=" Start against a synthetic DB with this many nodes.")
+    parser.add_argument("--parsers", nargs="+", default=PARSER_TYPES, choices=PARSER_TYPES,
+                        help=" Parser types to benchmark.")
+    parser.add_argument("--runs", type=int, default=5,
+                        help=" Number of cold starts per parser; medians are reported.")
+    parser.add_argument("--utterance", type=str, default="play something similar to U2",
+                        help=" The first utterance sent to the system.")
+    parser.add_argument("--budget-ms", type=float,
+                        help=" Exit with status 1 if a parser's median time to first response exceeds this.")
+    parser.add_argument("--data-dir", type=str, default=bench_utils.DEFAULT_DATA_DIR,
+                        help=" Where synthetic DBs are stored and reused.")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    if args.size:
+        db_path = bench_utils.synthetic_db(args.size, data_dir=args.data_dir)
+    else:
+        db_path = args.db_path or DEFAULT_DB
+    if not os.path.isfile(db_path):
+        print("Error: DB file \"{}\" not found.".format(db_path), file=sys.stderr)
+        sys.exit(1)
+
+    results = []
+    over_budget = []
+    for parser_type in args.parsers:
+        print("Measuring cold start of parser={}...".format(parser_type), file=sys.stderr)
+        runs = [measure_cold_start(db_path, parser_type, args.utterance) for _ in range(args.runs)]
+        result = {k: statistics.median(run[k] for run in runs) for k in runs[0]}
+        result.update(parser=parser_type, runs=len(runs))
+        results.append(result)
+
+        print("  median time to first response: {:.0f} ms (import {:.0f} ms, init {:.0f} ms, "
+              "first utterance {:.0f} ms)".format(result["first_response_ms"], result["import_ms"],
+                                                  result["init_ms"], result["first_utterance_ms"]),
+              file=sys.stderr)
+        if args.budget_ms is not None and result["first_response_ms"] > args.budget_ms:
+            over_budget.append(parser_type)
+
+    bench_utils.write_json(dict(meta=bench_utils.run_metadata(args), results=results), args.output_path)
+
+    if over_budget:
+        print("Cold start over budget of {:.0f} ms for: {}".format(args.budget_ms, ", ".join(over_budget)),
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
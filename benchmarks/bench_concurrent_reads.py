@@ -0,0 +1,170 @@
+"""
+This is an executable script that measures the throughput and
+latency of KnowledgeBaseAPI reads while another process keeps
+writing to the DB, as during an ingestion.
+
+For each journal mode, a copy of a synthetic DB is put in that mode.
+Reader processes then call get_related_entities in a loop, while a
+writer process commits batches of new artists and edges (through
+bulk_load), for the same duration. In the default rollback-journal
+mode ("delete"), every commit locks readers out; in WAL mode,
+readers are not blocked by the writer.
+
+Execution:
+    cd intelligent-music-recommender/
+
+    python3 benchmarks/bench_concurrent_reads.py --modes delete wal --readers 4 --duration 5
+
+    # Readers with read-only connections and a larger page cache:
+    python3 benchmarks/bench_concurrent_reads.py --read-only --pragmas "mmap_size=268435456;cache_size=-65536"
+
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+sys.path.append('../')
+sys.path.append('.')
+from benchmarks import bench_utils
+from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.sqlite_config import ConnectionConfig, parse_pragmas
+
+JOURNAL_MODES = ["delete", "wal"]
+
+
+def _sleep_until(timestamp):
+    delay = timestamp - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def read_loop(db_path, config, artists, start_at, duration):
+    """Calls get_related_entities until the duration is over.
+
+    Returns:
+        (tuple): the latency of each call, in seconds, and the number of calls that failed.
+    """
+    kb_api = KnowledgeBaseAPI(db_path, connection_config=config)
+    durations = []
+    errors = io.StringIO()
+    _sleep_until(start_at)
+    i = 0
+    with redirect_stdout(errors):
+        while time.time() < start_at + duration:
+            call_start = time.perf_counter()
+            kb_api.get_related_entities(artists[i % len(artists)])
+            durations.append(time.perf_counter() - call_start)
+            i += 1
+    return durations, errors.getvalue().count("ERROR")
+
+
+def write_loop(db_path, config, batch_size, start_at, duration):
+    """Commits batches of new artists, each similar to the previous one, until the duration is over.
+
+    Returns:
+        (tuple): number of committed batches, and the latency of each commit, in seconds.
+    """
+    kb_api = KnowledgeBaseAPI(db_path, connection_config=config)
+    durations = []
+    _sleep_until(start_at)
+    with redirect_stdout(io.StringIO()):
+        while time.time() < start_at + duration:
+            records = []
+            previous_name = None
+            for j in range(batch_size):
+                name = "Concurrent Artist {} {}".format(len(durations), j)
+                records.append(dict(type="artist", name=name, genres=[], num_spotify_followers=j))
+                if previous_name is not None:
+                    records.append(dict(type="edge", source=name, dest=previous_name,
+                                        rel="similar to", score=50, symmetric=False))
+                previous_name = name
+            call_start = time.perf_counter()
+            kb_api.bulk_load(records)
+            durations.append(time.perf_counter() - call_start)
+    return len(durations), durations
+
+
+def run(db_path, mode, args, artists):
+    """Runs the readers and the writer against a copy of the DB in the given journal mode."""
+    pragmas = parse_pragmas(args.pragmas)
+    tmp_dir = tempfile.mkdtemp(prefix="bench_concurrent_reads_")
+    try:
+        copy_path = os.path.join(tmp_dir, "kb.db")
+        shutil.copyfile(db_path, copy_path)
+        # The journal mode is stored in the DB file, so it is set once, before the readers open it.
+        KnowledgeBaseAPI(copy_path, connection_config=ConnectionConfig(dict(journal_mode=mode))).get_data_version()
+
+        read_config = ConnectionConfig(pragmas, read_only=args.read_only, busy_timeout_ms=args.busy_timeout_ms)
+        write_config = ConnectionConfig(pragmas, busy_timeout_ms=args.busy_timeout_ms)
+        start_at = time.time() + 1.0
+        with ProcessPoolExecutor(max_workers=args.readers + 1) as executor:
+            readers = [executor.submit(read_loop, copy_path, read_config, artists[i::args.readers] or artists,
+                                       start_at, args.duration)
+                       for i in range(args.readers)]
+            writer = executor.submit(write_loop, copy_path, write_config, args.write_batch, start_at, args.duration)
+            read_results = [reader.result() for reader in readers]
+            num_batches, write_durations = writer.result()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    read_durations = [d for durations, _ in read_results for d in durations]
+    return dict(
+        journal_mode=mode,
+        reads_per_sec=len(read_durations) / args.duration,
+        read_errors=sum(num_errors for _, num_errors in read_results),
+        read_latency=bench_utils.summarize_latencies(read_durations),
+        writes_per_sec=num_batches / args.duration,
+        write_latency=bench_utils.summarize_latencies(write_durations),
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000,
+                        help=" Size (number of nodes) of the synthetic DB.")
+    parser.add_argument("--modes", nargs="+", default=JOURNAL_MODES, choices=JOURNAL_MODES,
+                        help=" Journal modes to compare.")
+    parser.add_argument("--readers", type=int, default=4,
+                        help=" Number of reader processes.")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help=" Seconds that readers and the writer run for, per mode.")
+    parser.add_argument("--write-batch", type=int, default=200,
+                        help=" Artists (and edges) committed by each write.")
+    parser.add_argument("--read-only", action="store_true",
+                        help=" Readers open the DB read-only.")
+    parser.add_argument("--pragmas", type=str, default="",
+                        help=" Pragmas of every connection, e.g. 'mmap_size=268435456;synchronous=NORMAL'.")
+    parser.add_argument("--busy-timeout-ms", type=float, default=5000,
+                        help=" How long a statement waits for a lock.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help=" Seed for the synthetic DB and the sampled artists.")
+    parser.add_argument("--data-dir", type=str, default=bench_utils.DEFAULT_DATA_DIR,
+                        help=" Where synthetic DBs are stored and reused.")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    db_path = bench_utils.synthetic_db(args.size, data_dir=args.data_dir, seed=args.seed)
+    artists, _ = bench_utils.sample_entities(db_path, 256, seed=args.seed)
+
+    results = []
+    for mode in args.modes:
+        print("Benchmarking reads under concurrent writes, journal_mode={}...".format(mode), file=sys.stderr)
+        result = run(db_path, mode, args, artists)
+        result.update(size=args.size)
+        results.append(result)
+        print("  {:.0f} reads/sec (p50 {:.3f} ms, p99 {:.3f} ms, {} errors), {:.1f} writes/sec".format(
+            result["reads_per_sec"], result["read_latency"]["p50_ms"], result["read_latency"]["p99_ms"],
+            result["read_errors"], result["writes_per_sec"]), file=sys.stderr)
+
+    bench_utils.write_json(dict(meta=bench_utils.run_metadata(args), results=results), args.output_path)
+
+
+if __name__ == "__main__":
+    main()
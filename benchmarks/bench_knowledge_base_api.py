@@ -0,0 +1,201 @@
+"""
+This is an executable script that microbenchmarks every public
+read and write method of KnowledgeBaseAPI, at several DB sizes.
+
+Results can be saved as a baseline, and later runs compared
+against it: the script exits with a non-zero status if the
+median latency of any method regressed by more than the
+allowed percentage, so that query-path regressions are caught
+before they ship.
+
+Execution:
+    cd intelligent-music-recommender/
+
+    # Record a baseline (e.g. on the main branch):
+    python3 benchmarks/bench_knowledge_base_api.py --save-baseline ./benchmarks/data/kb_api_baseline.json
+
+    # Compare a change against it, failing on >20% regressions:
+    python3 benchmarks/bench_knowledge_base_api.py --compare ./benchmarks/data/kb_api_baseline.json --threshold 20
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+
+sys.path.append('../')
+sys.path.append('.')
+from benchmarks import bench_utils
+from knowledge_base.api import KnowledgeBaseAPI
+
+# Calls that scan the whole catalogue run fewer times.
+SLOW_METHODS = {"get_all_music_entities"}
+
+
+def read_benchmarks(kb_api, artists, songs):
+    """Returns the read methods to benchmark.
+
+    Returns:
+        (dict): key is method name, val is a function of the iteration number that calls it once.
+    """
+    return dict(
+        get_related_entities=lambda i: kb_api.get_related_entities(artists[i % len(artists)]),
+        get_related_genres=lambda i: kb_api.get_related_entities(
+            artists[i % len(artists)], kb_api.approved_relations["genre"]),
+        get_song_data=lambda i: kb_api.get_song_data(songs[i % len(songs)]),
+        get_artist_data=lambda i: kb_api.get_artist_data(artists[i % len(artists)]),
+        get_songs_by_artist=lambda i: kb_api.get_songs_by_artist(artists[i % len(artists)]),
+        get_node_ids_by_entity_type=lambda i: kb_api.get_node_ids_by_entity_type(artists[i % len(artists)]),
+        get_all_music_entities=lambda i: kb_api.get_all_music_entities(),
+    )
+
+
+def write_benchmarks(kb_api, artists, iterations):
+    """Returns the write methods to benchmark.
+
+    Every call writes new, unique entities, so that each measures a successful insertion.
+    The artists connected by connect_entities are created beforehand, outside of the measurement.
+    """
+    kb_api.bulk_load([
+        dict(type="artist", name="Benchmark Artist {} {}".format(side, i))
+        for i in range(iterations) for side in ["A", "B"]
+    ])
+    return dict(
+        add_artist=lambda i: kb_api.add_artist(
+            "Benchmark New Artist {}".format(i), genres=["benchmark genre"], num_spotify_followers=i),
+        add_song=lambda i: kb_api.add_song(
+            "Benchmark Song {}".format(i), artists[i % len(artists)], duration_ms=1000, popularity=50),
+        add_genre=lambda i: kb_api.add_genre("Benchmark Genre {}".format(i)),
+        connect_entities=lambda i: kb_api.connect_entities(
+            "Benchmark Artist A {}".format(i), "Benchmark Artist B {}".format(i), "similar to", 50),
+    )
+
+
+def time_calls(func, iterations, rounds):
+    """Times `iterations` calls of func, `rounds` times over.
+
+    Returns:
+        (list of floats): durations, in seconds, of the round with the lowest median,
+            which is the least disturbed by unrelated activity on the machine.
+    """
+    best_round = None
+    for r in range(rounds):
+        durations = []
+        for i in range(r * iterations, (r + 1) * iterations):
+            start = time.perf_counter()
+            func(i)
+            durations.append(time.perf_counter() - start)
+        durations.sort()
+        if best_round is None or durations[len(durations) // 2] < best_round[len(best_round) // 2]:
+            best_round = durations
+    return best_round
+
+
+def run(sizes, iterations, rounds, data_dir, seed):
+    """Runs all benchmarks against synthetic DBs of the given sizes.
+
+    Writes go to a throw-away copy of each DB, so that the shared synthetic DBs are not modified.
+
+    Returns:
+        (dict): key is DB size (as a string), val is a dict mapping method name to its latency summary.
+    """
+    results = dict()
+    for size in sizes:
+        db_path = bench_utils.synthetic_db(size, data_dir=data_dir, seed=seed)
+        artists, songs = bench_utils.sample_entities(db_path, 64, seed=seed)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tmp_db_path = os.path.join(tmp_dir, "kb.db")
+            shutil.copyfile(db_path, tmp_db_path)
+            kb_api = KnowledgeBaseAPI(tmp_db_path)
+
+            print("Benchmarking KnowledgeBaseAPI with {} nodes...".format(size), file=sys.stderr)
+            size_results = dict()
+            # The KB API prints warnings for e.g. ambiguous names; keep them out of the report.
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                benchmarks = read_benchmarks(kb_api, artists, songs)
+                benchmarks.update(write_benchmarks(kb_api, artists, iterations * rounds))
+                for name, func in benchmarks.items():
+                    num_calls = max(1, iterations // 10) if name in SLOW_METHODS else iterations
+                    size_results[name] = bench_utils.summarize_latencies(time_calls(func, num_calls, rounds))
+            results[str(size)] = size_results
+        finally:
+            shutil.rmtree(tmp_dir)
+    return results
+
+
+def compare(results, baseline, threshold_pct):
+    """Compares median latencies against a baseline.
+
+    Returns:
+        (list of strings): descriptions of the regressions beyond threshold_pct; empty if none.
+    """
+    regressions = []
+    for size, size_results in sorted(results.items(), key=lambda x: int(x[0])):
+        for method, summary in sorted(size_results.items()):
+            baseline_summary = baseline.get(size, {}).get(method)
+            if baseline_summary is None:
+                print("{:>8} {:<28} {:>10.3f} ms  (no baseline)".format(size, method, summary["p50_ms"]))
+                continue
+
+            change_pct = 100.0 * (summary["p50_ms"] - baseline_summary["p50_ms"]) / baseline_summary["p50_ms"]
+            regressed = change_pct > threshold_pct
+            print("{:>8} {:<28} {:>10.3f} ms  baseline {:>10.3f} ms  {:+7.1f}%{}".format(
+                size, method, summary["p50_ms"], baseline_summary["p50_ms"], change_pct,
+                "  REGRESSION" if regressed else ""))
+            if regressed:
+                regressions.append("{} at {} nodes: {:+.1f}%".format(method, size, change_pct))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help=" DB sizes (number of nodes) to benchmark against.")
+    parser.add_argument("--iterations", type=int, default=50,
+                        help=" Number of calls per method and round (a tenth of that for full-catalogue scans).")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help=" Number of rounds per method; the round with the lowest median is reported.")
+    parser.add_argument("--seed", type=int, default=0, help=" Seed for the synthetic DBs.")
+    parser.add_argument("--data-dir", type=str, default=bench_utils.DEFAULT_DATA_DIR,
+                        help=" Where synthetic DBs are stored and reused.")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Write the JSON results to this file.")
+    parser.add_argument("--save-baseline", type=str, dest="baseline_output_path",
+                        help=" Save the results as a baseline to this file.")
+    parser.add_argument("--compare", type=str, dest="baseline_path",
+                        help=" Compare against the baseline in this file; exit with status 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help=" Allowed slowdown of a method's median latency, in percent. Default: 20")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.iterations, args.rounds, args.data_dir, args.seed)
+    output = dict(meta=bench_utils.run_metadata(args), results=results)
+
+    if args.output_path:
+        bench_utils.write_json(output, args.output_path)
+    if args.baseline_output_path:
+        bench_utils.write_json(output, args.baseline_output_path)
+        print("Saved baseline to {}".format(args.baseline_output_path))
+
+    if args.baseline_path:
+        with open(args.baseline_path) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n{} regression(s) beyond {}%:\n  {}".format(
+                len(regressions), args.threshold, "\n  ".join(regressions)))
+            sys.exit(1)
+        print("\nNo regressions beyond {}%.".format(args.threshold))
+
+    elif not args.output_path and not args.baseline_output_path:
+        bench_utils.write_json(output)
+
+
+if __name__ == "__main__":
+    main()
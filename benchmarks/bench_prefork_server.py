@@ -0,0 +1,179 @@
+"""
+This is an executable script that measures how the throughput of the
+pre-fork server (view/server.py) scales with its number of workers,
+and how much memory each worker does not share with the others.
+
+For each number of workers, the server is started against a synthetic
+DB, then client processes post utterances (see
+bench_utterance_latency.py's templates) in a loop, for a fixed duration.
+The script reports the requests per second, their latency, how the
+requests were spread across workers (from /stats), and, on Linux, the
+proportional set size (PSS) of the server and of its workers: pages
+shared copy-on-write count for a fraction in each process that maps
+them. Throughput can only scale up to the number of CPUs.
+
+Execution:
+    cd intelligent-music-recommender/
+
+    python3 benchmarks/bench_prefork_server.py --workers 1 2 4 --clients 8 --duration 5
+
+    # Tree parser, against ~100k nodes:
+    python3 benchmarks/bench_prefork_server.py --parser TREE --size 100000
+
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append('../')
+sys.path.append('.')
+from benchmarks import bench_utils
+from benchmarks.bench_utterance_latency import PARSER_TYPES, build_corpus
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "view", "server.py")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_json(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read().decode("UTF-8"))
+
+
+def _pss_mb(pid):
+    """Returns: the proportional set size of a process, in MB, or None where it is not available."""
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid)) as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+
+
+def client_loop(url, utterances, start_at, duration):
+    """Posts utterances until the duration is over.
+
+    Returns:
+        (tuple): the latency of each request, in seconds, and the number of failed requests.
+    """
+    durations = []
+    num_errors = 0
+    delay = start_at - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    i = 0
+    while time.time() < start_at + duration:
+        call_start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, data=utterances[i % len(utterances)].encode("UTF-8"), timeout=30) as r:
+                r.read()
+            durations.append(time.perf_counter() - call_start)
+        except OSError:
+            num_errors += 1
+        i += 1
+    return durations, num_errors
+
+
+def run(db_path, num_workers, args, corpus):
+    """Starts a server with the given number of workers, and measures it under load."""
+    port = _free_port()
+    base_url = "http://127.0.0.1:{}".format(port)
+    command = [sys.executable, SERVER_SCRIPT, "-d", db_path, "--workers", str(num_workers), "--port", str(port)]
+    if args.parser == "TREE":
+        command.append("-t")
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        start = time.perf_counter()
+        while True:
+            try:
+                stats = _get_json(base_url + "/stats")
+                if len(stats["workers"]) == num_workers:
+                    break
+            except OSError:
+                pass
+            if server.poll() is not None or time.perf_counter() - start > 600:
+                raise RuntimeError("The server did not start.")
+            time.sleep(0.1)
+        ready_seconds = time.perf_counter() - start
+
+        utterances = [utterance for _, utterance in corpus]
+        start_at = time.time() + 1.0
+        with ProcessPoolExecutor(max_workers=args.clients) as executor:
+            clients = [executor.submit(client_loop, base_url + "/utterance", utterances[i::args.clients] or utterances,
+                                       start_at, args.duration)
+                       for i in range(args.clients)]
+            client_results = [client.result() for client in clients]
+
+        stats = _get_json(base_url + "/stats")
+        worker_pss = [_pss_mb(worker["pid"]) for worker in stats["workers"]]
+        server_pss = _pss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    durations = [d for client_durations, _ in client_results for d in client_durations]
+    return dict(
+        workers=num_workers,
+        ready_seconds=ready_seconds,
+        requests_per_sec=len(durations) / args.duration,
+        errors=sum(num_errors for _, num_errors in client_results),
+        latency=bench_utils.summarize_latencies(durations),
+        requests_per_worker=[worker["requests"] for worker in stats["workers"]],
+        server_pss_mb=server_pss,
+        worker_pss_mb=worker_pss,
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000,
+                        help=" Size (number of nodes) of the synthetic DB.")
+    parser.add_argument("--parser", choices=PARSER_TYPES, default="BagOfWords",
+                        help=" Parser of the server.")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4],
+                        help=" Numbers of worker processes to compare.")
+    parser.add_argument("--clients", type=int, default=8,
+                        help=" Number of client processes sending requests.")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help=" Seconds that the clients run for, per number of workers.")
+    parser.add_argument("--utterances", type=int, default=400,
+                        help=" Number of distinct utterances sent.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help=" Seed for the synthetic DB and the sampled entities.")
+    parser.add_argument("--data-dir", type=str, default=bench_utils.DEFAULT_DATA_DIR,
+                        help=" Where synthetic DBs are stored and reused.")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    db_path = bench_utils.synthetic_db(args.size, data_dir=args.data_dir, seed=args.seed)
+    artists, songs = bench_utils.sample_entities(db_path, 256, seed=args.seed)
+    corpus = build_corpus(artists, songs, args.utterances)
+
+    results = []
+    for num_workers in args.workers:
+        print("Benchmarking the pre-fork server with {} workers...".format(num_workers), file=sys.stderr)
+        result = run(db_path, num_workers, args, corpus)
+        result.update(size=args.size, parser=args.parser)
+        results.append(result)
+        print("  {:.0f} requests/sec (p50 {:.3f} ms, p99 {:.3f} ms, {} errors), ready in {:.2f}s".format(
+            result["requests_per_sec"], result["latency"]["p50_ms"], result["latency"]["p99_ms"],
+            result["errors"], result["ready_seconds"]), file=sys.stderr)
+
+    bench_utils.write_json(dict(meta=bench_utils.run_metadata(args), cpu_count=os.cpu_count(), results=results),
+                           args.output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Helpers shared by the benchmark scripts in this directory.
+"""
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+
+sys.path.append('../')
+sys.path.append('.')
+from instrumentation.metrics import percentile
+from scripts.generate_synthetic_db import GENERATOR_VERSION, generate
+
+# Synthetic DBs are generated once per size, seed and generator version, then reused across runs.
+DEFAULT_DATA_DIR = "./benchmarks/data"
+SONGS_PER_ARTIST = 10
+
+
+def summarize_latencies(seconds):
+    """Summarizes a list of latencies.
+
+    Returns:
+        (dict): count, and mean/p50/p95/p99/max in milliseconds.
+    """
+    values = sorted(x * 1000.0 for x in seconds)
+    return dict(
+        count=len(values),
+        mean_ms=sum(values) / len(values) if values else None,
+        p50_ms=percentile(values, 50),
+        p95_ms=percentile(values, 95),
+        p99_ms=percentile(values, 99),
+        max_ms=values[-1] if values else None,
+    )
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process, in MB."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KB elsewhere.
+    if sys.platform == "darwin":
+        return max_rss / (1024.0 * 1024.0)
+    return max_rss / 1024.0
+
+
+def run_metadata(args=None):
+    """Describes the environment of a benchmark run, so that results can be compared across commits."""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return dict(
+        commit=commit,
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        sqlite=sqlite3.sqlite_version,
+        args=vars(args) if args is not None else None,
+    )
+
+
+def write_json(results, output_path=None):
+    """Writes results as JSON to the given path, or to stdout."""
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output_path is None:
+        print(text)
+    else:
+        with open(output_path, "w") as f:
+            f.write(text + "\n")
+
+
+def synthetic_db(num_nodes, data_dir=DEFAULT_DATA_DIR, seed=0):
+    """Returns the path to a synthetic DB with (about) the given number of nodes, generating it if needed.
+
+    See scripts/generate_synthetic_db.py.
+    """
+    num_genres = max(5, min(200, num_nodes // 20))
+    num_artists = max(1, (num_nodes - num_genres) // (SONGS_PER_ARTIST + 1))
+
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    db_path = os.path.join(data_dir, "synthetic_{}_seed{}_v{}.db".format(num_nodes, seed, GENERATOR_VERSION))
+    if not os.path.isfile(db_path):
+        print("Generating synthetic DB with ~{} nodes at {}...".format(num_nodes, db_path), file=sys.stderr)
+        generate(
+            db_path + ".tmp",
+            num_artists=num_artists,
+            songs_per_artist=SONGS_PER_ARTIST,
+            num_genres=num_genres,
+            seed=seed,
+        )
+        os.rename(db_path + ".tmp", db_path)
+    return db_path
+
+
+def sample_entities(db_path, num_samples, seed=0):
+    """Picks artist and song names to use in benchmark utterances.
+
+    Half of the artists are the most followed ones (as real traffic is skewed towards them),
+    the rest are picked uniformly at random.
+
+    Returns:
+        (tuple of lists): artist names, song names.
+    """
+    rand = random.Random(seed)
+    with closing(sqlite3.connect(db_path)) as con:
+        top_artists = [x[0] for x in con.execute("""
+            SELECT name FROM artists JOIN nodes ON node_id == id
+            ORDER BY num_spotify_followers DESC LIMIT (?);
+        """, (num_samples // 2,))]
+        all_artists = [x[0] for x in con.execute("""
+            SELECT name FROM artists JOIN nodes ON node_id == id;
+        """)]
+        all_songs = [x[0] for x in con.execute("""
+            SELECT name FROM songs JOIN nodes ON node_id == id;
+        """)]
+
+    artists = top_artists + [rand.choice(all_artists) for _ in range(num_samples - len(top_artists))]
+    songs = [rand.choice(all_songs) for _ in range(num_samples)] if all_songs else []
+    return artists, songs
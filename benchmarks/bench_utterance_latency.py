@@ -0,0 +1,264 @@
+"""
+This is an executable script that benchmarks end-to-end
+utterance latency, for both parsers, at several catalogue
+sizes.
+
+A corpus of utterances (play, similar-to, songs-by, unions, ...)
+is replayed through SystemEntry against synthetic KBs (see
+scripts/generate_synthetic_db.py), with a null player adaptor.
+Each utterance goes through SystemEntry.__call__, including its
+utterance cache, which serves the utterances that the corpus
+repeats (--cache-size 0 disables it, to measure the uncached
+pipeline). For each (parser, catalogue size) pair, the script
+reports startup time, throughput, peak RSS, the number of cache
+hits, and p50/p95/p99 latency of each stage: parse, evaluate
+(excluding KB calls), and KB, and of each stage of the parser
+(from metrics.trace()).
+
+Every pair runs in a fresh process, so that peak RSS and
+warm caches of one run do not leak into the next.
+
+Execution:
+    cd intelligent-music-recommender/
+
+    python3 benchmarks/bench_utterance_latency.py -o bench.json
+
+    # Smaller run:
+    python3 benchmarks/bench_utterance_latency.py --sizes 1000 100000 --parsers TREE
+
+    # Without the utterance cache:
+    python3 benchmarks/bench_utterance_latency.py --cache-size 0
+
+The JSON output has the same structure on every run, so runs on
+different commits can be compared directly.
+
+"""
+import multiprocessing
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+
+sys.path.append('../')
+sys.path.append('.')
+from benchmarks import bench_utils
+from controller.system_entry import SystemEntry
+from instrumentation import metrics
+from player_adaptor.null_adaptor import NullController
+
+PARSER_TYPES = ['BagOfWords', 'TREE']
+
+# (name, template); {artist}, {artist2} and {song} are filled in with entities from the KB.
+UTTERANCE_TEMPLATES = [
+    ("play_artist", "play {artist}"),
+    ("play_song", "play {song}"),
+    ("play_similar", "play something similar to {artist}"),
+    ("query_similar", "who are artists like {artist}"),
+    ("songs_by", "what are some songs by {artist}"),
+    ("artist_of_song", "who is the artist of the song {song}"),
+    ("play_union", "play {artist} and {artist2}"),
+    ("play_similar_union", "play songs like {artist} or {artist2}"),
+]
+
+
+class _TimedKnowledgeBaseAPI:
+    """Wraps a KnowledgeBaseAPI, adding the time spent in each of its method calls to `elapsed`."""
+
+    def __init__(self, kb_api):
+        self._kb_api = kb_api
+        self.elapsed = 0.0
+
+    def __getattr__(self, name):
+        attr = getattr(self._kb_api, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - start
+
+        return timed
+
+
+class _TimedParser:
+    """Wraps a parser, adding the time spent parsing to `elapsed`, and counting its failures."""
+
+    def __init__(self, parser):
+        self._parser = parser
+        self.elapsed = 0.0
+        self.calls = 0
+        self.failed = False
+
+    def __getattr__(self, name):
+        return getattr(self._parser, name)
+
+    def __call__(self, text):
+        self.calls += 1
+        start = time.perf_counter()
+        try:
+            return self._parser(text)
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+def build_corpus(artists, songs, num_utterances):
+    """Fills the utterance templates in round-robin order.
+
+    Returns:
+        (list of tuples): (template name, utterance).
+    """
+    corpus = []
+    for i in range(num_utterances):
+        name, template = UTTERANCE_TEMPLATES[i % len(UTTERANCE_TEMPLATES)]
+        corpus.append((name, template.format(
+            artist=artists[i % len(artists)],
+            artist2=artists[(i * 7 + 1) % len(artists)],
+            song=songs[i % len(songs)] if songs else artists[i % len(artists)],
+        )))
+    return corpus
+
+
+def _process(system_entry, timed_parser, timed_kb_api, text):
+    """Runs one utterance through SystemEntry.__call__, timing each stage.
+
+    Returns:
+        (tuple): parse, evaluate (excluding KB) and KB durations in seconds, the duration of each
+            stage of the parser (dict), whether an error occurred (a cached response is not processed
+            again, so it never does), and whether the response was cached.
+    """
+    timed_parser.elapsed = 0.0
+    timed_parser.calls = 0
+    timed_parser.failed = False
+    timed_kb_api.elapsed = 0.0
+    error = False
+
+    with metrics.trace() as stages:
+        start = time.perf_counter()
+        try:
+            system_entry(text)
+        except Exception:
+            error = True
+        total = time.perf_counter() - start
+
+    parser_stages = dict()
+    for name, labels, value in stages:
+        if name == "imr_parser_stage_seconds":
+            parser_stages[labels["stage"]] = parser_stages.get(labels["stage"], 0.0) + value
+
+    parse = timed_parser.elapsed
+    kb = timed_kb_api.elapsed
+    return parse, total - parse - kb, kb, parser_stages, error or timed_parser.failed, timed_parser.calls == 0
+
+
+def run_config(db_path, parser_type, corpus, num_warmup, cache_size=None):
+    """Benchmarks one parser against one DB. Meant to run in a fresh process.
+
+    Returns:
+        (dict): startup time, throughput, peak RSS, cache hits and per-stage latency summaries.
+    """
+    start = time.perf_counter()
+    system_entry = SystemEntry(db_path=db_path,
+                               player_controller=NullController(),
+                               parser_type=parser_type,
+                               timings=False,
+                               cache_size=cache_size,
+                               )
+    startup_s = time.perf_counter() - start
+    rss_after_startup_mb = bench_utils.peak_rss_mb()
+
+    timed_kb_api = _TimedKnowledgeBaseAPI(system_entry.eval_engine.kb_api)
+    system_entry.eval_engine.kb_api = timed_kb_api
+    timed_parser = _TimedParser(system_entry.parser)
+    system_entry.parser = timed_parser
+
+    # The warm-up utterances are not part of the corpus, so that they do not fill the cache for it.
+    for _, text in build_corpus(["Unknown Artist"], [], num_warmup):
+        _process(system_entry, timed_parser, timed_kb_api, text)
+
+    stages = dict(parse=[], evaluate=[], kb=[], total=[])
+    parser_stages = dict()
+    by_template = dict()
+    num_errors = 0
+    num_cache_hits = 0
+    replay_start = time.perf_counter()
+    for name, text in corpus:
+        parse_s, evaluate_s, kb_s, stages_s, error, cached = _process(system_entry, timed_parser, timed_kb_api, text)
+        stages["parse"].append(parse_s)
+        stages["evaluate"].append(evaluate_s)
+        stages["kb"].append(kb_s)
+        stages["total"].append(parse_s + evaluate_s + kb_s)
+        for stage, seconds in stages_s.items():
+            parser_stages.setdefault(stage, []).append(seconds)
+        by_template.setdefault(name, []).append(parse_s + evaluate_s + kb_s)
+        num_errors += error
+        num_cache_hits += cached
+    replay_s = time.perf_counter() - replay_start
+
+    return dict(
+        startup_s=startup_s,
+        num_utterances=len(corpus),
+        num_errors=num_errors,
+        num_cache_hits=num_cache_hits,
+        throughput_ups=len(corpus) / replay_s if replay_s > 0 else None,
+        rss_after_startup_mb=rss_after_startup_mb,
+        peak_rss_mb=bench_utils.peak_rss_mb(),
+        stages={k: bench_utils.summarize_latencies(v) for k, v in stages.items()},
+        parser_stages={k: bench_utils.summarize_latencies(v) for k, v in sorted(parser_stages.items())},
+        by_template={k: bench_utils.summarize_latencies(v) for k, v in by_template.items()},
+    )
+
+
+def _run_config_quietly(*args):
+    # The KB and parsers print warnings to stdout, which would get mixed into the JSON output.
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return run_config(*args)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help=" Catalogue sizes (number of nodes) to benchmark against.")
+    parser.add_argument("--parsers", nargs="+", default=PARSER_TYPES, choices=PARSER_TYPES,
+                        help=" Parser types to benchmark.")
+    parser.add_argument("--utterances", type=int, default=500,
+                        help=" Number of utterances replayed per (parser, size) pair.")
+    parser.add_argument("--warmup", type=int, default=3,
+                        help=" Number of utterances run before measuring.")
+    parser.add_argument("--cache-size", type=int, default=None,
+                        help=" Size of SystemEntry's utterance cache; 0 disables it. Default: SystemEntry's.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help=" Seed for the synthetic DBs and the corpus.")
+    parser.add_argument("--data-dir", type=str, default=bench_utils.DEFAULT_DATA_DIR,
+                        help=" Where synthetic DBs are stored and reused.")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    # A fresh interpreter per run, so that peak RSS is measured per run.
+    mp_context = multiprocessing.get_context("spawn")
+
+    results = []
+    for size in args.sizes:
+        db_path = bench_utils.synthetic_db(size, data_dir=args.data_dir, seed=args.seed)
+        artists, songs = bench_utils.sample_entities(db_path, 256, seed=args.seed)
+        corpus = build_corpus(artists, songs, args.utterances)
+
+        for parser_type in args.parsers:
+            print("Benchmarking parser={} size={}...".format(parser_type, size), file=sys.stderr)
+            with mp_context.Pool(1) as pool:
+                result = pool.apply(_run_config_quietly, (db_path, parser_type, corpus, args.warmup, args.cache_size))
+            result.update(parser=parser_type, size=size)
+            results.append(result)
+
+    bench_utils.write_json(dict(meta=bench_utils.run_metadata(args), results=results), args.output_path)
+
+
+if __name__ == "__main__":
+    main()
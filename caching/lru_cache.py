@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+
+from instrumentation import metrics
+
+
+class LRUCache:
+    """A bounded cache, which evicts its least recently used entries first.
+
+    Entries can be tagged with the version of the data they were computed
+    from (e.g. KnowledgeBaseAPI.get_write_version). Once a lookup is made at
+    another version, every entry is stale, so the whole cache is dropped.
+    Entries can also expire after a time to live.
+
+    Params:
+        capacity (int): maximum number of entries.
+        ttl_seconds (float): how long entries stay valid. None for no limit.
+        name (string): labels the cache's hits and misses in the metrics
+            (imr_cache_total, see instrumentation/metrics.py).
+    """
+
+    def __init__(self, capacity=1024, ttl_seconds=None, name="default"):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        # Key is a cache key, val is a (value, expiry time) tuple.
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, key, version=None):
+        """Returns the value cached for the key at the given version, or None."""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            metrics.increment("imr_cache_total", cache=self.name, result="miss")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.increment("imr_cache_total", cache=self.name, result="hit")
+        return entry[0]
+
+    def put(self, key, value, version=None):
+        """Caches the value of the key, computed at the given version."""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        expiry = None if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+        self._entries[key] = (value, expiry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def info(self):
+        """Returns: (dict) the hits, misses, hit rate, size and capacity of the cache."""
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    hit_rate=self.hits / lookups if lookups else None,
+                    size=len(self._entries),
+                    capacity=self.capacity,
+                    )
@@ -1,7 +1,9 @@
 from collections import OrderedDict
 from typing import List
 
+from instrumentation import metrics
 from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.prefetch import PrefetchedKnowledgeBase
 
 
 class BOWEvalEngine:
@@ -51,6 +53,47 @@ class BOWEvalEngine:
                              remaining_text=remaining_text,
                              )
 
+    def evaluate_many(self, parses):
+        """Acts on the parses of several utterances, in order.
+
+        The KB lookups that the parses need are first made
+        together, with a few grouped queries, then each parse is
+        acted upon as by `__call__`, as the returned iterator is
+        consumed.
+
+        Args:
+            parses: A list of (subjects, commands, remaining_text)
+                tuples, as given by the NLP layer.
+
+        Returns: An iterator giving, for each parse, once it has
+            been acted upon, None, or the exception raised while
+            acting on it.
+
+        """
+        parses = list(parses)
+        kb = PrefetchedKnowledgeBase(self.kb_api)
+        kb.prefetch_related_entities([
+            subject
+            for subjects, commands, _ in parses
+            if 'query_similar_entities' in commands
+            for subject in subjects
+        ])
+        return self._evaluate_each(parses, kb)
+
+    def _evaluate_each(self, parses, kb):
+        kb_api = self.kb_api
+        self.kb_api = kb
+        try:
+            for parse in parses:
+                try:
+                    self(*parse)
+                    error = None
+                except Exception as e:
+                    error = e
+                yield error
+        finally:
+            self.kb_api = kb_api
+
     @property
     def intents(self):
         """Returns a mapping that stores signifiers of user's
@@ -221,11 +264,15 @@ class BOWEvalEngine:
                         ):
         """Calls the next function in the commands parameter.
 
+        The recorded duration of a command includes that of the
+        commands it calls in turn.
+
         """
-        next_command_name = commands.pop(0) if commands else self._default
+        next_command_name = commands.pop(0) if commands else 'default'
         next_func = self.actions.get(next_command_name, self._default)
-        next_func(subjects=subjects,
-                  commands=commands,
-                  remaining_text=remaining_text,
-                  response_msg=response_msg,
-                  )
+        with metrics.timer("imr_eval_command_seconds", engine="bow", command=next_command_name):
+            next_func(subjects=subjects,
+                      commands=commands,
+                      remaining_text=remaining_text,
+                      response_msg=response_msg,
+                      )
@@ -2,9 +2,13 @@ import sys
 from collections import OrderedDict
 from typing import List
 
-import nltk
-
+from caching.lru_cache import LRUCache
+from instrumentation import metrics
 from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.prefetch import PrefetchedKnowledgeBase
+
+# Stands for a None result in the result cache.
+_NO_RESULT = object()
 
 
 class TreeEvalEngine:
@@ -18,25 +22,129 @@ class TreeEvalEngine:
     This class also contains the functions that corresponds to
     each of the possible user interactions.
 
+    The results of unary commands on each entity (e.g. the entities
+    similar to 'Justin Bieber') are cached, whichever request they
+    are part of, until the KB is written to or they expire.
+
+    Params:
+        result_cache_size (int): number of cached results; 0
+            disables the cache.
+        result_cache_ttl_seconds (float): how long results are
+            cached for. None for no limit.
+
     """
 
-    def __init__(self, db_path, player_controller):
+    def __init__(self, db_path, player_controller, result_cache_size=1024, result_cache_ttl_seconds=300):
         self.player = player_controller
         self.DB_path = db_path
         self.kb_api = KnowledgeBaseAPI(self.DB_path)
+        self._result_cache = None
+        if result_cache_size > 0:
+            self._result_cache = LRUCache(result_cache_size, result_cache_ttl_seconds, name="eval")
+        # Version of the KB that the current tree is evaluated against.
+        self._kb_version = None
 
     def __call__(self, parser, text):
         """Evaluates a parse tree that was generated by
         the NLP layer from the user input.
 
         """
+        self._update_kb_version()
         try:
             nltk_parse_tree = parser(text)
 
             self._evaluate(nltk_parse_tree)
-        except:
+        except Exception:
             self.player.respond("I'm sorry, I don't understand.")
 
+    def evaluate_many(self, trees):
+        """Evaluates the parse trees of several utterances, in order.
+
+        The KB lookups that unary commands make on the entities
+        of the trees are first made together, with a few grouped
+        queries, then each tree is evaluated as by `__call__`, as
+        the returned iterator is consumed.
+
+        Args:
+            trees: A list of parse trees, as given by the NLP
+                layer's `parse_many`. An exception in place of a
+                tree stands for an utterance that failed to parse.
+
+        Returns: An iterator giving, for each tree, once it has
+            been evaluated, None, or the exception raised while
+            parsing or evaluating it.
+
+        """
+        trees = list(trees)
+        kb = self._prefetch([tree for tree in trees if not isinstance(tree, Exception)])
+        return self._evaluate_each(trees, kb)
+
+    def _evaluate_each(self, trees, kb):
+        kb_api = self.kb_api
+        self.kb_api = kb
+        try:
+            for tree in trees:
+                self._update_kb_version()
+                try:
+                    if isinstance(tree, Exception):
+                        raise tree
+                    self._evaluate(tree)
+                    error = None
+                except Exception as e:
+                    self.player.respond("I'm sorry, I don't understand.")
+                    error = e
+                yield error
+        finally:
+            self.kb_api = kb_api
+
+    def _prefetch(self, trees):
+        """Fetches, with grouped queries, what the unary commands
+        applied directly to entities in the trees will look up.
+
+        Returns: A PrefetchedKnowledgeBase.
+
+        """
+        entities_by_command = {}
+        for tree in trees:
+            for result in tree.subtrees(lambda t: t.label() == "Result"
+                                        and t[0].label() == "Unary_Command"
+                                        and t[1][0].label() == "Entity"):
+                entities_by_command.setdefault(result[0][0], []).append(result[1][0][0])
+
+        kb = PrefetchedKnowledgeBase(self.kb_api)
+        kb.prefetch_related_entities(entities_by_command.get('query_similar_entities', []))
+        kb.prefetch_songs_by_artist(entities_by_command.get('query_songs_by_artist', []))
+        kb.prefetch_song_data(entities_by_command.get('query_artist_by_song', []))
+        return kb
+
+    def result_cache_info(self):
+        """Returns: A dict of the hits, misses, hit rate and size of
+            the result cache, or None if there is no cache.
+
+        """
+        return self._result_cache.info() if self._result_cache is not None else None
+
+    def _update_kb_version(self):
+        if self._result_cache is not None:
+            self._kb_version = self.kb_api.get_write_version()
+
+    def _entity_result(self, command_name, entity, lookup):
+        """Returns lookup(entity), the part of a unary command's
+        result that comes from one of its entities, from the
+        result cache if possible.
+
+        """
+        if self._result_cache is None:
+            return lookup(entity)
+        key = (command_name, entity)
+        result = self._result_cache.get(key, self._kb_version)
+        if result is None:
+            result = lookup(entity)
+            self._result_cache.put(key, _NO_RESULT if result is None else result, self._kb_version)
+        elif result is _NO_RESULT:
+            result = None
+        return result
+
     @property
     def unary_commands(self):
         """A unary command operates on just one set of
@@ -217,7 +325,7 @@ class TreeEvalEngine:
             similar_entities += [
                 ent
                 for ent
-                in self.kb_api.get_related_entities(e)
+                in self._entity_result('query_similar_entities', e, self.kb_api.get_related_entities)
                 if ent not in entities
             ]
 
@@ -235,7 +343,7 @@ class TreeEvalEngine:
         """
         artists = []
         for e in entities:
-            artists += self.kb_api.get_songs_by_artist(e)
+            artists += self._entity_result('query_songs_by_artist', e, self.kb_api.get_songs_by_artist)
 
         return artists
 
@@ -251,15 +359,28 @@ class TreeEvalEngine:
         """
         artists = []
         for e in entities:
-            artists += [
-                song.get('artist_name')
-                for song
-                in self.kb_api.get_song_data(e)
-            ]
+            artists += self._entity_result('query_artist_by_song', e, self._get_song_artists)
 
         return artists
 
-    def _evaluate(self, tree: nltk.tree.Tree):
+    def _get_song_artists(self, song_name):
+        return [
+            song.get('artist_name')
+            for song
+            in self.kb_api.get_song_data(song_name)
+        ]
+
+    @staticmethod
+    def _timed_command(command_name, func):
+        """Wraps a command's function so that its calls are recorded
+        in the metrics, if they are being recorded.
+
+        """
+        if not metrics.active():
+            return func
+        return metrics.timed("imr_eval_command_seconds", engine="tree", command=command_name)(func)
+
+    def _evaluate(self, tree: 'nltk.tree.Tree'):
         """This function will evaluate the parse tree
         generated by the NLP layer.  It recursively
         evaluates the tree from the top down.  The
@@ -295,13 +416,13 @@ class TreeEvalEngine:
                 return func(result_left, result_right)
         elif tree.label() == "Unary_Command":
             func = self.unary_commands.get(tree[0])[1]
-            return func
+            return self._timed_command(tree[0], func)
         elif tree.label() == "Terminal_Command":
             func = self.terminal_commands.get(tree[0])[1]
-            return func
+            return self._timed_command(tree[0], func)
         elif tree.label() == "Binary_Command":
             func = self.binary_commands.get(tree[0])[1]
-            return func
+            return self._timed_command(tree[0], func)
         elif tree.label() == "Entity":
             return [tree[0]]
 
@@ -0,0 +1,123 @@
+"""
+Updates a SystemEntry's parser when the KB changes, without
+restarting the process.
+
+The parsers load every entity name of the KB when they are built, so
+entities added to the DB afterwards (e.g. by scripts/ or by another
+process) are not recognized until the parser is updated. The watcher
+polls SQLite's data_version (see https://www.sqlite.org/pragma.html#pragma_data_version)
+from a thread of its own. The value changes whenever another
+connection commits to the DB. Writes of this process, through any
+KnowledgeBaseAPI, are observed as they happen (see
+KnowledgeBaseAPI.add_observer).
+
+On a change, the watcher calls SystemEntry.apply_kb_changes, which
+adds the songs and artists recorded in the KB's changelog since the
+last update to the parser's entities (and removes the deleted ones),
+at a cost proportional to the change. If the KB has no changelog, or
+the DB file was replaced, the parser is rebuilt instead
+(SystemEntry.reload), off to the side, and swapped in once it is
+ready. Requests keep being served meanwhile.
+
+The eval engines query the KB on every request, so they see the
+changes right away; their cached results are tagged with the KB's
+write version (see KnowledgeBaseAPI.get_write_version).
+
+Usage:
+    system_entry = SystemEntry(db_path, player_controller, hot_reload_seconds=1.0)
+
+    # or, to check and reload explicitly:
+    watcher = KnowledgeBaseWatcher(system_entry)
+    watcher.check()
+"""
+import os
+import sqlite3
+import sys
+import threading
+
+
+class KnowledgeBaseWatcher:
+    """Watches the DB of a SystemEntry and updates its parser when the DB changes.
+
+    Params:
+        system_entry (SystemEntry): whose parser is updated.
+        interval_seconds (float): how often `start`'s thread checks the DB.
+    """
+
+    def __init__(self, system_entry, interval_seconds=1.0):
+        self.system_entry = system_entry
+        self.interval_seconds = interval_seconds
+        # Number of times the parser was updated or rebuilt.
+        self.num_reloads = 0
+        # data_version is only meaningful for a given connection, so
+        # the same one is used for every check.
+        self._conn = sqlite3.connect(system_entry.DB_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._version = self._read_version()
+        self._stop_event = threading.Event()
+        self._thread = None
+        system_entry.kb_api.add_observer(self._on_kb_changes)
+
+    def _read_version(self):
+        # The inode tells apart a DB that was recreated at the same path,
+        # which the connection would not see, as it keeps the old file open.
+        return os.stat(self.system_entry.DB_path).st_ino, self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def check(self):
+        """Updates the parser if the DB changed since the last check.
+
+        If the update fails, the current parser is kept, and the update
+        is attempted again on the next check.
+
+        Returns:
+            (bool): True if the parser was updated.
+        """
+        with self._lock:
+            try:
+                version = self._read_version()
+                if version == self._version:
+                    return False
+                if version[0] != self._version[0]:
+                    self._conn.close()
+                    self._conn = sqlite3.connect(self.system_entry.DB_path, check_same_thread=False)
+                    version = self._read_version()
+                    self.system_entry.reload()
+                    updated = True
+                else:
+                    updated = self.system_entry.apply_kb_changes()
+            except Exception as e:
+                print("WARN: Could not reload the knowledge base: {}".format(e), file=sys.stderr)
+                return False
+            self._version = version
+            if updated:
+                self.num_reloads += 1
+            return updated
+
+    def _on_kb_changes(self, changes):
+        try:
+            if self.system_entry.apply_kb_changes():
+                self.num_reloads += 1
+        except Exception as e:
+            print("WARN: Could not reload the knowledge base: {}".format(e), file=sys.stderr)
+
+    def start(self):
+        """Checks the DB every `interval_seconds` from a daemon thread, until `stop` is called."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="kb-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread started by `start`, and closes the watcher's connection."""
+        self.system_entry.kb_api.remove_observer(self._on_kb_changes)
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._conn.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            self.check()
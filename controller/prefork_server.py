@@ -0,0 +1,475 @@
+"""
+Serves a SystemEntry over HTTP from pre-forked worker processes, to
+use every core of a machine.
+
+A single process is bound to one core by the GIL. The server instead
+builds and warms up one SystemEntry (the entity table, the parser and
+its artifacts, the grammar, and the caches, with warm-up utterances),
+then forks the workers, which inherit it copy-on-write rather than
+each building their own:
+    - The objects that exist at fork time are moved out of the reach
+      of the garbage collector (gc.freeze), whose passes would
+      otherwise write to every one of them, and so copy the pages they
+      are on into each worker.
+    - The entity table, and the graph snapshot if one is used, are
+      memory-mapped, so their pages are shared whatever the workers do.
+    - No SQLite connection is open at fork time (KnowledgeBaseAPI
+      connects on each call), and the watchers of the KB, which keep
+      one open, are started by each worker.
+The workers accept connections on the listening socket that they
+inherit, so the kernel spreads the requests among them.
+
+The server supervises the workers: one that dies is replaced (after a
+delay that grows if workers keep dying right after they start). On
+SIGHUP, the server brings its SystemEntry up to date with the KB, and
+replaces the workers with new ones, forked from it; the previous
+workers finish the requests they are serving and exit. SIGTERM or
+SIGINT stops the workers the same way, then the server.
+
+Each worker records its number of requests and errors, and the time
+it spent serving them, in a table of shared memory, which any worker
+serves at /stats.
+
+Only available where os.fork is (i.e. not on Windows), and on Python
+3.7 or later (for gc.freeze).
+
+Usage:
+    server = PreforkServer(db_path, parser_type="TREE", workers=4, address=("127.0.0.1", 8080))
+    server.serve_forever()
+
+    $ curl -d 'play despacito' http://127.0.0.1:8080/utterance
+    $ curl http://127.0.0.1:8080/stats
+"""
+import gc
+import json
+import mmap
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import traceback
+from array import array
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from controller.system_entry import SystemEntry
+from player_adaptor.null_adaptor import NullController
+from player_adaptor.recording_adaptor import RecordingController
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8080)
+# A worker that dies sooner than this after it started is restarted after a delay.
+MIN_WORKER_UPTIME_SECONDS = 1.0
+MAX_RESTART_DELAY_SECONDS = 30.0
+# How long workers are given to finish their requests when they are stopped.
+STOP_TIMEOUT_SECONDS = 10.0
+# How often the server checks on its workers, and workers check whether they should stop.
+_POLL_SECONDS = 0.2
+_LISTEN_BACKLOG = 128
+
+# Fields of a row of the stats table. The first row is the server's.
+STATS_FIELDS = ("pid", "generation", "started_at", "requests", "errors", "busy_seconds",
+                "last_request_at", "restarts")
+_FIELD_INDEX = {field: i for i, field in enumerate(STATS_FIELDS)}
+_SERVER_ROW = 0
+
+
+def _exit_code(status):
+    """Returns: the exit code of a process from its status, as returned by os.waitpid:
+    minus the number of the signal that killed it, if one did.
+    (os.waitstatus_to_exitcode only exists from Python 3.9 on.)
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class StatsTable:
+    """Counters of the server and of each worker, in memory shared by all of them.
+
+    Each row is written by a single process (the server's by the server, a worker's by
+    the worker), and read by any.
+
+    Params:
+        num_workers (int): number of worker rows.
+    """
+
+    def __init__(self, num_workers):
+        self.num_rows = num_workers + 1
+        size = self.num_rows * len(STATS_FIELDS) * 8
+        # Anonymous and shared: the workers that are forked later see the same pages.
+        self._memory = mmap.mmap(-1, size)
+        self._values = memoryview(self._memory).cast("d")
+
+    def get(self, row, field):
+        return self._values[row * len(STATS_FIELDS) + _FIELD_INDEX[field]]
+
+    def set(self, row, field, value):
+        self._values[row * len(STATS_FIELDS) + _FIELD_INDEX[field]] = value
+
+    def add(self, row, field, value=1):
+        self._values[row * len(STATS_FIELDS) + _FIELD_INDEX[field]] += value
+
+    def clear(self, row):
+        start = row * len(STATS_FIELDS)
+        self._values[start:start + len(STATS_FIELDS)] = array("d", [0.0]) * len(STATS_FIELDS)
+
+    def free_row(self):
+        """Returns: the index of a worker row that no worker uses, or None."""
+        for row in range(_SERVER_ROW + 1, self.num_rows):
+            if self.get(row, "pid") == 0:
+                return row
+        return None
+
+    def row_dict(self, row):
+        values = dict(zip(STATS_FIELDS, self._values[row * len(STATS_FIELDS):(row + 1) * len(STATS_FIELDS)]))
+        for field in ("pid", "generation", "requests", "errors", "restarts"):
+            values[field] = int(values[field])
+        return values
+
+    def snapshot(self):
+        """Returns:
+            (dict): with keys "server" (its pid, generation, started_at and number of worker
+                restarts) and "workers" (the counters of each running worker, ordered by pid).
+        """
+        server = self.row_dict(_SERVER_ROW)
+        server = {field: server[field] for field in ("pid", "generation", "started_at", "restarts")}
+        workers = [self.row_dict(row) for row in range(_SERVER_ROW + 1, self.num_rows)
+                   if self.get(row, "pid") != 0]
+        for worker in workers:
+            del worker["restarts"]
+        return dict(server=server, workers=sorted(workers, key=lambda worker: worker["pid"]))
+
+
+class _UtteranceHandler(BaseHTTPRequestHandler):
+    """POST /utterance with the utterance as the body (or as the "utterance" of a JSON
+    object) responds with the player actions that it led to. GET /stats responds with
+    the counters of the server and its workers, GET /health with {"status": "ok"}.
+    """
+
+    server_version = "IMR"
+    # A worker serves one request at a time: a client that stops sending its request must
+    # not hold it for longer than this.
+    timeout = 30
+
+    def do_POST(self):
+        if self.path != "/utterance":
+            self._send_json(404, dict(error="Not found: {}".format(self.path)))
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("UTF-8")
+            utterance = json.loads(body)["utterance"] if body.lstrip().startswith("{") else body
+            if not isinstance(utterance, str):
+                raise TypeError("The utterance must be a string.")
+        except (ValueError, KeyError, TypeError) as e:
+            self.server.worker.record_error()
+            self._send_json(400, dict(error="Bad request: {}".format(e)))
+            return
+        status, result = self.server.worker.handle(utterance.strip())
+        self._send_json(status, result)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.worker.stats.snapshot())
+        elif self.path == "/health":
+            self._send_json(200, dict(status="ok"))
+        else:
+            self._send_json(404, dict(error="Not found: {}".format(self.path)))
+
+    def _send_json(self, status, content):
+        body = json.dumps(content).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Worker:
+    """The part of a worker process that serves requests, after the fork."""
+
+    def __init__(self, server, row):
+        self.server = server
+        self.row = row
+        self.stats = server.stats
+        self.system_entry = server.system_entry
+        self.recorder = server.recorder
+        self._stopping = False
+
+    def run(self):
+        # Signals sent to the terminal's process group (e.g. Ctrl-C) are the server's to handle.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        # Otherwise, every worker would draw the same random numbers.
+        random.seed()
+
+        watcher = None
+        if self.server.hot_reload_seconds > 0:
+            from controller.hot_reload import KnowledgeBaseWatcher
+            watcher = KnowledgeBaseWatcher(self.system_entry, interval_seconds=self.server.hot_reload_seconds)
+            watcher.start()
+
+        http_server = HTTPServer(self.server.address, _UtteranceHandler, bind_and_activate=False)
+        http_server.socket.close()
+        http_server.socket = self.server.socket
+        http_server.timeout = _POLL_SECONDS
+        http_server.worker = self
+        # Ends with the server, if it was killed without stopping its workers.
+        while not self._stopping and os.getppid() == self.server.pid:
+            http_server.handle_request()
+        if watcher is not None:
+            watcher.stop()
+
+    def _on_stop(self, signum, frame):
+        # The request being served, if any, is finished first.
+        self._stopping = True
+
+    def handle(self, utterance):
+        """Returns: (tuple) the HTTP status, and the result of the utterance, as a dict."""
+        start = time.perf_counter()
+        try:
+            self.system_entry(utterance)
+            status, error = 200, None
+        except Exception as e:
+            status, error = 500, type(e).__name__ + (": {}".format(e) if str(e) else "")
+        actions = self.recorder.take_actions()
+        self.stats.add(self.row, "busy_seconds", time.perf_counter() - start)
+        self.stats.add(self.row, "requests")
+        self.stats.set(self.row, "last_request_at", time.time())
+        if error is not None:
+            self.stats.add(self.row, "errors")
+        return status, dict(
+            utterance=utterance,
+            response=[argument for action, argument in actions if action == "respond"],
+            actions=[[action, argument] for action, argument in actions],
+            error=error,
+            worker=os.getpid(),
+        )
+
+    def record_error(self):
+        self.stats.add(self.row, "requests")
+        self.stats.add(self.row, "errors")
+
+
+class PreforkServer:
+    """Serves utterances over HTTP from worker processes forked from a warmed-up SystemEntry.
+
+    Params:
+        db_path (string): path to the DB file.
+        parser_type (string): 'BagOfWords' or 'TREE', see SystemEntry.
+        workers (int): number of worker processes. Defaults to the number of CPUs.
+        address (tuple): (host, port) to listen on. Port 0 picks a free port, see `address`
+            once started.
+        warm_up_utterances (list of strings): processed before the workers are forked, so
+            that they start with the parser's and the eval engine's caches filled.
+        hot_reload_seconds (float): if positive, each worker checks the KB for changes at
+            this interval (see controller/hot_reload.py).
+        graph_snapshot_path (string): see SystemEntry.
+    """
+
+    def __init__(self, db_path, parser_type='BagOfWords', workers=None, address=DEFAULT_ADDRESS,
+                 warm_up_utterances=(), hot_reload_seconds=0, graph_snapshot_path=None):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("PreforkServer needs os.fork, which this platform does not have.")
+        self.db_path = db_path
+        self.num_workers = workers or os.cpu_count() or 1
+        self.address = address
+        self.warm_up_utterances = list(warm_up_utterances)
+        self.hot_reload_seconds = hot_reload_seconds or 0
+        self.pid = os.getpid()
+        self.generation = 0
+        self.socket = None
+        # Replacing the workers briefly runs two generations of them.
+        self.stats = StatsTable(2 * self.num_workers)
+        # The workers' player: the actions are recorded, and returned in the responses.
+        self.recorder = RecordingController(NullController())
+        # The hot reload of the KB is started by the workers, after the fork.
+        self.system_entry = SystemEntry(db_path, self.recorder, parser_type=parser_type, timings=False,
+                                        hot_reload_seconds=0, graph_snapshot_path=graph_snapshot_path)
+        # Key is the pid of a running worker, val is its row in the stats table.
+        self._workers = dict()
+        # Pids of the workers that were asked to stop.
+        self._stopping = set()
+        # Rows whose worker died, with the time at which to restart it.
+        self._pending_restarts = []
+        self._restart_delay = 0.0
+        self._stop_requested = False
+        self._restart_requested = False
+
+    def __str__(self):
+        return "Pre-fork server of {} on {}:{}".format(self.db_path, *self.address)
+
+    def warm_up(self):
+        """Builds what the first requests would otherwise build, then freezes the objects
+        that the workers will inherit.
+        """
+        self.system_entry.parser.warm_up()
+        for utterance in self.warm_up_utterances:
+            try:
+                self.system_entry(utterance)
+            except Exception as e:
+                print("WARN: Could not warm up with '{}': {}".format(utterance, e), file=sys.stderr)
+        self.recorder.take_actions()
+        gc.collect()
+        gc.freeze()
+
+    def start(self):
+        """Warms up, listens, and forks the workers."""
+        self.pid = os.getpid()
+        self.warm_up()
+        self.socket = socket.socket(socket.AF_INET6 if ":" in self.address[0] else socket.AF_INET,
+                                    socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.listen(_LISTEN_BACKLOG)
+        # Every worker waits for connections, but only one accepts each: the others must not block.
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()[:2]
+
+        self.stats.set(_SERVER_ROW, "pid", self.pid)
+        self.stats.set(_SERVER_ROW, "started_at", time.time())
+        for _ in range(self.num_workers):
+            self._spawn(self.stats.free_row())
+
+    def _spawn(self, row):
+        self.stats.clear(row)
+        self.stats.set(row, "generation", self.generation)
+        self.stats.set(row, "started_at", time.time())
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self.stats.set(row, "pid", os.getpid())
+                _Worker(self, row).run()
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                # Nothing of the server's (e.g. atexit handlers, open files) is run or flushed twice.
+                os._exit(status)
+        self.stats.set(row, "pid", pid)
+        self._workers[pid] = row
+        return pid
+
+    @property
+    def worker_pids(self):
+        return sorted(pid for pid in self._workers if pid not in self._stopping)
+
+    def poll(self):
+        """Reaps the workers that exited, and restarts those that were not asked to stop.
+        Called by `serve_forever`, or by whoever drives the server.
+        """
+        for pid in list(self._workers):
+            try:
+                pid, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                status = 0
+            if pid == 0:
+                continue
+            row = self._workers.pop(pid)
+            uptime = time.time() - self.stats.get(row, "started_at")
+            self.stats.clear(row)
+            if pid in self._stopping:
+                self._stopping.discard(pid)
+                continue
+            print("WARN: Worker {} exited with status {}; restarting it.".format(
+                pid, _exit_code(status)), file=sys.stderr)
+            self.stats.add(_SERVER_ROW, "restarts")
+            # Workers that die right away would otherwise be restarted in a loop.
+            if uptime < MIN_WORKER_UPTIME_SECONDS:
+                self._restart_delay = min(max(2 * self._restart_delay, _POLL_SECONDS), MAX_RESTART_DELAY_SECONDS)
+            else:
+                self._restart_delay = 0.0
+            self._pending_restarts.append((time.time() + self._restart_delay, row))
+
+        now = time.time()
+        for restart in [restart for restart in self._pending_restarts if restart[0] <= now]:
+            self._pending_restarts.remove(restart)
+            self._spawn(restart[1])
+
+    def restart(self):
+        """Brings the SystemEntry up to date with the KB, and replaces the workers with new
+        ones, forked from it. The previous workers finish the requests they are serving.
+        """
+        gc.unfreeze()
+        try:
+            self.system_entry.apply_kb_changes()
+        except Exception as e:
+            print("WARN: Could not reload the knowledge base: {}".format(e), file=sys.stderr)
+        self.warm_up()
+        self.generation += 1
+        self.stats.set(_SERVER_ROW, "generation", self.generation)
+        # The rows of the stats table are only enough for two generations of workers.
+        self._wait_for_stopping(STOP_TIMEOUT_SECONDS)
+        previous = self.worker_pids
+        self._pending_restarts = []
+        for _ in range(self.num_workers):
+            self._spawn(self.stats.free_row())
+        self._signal_workers(previous, signal.SIGTERM)
+
+    def _signal_workers(self, pids, signum):
+        for pid in pids:
+            self._stopping.add(pid)
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, timeout_seconds=STOP_TIMEOUT_SECONDS):
+        """Stops the workers, letting them finish their requests for up to timeout_seconds,
+        and stops listening.
+        """
+        self._pending_restarts = []
+        self._signal_workers(list(self._workers), signal.SIGTERM)
+        self._wait_for_stopping(timeout_seconds)
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        gc.unfreeze()
+
+    def _wait_for_stopping(self, timeout_seconds):
+        """Waits for the workers that were asked to stop to exit, and kills those that are
+        still running after timeout_seconds.
+        """
+        deadline = time.time() + timeout_seconds
+        while self._stopping and time.time() < deadline:
+            self.poll()
+            time.sleep(0.01)
+        if self._stopping:
+            print("WARN: Killing {} workers that did not stop in time.".format(len(self._stopping)),
+                  file=sys.stderr)
+            for pid in list(self._stopping):
+                self._signal_workers([pid], signal.SIGKILL)
+                os.waitpid(pid, 0)
+                self.stats.clear(self._workers.pop(pid))
+            self._stopping.clear()
+
+    def _on_stop(self, signum, frame):
+        self._stop_requested = True
+
+    def _on_restart(self, signum, frame):
+        self._restart_requested = True
+
+    def serve_forever(self):
+        """Starts the server, and supervises the workers until SIGTERM or SIGINT.
+        SIGHUP replaces the workers (see `restart`).
+        """
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        self.start()
+        print("Serving on {}:{} with {} workers.".format(self.address[0], self.address[1], self.num_workers),
+              file=sys.stderr)
+        try:
+            while not self._stop_requested:
+                if self._restart_requested:
+                    self._restart_requested = False
+                    self.restart()
+                self.poll()
+                time.sleep(_POLL_SECONDS)
+        finally:
+            self.stop()
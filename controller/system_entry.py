@@ -1,26 +1,156 @@
-from command_evaluation.bag_of_words_eval_engine import BOWEvalEngine
-from command_evaluation.tree_eval_engine import TreeEvalEngine
+import os
+import sys
+import threading
+import time
+
+from caching.lru_cache import LRUCache
+from instrumentation import metrics, profiling
 from knowledge_base.api import KnowledgeBaseAPI
-from nlp.bag_of_words_parser import BOWParser
-from nlp.tree_parser import TreeParser
+from player_adaptor.recording_adaptor import RecordingController
+
+TIMINGS_ENV_VAR = "IMR_TIMINGS"
+CACHE_SIZE_ENV_VAR = "IMR_UTTERANCE_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 1024
+HOT_RELOAD_ENV_VAR = "IMR_HOT_RELOAD_SECONDS"
+GRAPH_SNAPSHOT_ENV_VAR = "IMR_GRAPH_SNAPSHOT"
+
+# Number of chunks per worker process that a batch is split into.
+_CHUNKS_PER_WORKER = 4
 
 
 class SystemEntry:
     """This class serves as the interface through which
     a UI can send user-input to the system.
 
+    Params:
+        timings (bool): print the duration of each stage of every
+            utterance to stderr. Defaults to the IMR_TIMINGS
+            environment variable.
+        cache_size (int): number of utterances whose responses are
+            cached; 0 disables the cache. Defaults to the IMR_UTTERANCE_CACHE_SIZE
+            environment variable, or 1024.
+        hot_reload_seconds (float): if positive, the KB is checked for
+            changes at this interval, and the parser is rebuilt when
+            it changed (see controller/hot_reload.py). Defaults to the
+            IMR_HOT_RELOAD_SECONDS environment variable, or 0 (disabled).
+        graph_snapshot_path (string): path to a snapshot of the KB's
+            graph, from which related entities are looked up while it
+            is up to date with the KB (see knowledge_base/graph_snapshot.py).
+            Defaults to the IMR_GRAPH_SNAPSHOT environment variable, or
+            None (look them up in the DB).
+
+    A profile is recorded if the IMR_PROFILE environment variable
+    is set (see instrumentation/profiling.py).
+
     """
 
-    def __init__(self, db_path, player_controller, parser_type='BagOfWords'):
+    def __init__(self, db_path, player_controller, parser_type='BagOfWords', timings=None, cache_size=None,
+                 hot_reload_seconds=None, graph_snapshot_path=None):
+        profiling.start_from_env()
+        if timings is None:
+            timings = os.environ.get(TIMINGS_ENV_VAR, "") not in ("", "0")
+        self.timings = timings
+        if cache_size is None:
+            cache_size = int(os.environ.get(CACHE_SIZE_ENV_VAR, DEFAULT_CACHE_SIZE))
+        self.cache = LRUCache(cache_size, name="utterance") if cache_size > 0 else None
         self.DB_path = db_path
         self.kb_api = KnowledgeBaseAPI(self.DB_path)
         self.parser_type = parser_type
+        # Only the selected parser's modules are imported, to keep
+        # startup fast.
         if parser_type == 'BagOfWords':
+            from command_evaluation.bag_of_words_eval_engine import BOWEvalEngine
             self.eval_engine = BOWEvalEngine(self.DB_path, player_controller)
-            self.parser = BOWParser(self.DB_path, self.eval_engine.keywords)
         elif parser_type == 'TREE':
+            from command_evaluation.tree_eval_engine import TreeEvalEngine
             self.eval_engine = TreeEvalEngine(self.DB_path, player_controller)
-            self.parser = TreeParser(self.DB_path, self.eval_engine.keywords)
+        if graph_snapshot_path is None:
+            graph_snapshot_path = os.environ.get(GRAPH_SNAPSHOT_ENV_VAR) or None
+        if graph_snapshot_path is not None:
+            self._use_graph_snapshot(graph_snapshot_path)
+        # Position in the KB's changelog that the parser is up to date
+        # with. It is read first, so that changes made while the parser
+        # is built are applied again, rather than missed.
+        self._changelog_seq = self.kb_api.get_entity_changelog_seq()
+        self.parser = self._build_parser()
+        # Incremented after every change of the parser.
+        self._parser_generation = 0
+        self._update_lock = threading.Lock()
+
+        self.watcher = None
+        if hot_reload_seconds is None:
+            hot_reload_seconds = float(os.environ.get(HOT_RELOAD_ENV_VAR, 0))
+        if hot_reload_seconds > 0:
+            from controller.hot_reload import KnowledgeBaseWatcher
+            self.watcher = KnowledgeBaseWatcher(self, interval_seconds=hot_reload_seconds)
+            self.watcher.start()
+
+    def _use_graph_snapshot(self, path):
+        from knowledge_base.graph_snapshot import SnapshotKnowledgeBase
+        kb_api = SnapshotKnowledgeBase(self.eval_engine.kb_api, path)
+        # Mapped now rather than on the first utterance.
+        if kb_api.snapshot is None:
+            print("WARN: The graph snapshot '{}' is missing or older than the DB; related entities "
+                  "are looked up in the DB until it is exported again.".format(path), file=sys.stderr)
+        self.eval_engine.kb_api = kb_api
+
+    def _build_parser(self):
+        if self.parser_type == 'BagOfWords':
+            from nlp.bag_of_words_parser import BOWParser
+            return BOWParser(self.DB_path, self.eval_engine.keywords)
+        elif self.parser_type == 'TREE':
+            from nlp.tree_parser import TreeParser
+            return TreeParser(self.DB_path, self.eval_engine.keywords)
+
+    def reload(self):
+        """Rebuilds the parser from the current content of the KB,
+        e.g. after the DB was replaced. `apply_kb_changes` is cheaper
+        when songs or artists were only added or deleted.
+
+        The new parser is built and warmed up while the current one
+        keeps serving, then replaces it in a single assignment.
+        Utterances already being processed finish with the parser
+        they started with.
+
+        """
+        with self._update_lock:
+            changelog_seq = self.kb_api.get_entity_changelog_seq()
+            parser = self._build_parser()
+            parser.warm_up(previous=self.parser)
+            self.parser = parser
+            self._changelog_seq = changelog_seq
+            self._parser_generation += 1
+
+    def apply_kb_changes(self):
+        """Brings the parser up to date with the songs and artists
+        inserted in, or deleted from, the KB since it was built.
+
+        Only the names recorded in the KB's changelog since the
+        previous update are added to or removed from the parser's
+        entities, so the cost is proportional to the change rather
+        than to the catalogue. If the KB has no changelog, or some of
+        the changes were already pruned from it, the parser is rebuilt
+        (see `reload`).
+
+        Returns:
+            (bool): True if the parser was changed.
+        """
+        with self._update_lock:
+            changes = None
+            if self._changelog_seq is not None:
+                changes = self.kb_api.get_entity_changes(self._changelog_seq)
+            if changes is not None:
+                if not changes:
+                    return False
+                names = set(change.name for change in changes)
+                present = self.kb_api.filter_music_entities(names)
+                if present is not None:
+                    self.parser.update_entities(added=present, removed=names - present)
+                    self._changelog_seq = changes[-1].seq
+                    self._parser_generation += 1
+                    return True
+        self.reload()
+        return True
 
     def __call__(self, raw_input: str):
         """The system's entrypoint.
@@ -32,7 +162,169 @@ class SystemEntry:
             raw_input: User input.
 
         """
+        if self.timings:
+            with metrics.trace() as stages:
+                self._process(raw_input)
+            print("[timings] " + metrics.format_trace(stages), file=sys.stderr)
+        else:
+            self._process(raw_input)
+
+    def _process(self, raw_input: str):
+        # The parser may be replaced by `reload` meanwhile, so the
+        # utterance is processed with the one it started with. The
+        # generation is read first: it may then be older than the
+        # parser, but never newer.
+        generation = self._parser_generation
+        parser = self.parser
+        with metrics.timer("imr_utterance_seconds", parser=self.parser_type):
+            if self.cache is None:
+                self._evaluate(parser, raw_input)
+                return
+
+            # The response to an utterance only depends on its parse
+            # and the KB, so the player actions that it led to are
+            # cached, and replayed for the same utterance until the
+            # KB changes, or the parser is rebuilt.
+            key = parser.cache_key(raw_input)
+            version = (self.kb_api.get_write_version(), generation)
+            actions = self.cache.get(key, version)
+            if actions is None:
+                actions = self._evaluate_recorded(parser, raw_input)
+                self.cache.put(key, actions, version)
+            else:
+                player = self.eval_engine.player
+                for action, argument in actions:
+                    getattr(player, action)(list(argument) if isinstance(argument, list) else argument)
+
+    def _evaluate(self, parser, raw_input: str):
         if self.parser_type == 'BagOfWords':
-            self.eval_engine(*self.parser(raw_input))
+            self.eval_engine(*parser(raw_input))
         elif self.parser_type == 'TREE':
-            self.eval_engine(self.parser, raw_input)
+            self.eval_engine(parser, raw_input)
+
+    def _evaluate_recorded(self, parser, raw_input: str):
+        """Evaluates the input, and returns the (action, argument)
+        tuples that the player was asked to perform.
+
+        """
+        player = self.eval_engine.player
+        recorder = RecordingController(player)
+        self.eval_engine.player = recorder
+        try:
+            self._evaluate(parser, raw_input)
+        finally:
+            self.eval_engine.player = player
+        # Copied, in case the player modifies the lists it is given.
+        return [(action, list(argument) if isinstance(argument, list) else argument)
+                for action, argument in recorder.take_actions()]
+
+    def process_batch(self, utterances, workers=1, executor=None):
+        """Processes several utterances, e.g. to replay logs or
+        to measure the accuracy of the parser.
+
+        The utterances are first parsed together, sharing the work
+        of matching entities (see the parsers' `parse_many`). The
+        KB lookups that they need are then made with a few grouped
+        queries, and each utterance is acted upon in turn, through
+        the player controller.
+
+        Params:
+            utterances (list of strings): raw user inputs.
+            workers (int): if more than 1, the utterances are split
+                across this many processes, each with its own
+                SystemEntry. The player actions are then recorded in
+                the results, but not performed by this SystemEntry's
+                player controller.
+            executor (ProcessPoolExecutor): the worker processes, as
+                made by `worker_pool`, e.g. to reuse them across
+                batches. By default, they are started for this batch.
+
+        Returns:
+            (list of dicts): for each utterance, in order, a dict with keys:
+                utterance (string): the raw input.
+                parse: the parser's output (see `parse_many`), or None if parsing failed.
+                actions (list of tuples): the (action, argument) pairs that the player
+                    was asked to perform, e.g. [('play', ['U2'])].
+                error (string): what went wrong, or None.
+                timings (dict): parse_ms and evaluate_ms of the utterance. The grouped
+                    KB lookups, shared by the batch, are not included.
+        """
+        utterances = list(utterances)
+        if workers > 1 and len(utterances) > 1:
+            return self._process_batch_in_workers(utterances, workers, executor)
+
+        parser = self.parser
+        results = []
+        parses = []
+        with metrics.timer("imr_batch_seconds", parser=self.parser_type):
+            for utterance, (parse, parse_ms) in zip(utterances, self._timed(parser.parse_many(utterances))):
+                parses.append(parse)
+                results.append(dict(
+                    utterance=utterance,
+                    parse=None if isinstance(parse, Exception) else parse,
+                    actions=[],
+                    error=None,
+                    timings=dict(parse_ms=parse_ms),
+                ))
+
+            player = self.eval_engine.player
+            recorder = RecordingController(player)
+            self.eval_engine.player = recorder
+            try:
+                errors = self.eval_engine.evaluate_many(parses)
+                for result, (error, evaluate_ms) in zip(results, self._timed(errors)):
+                    result["timings"]["evaluate_ms"] = evaluate_ms
+                    result["actions"] = recorder.take_actions()
+                    if error is not None:
+                        result["error"] = type(error).__name__ + (": {}".format(error) if str(error) else "")
+            finally:
+                self.eval_engine.player = player
+        return results
+
+    @staticmethod
+    def _timed(iterator):
+        """Yields (item, ms taken to produce it) for each item of the iterator."""
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            yield item, (time.perf_counter() - start) * 1000.0
+
+    def worker_pool(self, workers):
+        """Starts worker processes for `process_batch`, each with
+        its own SystemEntry, built from the same DB and parser type.
+
+        Returns:
+            (ProcessPoolExecutor): to be shut down by the caller, e.g.
+                by using it as a context manager.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        return ProcessPoolExecutor(max_workers=workers,
+                                   initializer=_init_worker,
+                                   initargs=(self.DB_path, self.parser_type),
+                                   )
+
+    def _process_batch_in_workers(self, utterances, workers, executor=None):
+        chunk_size = -(-len(utterances) // (workers * _CHUNKS_PER_WORKER))
+        chunks = [utterances[i:i + chunk_size] for i in range(0, len(utterances), chunk_size)]
+        if executor is not None:
+            return [result for results in executor.map(_process_in_worker, chunks) for result in results]
+        with self.worker_pool(workers) as executor:
+            return [result for results in executor.map(_process_in_worker, chunks) for result in results]
+
+
+# The SystemEntry of a worker process of SystemEntry.process_batch.
+_worker_system_entry = None
+
+
+def _init_worker(db_path, parser_type):
+    global _worker_system_entry
+    from player_adaptor.null_adaptor import NullController
+    _worker_system_entry = SystemEntry(db_path, NullController(), parser_type=parser_type, timings=False)
+
+
+def _process_in_worker(utterances):
+    return _worker_system_entry.process_batch(utterances)
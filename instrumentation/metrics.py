@@ -0,0 +1,333 @@
+"""
+Lightweight, in-process metrics for the hot path.
+
+Timings are recorded into histograms and counts into counters, each
+identified by a metric name and a set of labels, e.g.:
+
+    imr_parser_stage_seconds{parser="tree",stage="lexing"}
+
+Instrumentation is disabled by default, in which case `timed` and
+`timer` only add a flag check to each call. Enable it by setting the
+IMR_METRICS environment variable to 1, or by calling `enable()`.
+
+Example:
+    from instrumentation import metrics
+
+    @metrics.timed("imr_kb_call_seconds", method="get_song_data")
+    def get_song_data(...): ...
+
+    with metrics.timer("imr_parser_stage_seconds", parser="bow", stage="stopwords"):
+        ...
+
+    print(metrics.render_text())
+
+`trace()` collects the timings recorded by the current thread within
+a block, e.g. to report the stages of a single utterance; it works
+whether or not metrics are enabled.
+
+`snapshot()` returns all metrics as a dict, and `render_text()` in the
+Prometheus text exposition format, so that a local collector can scrape
+them (see `start_http_server`, or write `render_text()` to a file for a
+textfile collector).
+"""
+import functools
+import os
+import threading
+import time
+
+ENABLED_ENV_VAR = "IMR_METRICS"
+
+# Upper bounds of the histogram buckets, in seconds: from 50us to 10s.
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get(ENABLED_ENV_VAR, "") not in ("", "0")
+# Number of traces in progress, in all threads. Timers are active while there are any.
+_num_traces = 0
+_local = threading.local()
+_lock = threading.Lock()
+# Key is (metric name, sorted tuple of label pairs).
+_histograms = dict()
+_counters = dict()
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, as Prometheus histograms do."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        """Returns (upper bound, number of observations <= upper bound) pairs, ending with +Inf."""
+        counts = []
+        total = 0
+        for upper_bound, n in zip(self.buckets, self.bucket_counts):
+            total += n
+            counts.append((upper_bound, total))
+        counts.append((float("inf"), self.count))
+        return counts
+
+
+def enabled():
+    return _enabled
+
+
+def active():
+    """Whether timings are being recorded, either because metrics are enabled or for a `trace`."""
+    return _enabled or _num_traces > 0
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """Discards all recorded metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    """Records a value (e.g. a duration in seconds) in the named histogram."""
+    stages = getattr(_local, "trace", None)
+    if stages is not None:
+        stages.append((name, labels, value))
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def increment(name, value=1, **labels):
+    """Adds value to the named counter."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Timer:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager recording the duration of its block in the named histogram."""
+    if not (_enabled or _num_traces):
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name, rows_counter=None, **labels):
+    """Decorator recording the duration of each call in the named histogram.
+
+    Params:
+        rows_counter (string): if given, the length of each returned list/tuple/dict
+            is added to the counter of that name (with the same labels).
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not (_enabled or _num_traces):
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+            if rows_counter is not None and isinstance(result, (list, tuple, dict)):
+                increment(rows_counter, len(result), **labels)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class trace:
+    """Context manager collecting the timings recorded by the current thread within its block.
+
+    Example:
+        with metrics.trace() as stages:
+            system_entry("play U2")
+        print(metrics.format_trace(stages))
+
+    Yields:
+        (list of tuples): (metric name, labels, value), in the order they were recorded.
+    """
+
+    def __enter__(self):
+        global _num_traces
+        self._outer = getattr(_local, "trace", None)
+        _local.trace = []
+        with _lock:
+            _num_traces += 1
+        return _local.trace
+
+    def __exit__(self, *exc_info):
+        global _num_traces
+        stages = _local.trace
+        _local.trace = self._outer
+        if self._outer is not None:
+            self._outer.extend(stages)
+        with _lock:
+            _num_traces -= 1
+        return False
+
+
+def format_trace(stages):
+    """Formats the timings collected by `trace` on one line, e.g.:
+
+        parser_stage[tree.lexing]=0.61ms kb_call[get_related_entities]=0.40ms utterance[TREE]=3.10ms
+    """
+    parts = []
+    for name, labels, value in stages:
+        short_name = name
+        if short_name.startswith("imr_"):
+            short_name = short_name[len("imr_"):]
+        if short_name.endswith("_seconds"):
+            short_name = short_name[:-len("_seconds")]
+        parts.append("{}[{}]={:.2f}ms".format(
+            short_name, ".".join(str(v) for v in labels.values()), value * 1000.0))
+    return " ".join(parts)
+
+
+def percentile(sorted_values, p):
+    """Returns the p-th percentile (0 <= p <= 100) of an already sorted list, by linear interpolation."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def snapshot():
+    """Returns a copy of all recorded metrics.
+
+    Returns:
+        (dict): with keys "histograms" and "counters"; each maps a metric name to a list of
+            dicts with its labels and values, e.g.
+            {"counters": {"imr_kb_rows_returned_total": [{"labels": {"method": "get_song_data"}, "value": 3}]},
+             "histograms": {"imr_kb_call_seconds": [{"labels": {...}, "count": 1, "sum": 0.002,
+                                                     "buckets": [[0.00005, 0], ..., [inf, 1]]}]}}
+    """
+    result = dict(histograms=dict(), counters=dict())
+    with _lock:
+        for (name, labels), histogram in sorted(_histograms.items()):
+            result["histograms"].setdefault(name, []).append(dict(
+                labels=dict(labels),
+                count=histogram.count,
+                sum=histogram.sum,
+                buckets=[list(x) for x in histogram.cumulative_counts()],
+            ))
+        for (name, labels), value in sorted(_counters.items()):
+            result["counters"].setdefault(name, []).append(dict(labels=dict(labels), value=value))
+    return result
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels.items()) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in pairs) + "}"
+
+
+def _format_bound(upper_bound):
+    return "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+
+
+def render_text():
+    """Returns all recorded metrics in the Prometheus text exposition format."""
+    metrics = snapshot()
+    lines = []
+    for name, series in metrics["histograms"].items():
+        lines.append("# TYPE {} histogram".format(name))
+        for s in series:
+            for upper_bound, count in s["buckets"]:
+                lines.append("{}_bucket{} {}".format(
+                    name, _format_labels(s["labels"], [("le", _format_bound(upper_bound))]), count))
+            lines.append("{}_sum{} {!r}".format(name, _format_labels(s["labels"]), s["sum"]))
+            lines.append("{}_count{} {}".format(name, _format_labels(s["labels"]), s["count"]))
+    for name, series in metrics["counters"].items():
+        lines.append("# TYPE {} counter".format(name))
+        for s in series:
+            lines.append("{}{} {}".format(name, _format_labels(s["labels"]), s["value"]))
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port, address="127.0.0.1"):
+    """Serves `render_text()` over HTTP from a daemon thread, for a local collector to scrape.
+
+    Returns:
+        (HTTPServer): call its shutdown() method to stop serving.
+    """
+    # Imported here, as http.server is slow to import and rarely needed.
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_text().encode("UTF-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,202 @@
+"""
+Profiling hooks for the CLI and for any other process that embeds
+SystemEntry.
+
+A profile is started with `start()`, or from environment variables
+by `start_from_env()` (which SystemEntry calls), so that a production
+repro can be profiled without code edits:
+
+    IMR_PROFILE=cpu|mem     the kind of profile to record.
+    IMR_PROFILE_OUTPUT      where to write it (default: ./imr-<kind>-<pid>.<ext>).
+    IMR_PROFILE_FORMAT      for cpu profiles: "pstats" (cProfile, default) or
+                            "collapsed" (sampled stacks, one per line with their
+                            count, as read by flamegraph.pl and speedscope).
+
+The profile is written when the process exits. Memory profiles
+(tracemalloc) also print the top allocators to stderr whenever the
+process receives SIGUSR2:
+
+    kill -USR2 <pid>
+
+Example:
+    IMR_PROFILE=cpu IMR_PROFILE_FORMAT=collapsed python3 view/cli.py < utterances.txt
+    flamegraph.pl imr-cpu-1234.collapsed > flamegraph.svg
+"""
+import atexit
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_ENV_VAR = "IMR_PROFILE"
+OUTPUT_ENV_VAR = "IMR_PROFILE_OUTPUT"
+FORMAT_ENV_VAR = "IMR_PROFILE_FORMAT"
+
+PROFILE_KINDS = ["cpu", "mem"]
+CPU_FORMATS = ["pstats", "collapsed"]
+
+# Profilers that were started in this process, by kind.
+_profilers = dict()
+_profilers_lock = threading.Lock()
+
+
+class CProfileProfiler:
+    """Deterministic CPU profile of the calling thread, written as a pstats file."""
+    extension = "pstats"
+
+    def __init__(self, output_path):
+        import cProfile
+        self.output_path = output_path
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._profile.dump_stats(self.output_path)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every `interval_s` seconds, from a background
+    thread, and writes them in the collapsed stack format:
+
+        main (cli.py:71);run_app (cli.py:38);__call__ (system_entry.py:30) 42
+    """
+    extension = "collapsed"
+
+    def __init__(self, output_path, interval_s=0.005):
+        self.output_path = output_path
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[_collapse(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        with open(self.output_path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("{} {}\n".format(stack, count))
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class MemoryProfiler:
+    """Traces allocations with tracemalloc, and reports the top allocators
+    (by source line) on exit, and to stderr on SIGUSR2.
+    """
+    extension = "txt"
+
+    def __init__(self, output_path, top=25, num_frames=1):
+        self.output_path = output_path
+        self.top = top
+        self.num_frames = num_frames
+
+    def start(self):
+        import tracemalloc
+        tracemalloc.start(self.num_frames)
+        if hasattr(signal, "SIGUSR2"):
+            try:
+                signal.signal(signal.SIGUSR2, lambda signum, frame: sys.stderr.write(self.report()))
+            except ValueError:
+                # Signal handlers can only be installed from the main thread.
+                pass
+
+    def report(self):
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines = ["Top {} allocators at {} (current: {:.1f} MB, peak: {:.1f} MB):".format(
+            self.top, time.strftime("%Y-%m-%d %H:%M:%S"), current / 1e6, peak / 1e6)]
+        for i, stat in enumerate(snapshot.statistics("lineno")[:self.top], 1):
+            frame = stat.traceback[0]
+            lines.append("#{}: {}:{}: {:.1f} KB in {} blocks".format(
+                i, frame.filename, frame.lineno, stat.size / 1024.0, stat.count))
+        return "\n".join(lines) + "\n"
+
+    def stop(self):
+        import tracemalloc
+        with open(self.output_path, "w") as f:
+            f.write(self.report())
+        tracemalloc.stop()
+
+
+def start(kind, output_path=None, cpu_format="pstats"):
+    """Starts a profile of the given kind, to be written at exit (or on `stop`).
+
+    Starting a kind of profile that is already running does nothing.
+
+    Params:
+        kind (string): "cpu" or "mem".
+        output_path (string): where to write the profile. Default: ./imr-<kind>-<pid>.<ext>
+        cpu_format (string): "pstats" or "collapsed"; see the module docstring.
+
+    Returns:
+        the profiler, or None if a profile of that kind was already running.
+    """
+    if kind not in PROFILE_KINDS:
+        raise ValueError("Unknown profile kind '{}', expected one of {}".format(kind, PROFILE_KINDS))
+    if kind == "cpu" and cpu_format not in CPU_FORMATS:
+        raise ValueError("Unknown CPU profile format '{}', expected one of {}".format(cpu_format, CPU_FORMATS))
+
+    with _profilers_lock:
+        if kind in _profilers:
+            return None
+
+        if kind == "mem":
+            profiler_class = MemoryProfiler
+        elif cpu_format == "collapsed":
+            profiler_class = SamplingProfiler
+        else:
+            profiler_class = CProfileProfiler
+        output_path = output_path or "./imr-{}-{}.{}".format(kind, os.getpid(), profiler_class.extension)
+
+        profiler = profiler_class(output_path)
+        _profilers[kind] = profiler
+    profiler.start()
+    atexit.register(stop, kind)
+    print("Recording {} profile to {}".format(kind, output_path), file=sys.stderr)
+    return profiler
+
+
+def stop(kind):
+    """Stops the profile of the given kind, if one is running, and writes it."""
+    with _profilers_lock:
+        profiler = _profilers.pop(kind, None)
+    if profiler is not None:
+        profiler.stop()
+
+
+def start_from_env():
+    """Starts the profile requested by the IMR_PROFILE* environment variables, if any."""
+    kind = os.environ.get(PROFILE_ENV_VAR)
+    if not kind:
+        return None
+    return start(kind,
+                 output_path=os.environ.get(OUTPUT_ENV_VAR),
+                 cpu_format=os.environ.get(FORMAT_ENV_VAR, "pstats"),
+                 )
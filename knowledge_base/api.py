@@ -1,16 +1,83 @@
+import functools
+import os
 import sqlite3
+import threading
+from collections import Counter, namedtuple
 from contextlib import closing
 
+from instrumentation import metrics
+from knowledge_base import slow_query_log as sql_log
+from knowledge_base import sqlite_config
+
+
+def _instrumented(method):
+    """Records the latency, and the number of rows returned, of each call to a KnowledgeBaseAPI method."""
+    return metrics.timed("imr_kb_call_seconds",
+                         rows_counter="imr_kb_rows_returned_total",
+                         method=method.__name__,
+                         )(method)
+
+
+# Number of calls to writing methods of KnowledgeBaseAPI objects of this process, by DB path.
+_write_counts = Counter()
+
+# An insertion or deletion of a song or artist name, as recorded in the entity_changelog table.
+# op is "insert" or "delete".
+EntityChange = namedtuple("EntityChange", ["seq", "op", "name"])
+
+# Callbacks notified of the entity changes made by this process, by DB path (see add_observer).
+_observers = dict()
+# Last changelog seq that the observers of each DB path were notified of.
+_observed_seqs = dict()
+_observers_lock = threading.Lock()
+
+
+def _writes(method):
+    """Marks a KnowledgeBaseAPI method as one that may write to the DB (see get_write_version)."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _write_counts[self._db_key] += 1
+            if _observers.get(self._db_key):
+                self._notify_observers()
+
+    return wrapper
+
+
+# Maximum number of names bound to a single query (SQLite allows 999 variables by default).
+_MAX_NAMES_PER_QUERY = 500
+
+
+def _chunks(names):
+    for i in range(0, len(names), _MAX_NAMES_PER_QUERY):
+        yield names[i:i + _MAX_NAMES_PER_QUERY]
+
 
 class KnowledgeBaseAPI:
     """
     This layer stores the interface to the knowledge-engine.
     It is primarily used by the query-engine and knowledge-generation
     components.
+
+    Params:
+        dbName (string): path to the DB file.
+        slow_query_log (SlowQueryLog): if given, every SQL statement is timed, and the slow
+            ones are logged to it (see knowledge_base/slow_query_log.py). Defaults to the
+            log configured by the IMR_SLOW_QUERY_MS environment variable, if it is set.
+        connection_config (ConnectionConfig): pragmas (e.g. WAL mode), read-only mode and busy
+            timeout of the connections to the DB (see knowledge_base/sqlite_config.py). Defaults
+            to the settings of the IMR_SQLITE_PRAGMAS, IMR_DB_READ_ONLY and IMR_DB_BUSY_TIMEOUT_MS
+            environment variables.
     """
 
-    def __init__(self, dbName):
+    def __init__(self, dbName, slow_query_log=None, connection_config=None):
         self.dbName = dbName
+        self._db_key = os.path.realpath(dbName)
+        self.slow_query_log = slow_query_log or sql_log.from_env()
+        self.connection_config = connection_config or sqlite_config.from_env()
         self.approved_relations = dict(
             similarity="similar to",
             genre="of genre",
@@ -21,11 +88,16 @@ class KnowledgeBaseAPI:
 
     @property
     def connection(self):
-        conn = sqlite3.connect(self.dbName)
+        if self.slow_query_log is None:
+            conn = self.connection_config.connect(self.dbName)
+        else:
+            conn = self.connection_config.connect(self.dbName, factory=sql_log.TimedConnection)
+            conn.slow_query_log = self.slow_query_log
         # enable foreign key constraints
         conn.execute("PRAGMA foreign_keys = 1")
         return conn
 
+    @_instrumented
     def get_related_entities(self, entity_name, rel_str="similar to"):
         """Finds all entities connected to the given entity in the semantic network.
 
@@ -67,6 +139,7 @@ class KnowledgeBaseAPI:
             print("ERROR: Could not find entities similar to entity with name '{}': {}".format(entity_name, str(e)))
             return []
 
+    @_instrumented
     def get_song_data(self, song_name):
         """Gets all songs that match given name, along with their artists.
 
@@ -112,6 +185,7 @@ class KnowledgeBaseAPI:
             print("ERROR: Could not retrieve data for song with name '{}': {}".format(song_name, str(e)))
             return []
 
+    @_instrumented
     def get_artist_data(self, artist_name):
         """Get artist info.
 
@@ -155,6 +229,7 @@ class KnowledgeBaseAPI:
             ))
         return results
 
+    @_instrumented
     def get_songs_by_artist(self, artist):
         """Retrieves list of songs for given artist.
 
@@ -196,6 +271,123 @@ class KnowledgeBaseAPI:
                 artist))
             return None
 
+    @_instrumented
+    def get_related_entities_many(self, entity_names, rel_str="similar to"):
+        """Same as get_related_entities, for several entities at once, with one query per chunk of names.
+
+        Params:
+            entity_names (list of strings): e.g. ["Justin Bieber", "U2"].
+            rel_str (string): e.g. "similar to", "of genre".
+
+        Returns:
+            (dict): key=entity name, val=list of names of related entities, as get_related_entities
+                would return them. Names with no related entities map to an empty list.
+        """
+        if rel_str not in self.approved_relations.values():
+            print("WARN: querying for invalid relations. Only allow: {}".format(self.approved_relations))
+
+        names = list(dict.fromkeys(entity_names))
+        # Key is an entity name, val maps ids of related nodes to their names.
+        related_by_name = {name: dict() for name in names}
+        try:
+            with closing(self.connection) as con:
+                for chunk in _chunks(names):
+                    rows = con.execute("""
+                        SELECT source_node.name, dest_node.id, dest_node.name
+                        FROM edges
+                            JOIN nodes AS source_node ON source == source_node.id
+                            JOIN nodes AS dest_node ON dest == dest_node.id
+                        WHERE source_node.name IN ({}) AND rel == (?);
+                    """.format(", ".join("?" * len(chunk))), chunk + [rel_str]).fetchall()
+                    for name, dest_id, dest_name in rows:
+                        related_by_name[name][dest_id] = dest_name
+
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not find entities related to {} entities: {}".format(len(names), str(e)))
+            return {name: [] for name in names}
+
+        # Like get_related_entities, each related node is listed once, in order of id.
+        return {name: [related[i] for i in sorted(related)] for name, related in related_by_name.items()}
+
+    @_instrumented
+    def get_song_data_many(self, song_names):
+        """Same as get_song_data, for several songs at once, with one query per chunk of names.
+
+        Returns:
+            (dict): key=song name, val=list of dicts, as get_song_data would return them.
+        """
+        names = list(dict.fromkeys(song_names))
+        songs_by_name = {name: [] for name in names}
+        try:
+            with closing(self.connection) as con:
+                for chunk in _chunks(names):
+                    rows = con.execute("""
+                        SELECT song.name, artist.name, song.duration_ms, song.popularity, song_id
+                        FROM (
+                            SELECT name, main_artist_id, duration_ms, popularity, id as song_id
+                            FROM songs JOIN nodes ON node_id == id
+                            WHERE name IN ({})
+                        ) AS song JOIN nodes AS artist ON main_artist_id == id
+                        ORDER BY song_id;
+                    """.format(", ".join("?" * len(chunk))), chunk).fetchall()
+                    for x in rows:
+                        songs_by_name[x[0]].append(dict(
+                            song_name=x[0],
+                            artist_name=x[1],
+                            duration_ms=x[2],
+                            popularity=x[3],
+                            id=x[4],
+                        ))
+
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not retrieve data for {} songs: {}".format(len(names), str(e)))
+            return {name: [] for name in names}
+
+        return songs_by_name
+
+    @_instrumented
+    def get_songs_by_artist_many(self, artists):
+        """Same as get_songs_by_artist, for several artists at once, with two queries per chunk of names.
+
+        Returns:
+            (dict): key=artist name, val=list of song names, as get_songs_by_artist would return
+                them. None if the artist is ambiguous or not found.
+        """
+        names = list(dict.fromkeys(artists))
+        songs_by_artist = {name: None for name in names}
+        try:
+            with closing(self.connection) as con:
+                for chunk in _chunks(names):
+                    node_ids_by_name = dict()
+                    for name, node_id in con.execute("""
+                        SELECT name, id
+                        FROM nodes
+                        WHERE name IN ({});
+                    """.format(", ".join("?" * len(chunk))), chunk):
+                        node_ids_by_name.setdefault(name, []).append(node_id)
+
+                    # As in get_songs_by_artist, ambiguous names have no songs.
+                    name_by_artist_id = {ids[0]: name for name, ids in node_ids_by_name.items() if len(ids) == 1}
+                    if not name_by_artist_id:
+                        continue
+                    for artist_id, name in name_by_artist_id.items():
+                        songs_by_artist[name] = []
+                    rows = con.execute("""
+                        SELECT main_artist_id, name
+                        FROM songs JOIN nodes ON songs.node_id = id
+                        WHERE main_artist_id IN ({})
+                        ORDER BY id;
+                    """.format(", ".join("?" * len(name_by_artist_id))), list(name_by_artist_id)).fetchall()
+                    for artist_id, song_name in rows:
+                        songs_by_artist[name_by_artist_id[artist_id]].append(song_name)
+
+        except sqlite3.OperationalError as e:
+            print("ERROR: failed to find songs for {} artists: {}".format(len(names), e))
+            return {name: None for name in names}
+
+        return songs_by_artist
+
+    @_instrumented
     def get_node_ids_by_entity_type(self, entity_name):
         """Retrieves and organizes IDs of all nodes that match given entity name.
 
@@ -223,11 +415,13 @@ class KnowledgeBaseAPI:
             print("ERROR: Could not retrieve ids for entity with name '{}': {}".format(entity_name, str(e)))
             return None
 
+    @_instrumented
     def get_all_music_entities(self):
         """Gets a list of all the names, genres,
         artists, ect. in the DB
 
-        :return: A list of all nouns in the database
+        :return: A list of all nouns in the database, without
+            duplicates, sorted by name
         """
         try:
             # Auto-close.
@@ -242,12 +436,220 @@ class KnowledgeBaseAPI:
                             UNION
                             SELECT name AS artist_name
                             FROM artists JOIN nodes ON node_id == id
+                            ORDER BY 1
                             """)
                         return [x[0] for x in cursor.fetchall()]
         except sqlite3.OperationalError as e:
             print("ERROR: Could not retrieve music entities: {}".format(e))
             return []
 
+    @_instrumented
+    def get_all_music_entity_ids(self):
+        """Gets the names of all the songs and artists in the DB, with the ID of their node.
+
+        Returns:
+            (list of tuples): (name, node ID), sorted by name, as get_all_music_entities. A name
+                shared by several nodes (e.g. a song named after its artist) is listed once,
+                with the lowest ID.
+        """
+        try:
+            with closing(self.connection) as con:
+                return con.execute("""
+                    SELECT name, MIN(id)
+                    FROM nodes
+                    WHERE id IN (SELECT node_id FROM songs) OR id IN (SELECT node_id FROM artists)
+                    GROUP BY name
+                    ORDER BY name;
+                """).fetchall()
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not retrieve music entities: {}".format(e))
+            return []
+
+    @_instrumented
+    def filter_music_entities(self, names):
+        """Finds which of the given names are the name of a song or an artist.
+
+        Returns:
+            (set of strings): the names that get_all_music_entities would return; None if
+                the DB could not be read.
+        """
+        names = list(dict.fromkeys(names))
+        found = set()
+        try:
+            with closing(self.connection) as con:
+                for chunk in _chunks(names):
+                    rows = con.execute("""
+                        SELECT name FROM nodes
+                        WHERE name IN ({})
+                            AND (id IN (SELECT node_id FROM songs) OR id IN (SELECT node_id FROM artists));
+                    """.format(", ".join("?" * len(chunk))), chunk).fetchall()
+                    found.update(x[0] for x in rows)
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not look up {} music entities: {}".format(len(names), str(e)))
+            return None
+        return found
+
+    def get_entity_changes(self, since_seq=0):
+        """Gets the insertions and deletions of songs and artists recorded after the given
+        position of the DB's changelog, by any process.
+
+        A name may be inserted again after it was deleted, and several songs or artists may
+        share a name, so the changes are best applied by checking which of their names are
+        still in the DB (see filter_music_entities).
+
+        Only the latest changes are kept (see scripts/entity_changelog.sql): positions are
+        consecutive, so a gap after since_seq means that some of the changes were pruned.
+
+        Returns:
+            (list of EntityChange): in order; or None if the DB has no changelog
+                (see scripts/migrate_db.py), or no longer has all the changes made after since_seq.
+        """
+        try:
+            with closing(self.connection) as con:
+                rows = con.execute("SELECT seq, op, name FROM entity_changelog WHERE seq > (?) ORDER BY seq;",
+                                   (since_seq,)).fetchall()
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not read the entity changelog: {}".format(e))
+            return None
+        if rows and rows[0][0] > since_seq + 1:
+            print("WARN: The entity changelog was pruned after position {}.".format(since_seq))
+            return None
+        return [EntityChange(*row) for row in rows]
+
+    def get_entity_changelog_seq(self):
+        """Returns the position of the latest change in the DB's changelog (0 if there is none),
+        or None if the DB has no changelog.
+        """
+        try:
+            with closing(self.connection) as con:
+                return con.execute("SELECT COALESCE(MAX(seq), 0) FROM entity_changelog;").fetchone()[0]
+        except sqlite3.OperationalError:
+            return None
+
+    def add_observer(self, callback):
+        """Calls the callback after every write of this process to the DB, by any KnowledgeBaseAPI
+        object, that inserted or deleted songs or artists.
+
+        Params:
+            callback (function): called with the list of EntityChange made since its previous call,
+                or with None if they were pruned from the changelog in the meantime.
+        """
+        with _observers_lock:
+            if not _observers.get(self._db_key):
+                _observed_seqs[self._db_key] = self.get_entity_changelog_seq()
+            _observers.setdefault(self._db_key, []).append(callback)
+
+    def remove_observer(self, callback):
+        """Stops calling a callback given to add_observer."""
+        with _observers_lock:
+            callbacks = _observers.get(self._db_key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def _notify_observers(self):
+        with _observers_lock:
+            since_seq = _observed_seqs.get(self._db_key)
+            if since_seq is None:
+                return
+            changes = self.get_entity_changes(since_seq)
+            if changes is None:
+                seq = self.get_entity_changelog_seq()
+                if seq is None or seq == since_seq:
+                    return
+                _observed_seqs[self._db_key] = seq
+            elif not changes:
+                return
+            else:
+                _observed_seqs[self._db_key] = changes[-1].seq
+            callbacks = list(_observers.get(self._db_key, []))
+        for callback in callbacks:
+            callback(changes)
+
+    def get_data_version(self):
+        """Returns a fingerprint of the DB's content, which changes whenever the DB is modified.
+
+        It combines the file's inode and SQLite's file change counter (incremented by every
+        committed write, see https://www.sqlite.org/fileformat.html#file_change_counter) with
+        the number of nodes and their highest ID, so that it is cheap to compute even for a
+        large catalogue. A DB that is recreated at the same path gets a different version.
+        In WAL mode, where commits go to the write-ahead log rather than to the DB file, the
+        state of the log is part of the version too (see _read_wal_state).
+
+        Returns:
+            (string): e.g. "8429013:31:1200:1342", or None if the DB could not be read.
+        """
+        try:
+            inode = os.stat(self.dbName).st_ino
+            with open(self.dbName, "rb") as f:
+                header = f.read(100)
+            if len(header) < 100 or not header.startswith(b"SQLite format 3\x00"):
+                print("ERROR: '{}' is not a SQLite database.".format(self.dbName))
+                return None
+            change_counter = int.from_bytes(header[24:28], "big")
+
+            with closing(self.connection) as con:
+                num_nodes, max_node_id = con.execute("SELECT COUNT(*), MAX(id) FROM nodes;").fetchone()
+        except (OSError, sqlite3.Error) as e:
+            print("ERROR: Could not read the version of DB '{}': {}".format(self.dbName, e))
+            return None
+        version = "{}:{}:{}:{}".format(inode, change_counter, num_nodes, max_node_id or 0)
+        wal_state = self._read_wal_state(header)
+        if wal_state is not None:
+            version += ":{}-{}-{}".format(wal_state[0], wal_state[1], wal_state[2].hex())
+        return version
+
+    def get_write_version(self):
+        """Returns a token that changes whenever the DB is written to, by this process through
+        a KnowledgeBaseAPI method, or by any process (SQLite's file change counter, or the
+        state of the write-ahead log in WAL mode).
+
+        Unlike get_data_version, it runs no query, so that it can be checked on every request.
+
+        Returns:
+            (tuple): e.g. (3, b"\x00\x00\x00\x1f", None), or, in WAL mode,
+                (3, b"\x00\x00\x00\x1f", (1792145066123456789, 32992, b"..."))
+        """
+        try:
+            with open(self.dbName, "rb") as f:
+                header = f.read(28)
+        except OSError:
+            header = b""
+        return _write_counts[self._db_key], header[24:28] or None, self._read_wal_state(header)
+
+    def _read_wal_state(self, header):
+        """Returns the state of the DB's write-ahead log, or None if the DB is not in WAL mode.
+
+        In WAL mode, the file change counter is not updated by commits. Every commit grows
+        the log, and when the log is restarted from its beginning, it gets new salts (see
+        https://www.sqlite.org/fileformat.html#wal_file_format). Once the last connection
+        closes, the log is checkpointed into the DB file and deleted, which the file's
+        modification time reflects.
+
+        Params:
+            header (bytes): the beginning of the DB file (at least 19 bytes).
+
+        Returns:
+            (tuple): modification time of the DB file, and size and salts of the log
+                (0 and b"" if there is none).
+        """
+        # Bytes 18 and 19 of the header are 2 in WAL mode, 1 otherwise.
+        if len(header) < 19 or header[18] != 2:
+            return None
+        try:
+            mtime = os.stat(self.dbName).st_mtime_ns
+        except OSError:
+            return None
+        try:
+            with open(self.dbName + "-wal", "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(16)
+                return mtime, size, f.read(8)
+        except FileNotFoundError:
+            return mtime, 0, b""
+        except OSError:
+            return None
+
     def _get_matching_node_ids(self, node_name):
         """Retrieves IDs of all nodes matching the given name.
 
@@ -281,6 +683,8 @@ class KnowledgeBaseAPI:
         # e.g. [(10,), (11,)] => [10, 11]
         return [x[0] for x in res]
 
+    @_instrumented
+    @_writes
     def connect_entities(self, source_node_name, dest_node_name, rel_str, score):
         """Inserts edge row into edges table.
 
@@ -336,6 +740,79 @@ class KnowledgeBaseAPI:
 
         return True
 
+    @_instrumented
+    def get_spotify_ids(self, entity_type):
+        """Retrieves the Spotify IDs of all artists or songs in the knowledge base.
+
+        Params:
+            entity_type (string): "artist" or "song".
+
+        Returns:
+            (list of strings): Spotify IDs; entities without one are omitted. None if an error occurred.
+                e.g. ["1uNFoZAHBGtllmzznpCI3s", "2kQnsbKnIiMahOetwlfcaS"]
+        """
+        table = dict(artist="artists", song="songs").get(entity_type)
+        if table is None:
+            print("ERROR: Entities of type '{}' have no Spotify IDs.".format(entity_type))
+            return None
+
+        try:
+            with closing(self.connection) as con:
+                with con:
+                    with closing(con.cursor()) as cursor:
+                        cursor.execute("""
+                            SELECT DISTINCT spotify_id FROM {} WHERE spotify_id IS NOT NULL;
+                        """.format(table))
+                        return [x[0] for x in cursor.fetchall()]
+
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not retrieve Spotify IDs of {}: {}".format(table, str(e)))
+            return None
+
+    @_instrumented
+    @_writes
+    def update_spotify_followers(self, followers_by_spotify_id):
+        """Updates the number of Spotify followers of many artists in a single transaction.
+
+        Params:
+            followers_by_spotify_id (dict): key is an artist's Spotify ID, val is their number of followers.
+
+        Returns:
+            (int): number of artist rows updated; None if an error occurred.
+        """
+        return self._update_by_spotify_id("artists", "num_spotify_followers", followers_by_spotify_id)
+
+    @_instrumented
+    @_writes
+    def update_spotify_popularity(self, popularity_by_spotify_id):
+        """Updates the popularity of many songs in a single transaction.
+
+        Params:
+            popularity_by_spotify_id (dict): key is a song's Spotify ID, val is its popularity in [0,100] range.
+
+        Returns:
+            (int): number of song rows updated; None if an error occurred.
+        """
+        return self._update_by_spotify_id("songs", "popularity", popularity_by_spotify_id)
+
+    def _update_by_spotify_id(self, table, column, values_by_spotify_id):
+        try:
+            with closing(self.connection) as con:
+                with con:
+                    with closing(con.cursor()) as cursor:
+                        cursor.executemany("""
+                            UPDATE {} SET {} = (?) WHERE spotify_id == (?);
+                        """.format(table, column), [(v, k) for k, v in values_by_spotify_id.items()])
+                        return cursor.rowcount
+
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not update {}.{}: {}".format(table, column, str(e)))
+            return None
+
+        except sqlite3.IntegrityError as e:
+            print("ERROR: Could not update {}.{} due to schema constraints: {}".format(table, column, str(e)))
+            return None
+
     def _is_valid_entity_type(self, entity_type):
         """Indicates whether given entity type is valid.
 
@@ -345,7 +822,9 @@ class KnowledgeBaseAPI:
         """
         return entity_type in ["artist", "song", "genre"]
 
-    def add_artist(self, name, genres=[], num_spotify_followers=None):
+    @_instrumented
+    @_writes
+    def add_artist(self, name, genres=[], num_spotify_followers=None, spotify_id=None):
         """Inserts given values into two tables: artists and nodes.
 
         Ensures that:
@@ -356,6 +835,7 @@ class KnowledgeBaseAPI:
             name (string): e.g. "Justin Bieber"
             genres (list): e.g. ['indie r&b', 'malaysian indie']
             num_spotify_followers (int): number of Spotify followers.
+            spotify_id (string): e.g. "1uNFoZAHBGtllmzznpCI3s"
 
         Returns:
             (int): node_id corresponding to given artist if added or already existed; None otherwise.
@@ -375,8 +855,8 @@ class KnowledgeBaseAPI:
                 with con:
                     with closing(con.cursor()) as cursor:
                         cursor.execute("""
-                            INSERT INTO artists (node_id, num_spotify_followers) VALUES (?, ?);
-                        """, (node_id, num_spotify_followers))
+                            INSERT INTO artists (node_id, num_spotify_followers, spotify_id) VALUES (?, ?, ?);
+                        """, (node_id, num_spotify_followers, spotify_id))
 
         except sqlite3.OperationalError as e:
             print("ERROR: Could not add artist '{0}'".format(
@@ -399,7 +879,9 @@ class KnowledgeBaseAPI:
 
         return node_id
 
-    def add_song(self, name, artist, duration_ms=None, popularity=None):
+    @_instrumented
+    @_writes
+    def add_song(self, name, artist, duration_ms=None, popularity=None, spotify_id=None):
         """Inserts given values into two tables: songs and nodes.
 
         Ensures that:
@@ -412,6 +894,7 @@ class KnowledgeBaseAPI:
             artist (string): e.g. "Justin Bieber"
             duration_ms (int): length of song e.g. 22222.
             popularity (int): in [0,100] range.
+            spotify_id (string): e.g. "6ohzjop0VYBRZ12ichlwg5"
 
         Returns:
             (int): node_id corresponding to song if added or already existed; None otherwise.
@@ -439,9 +922,9 @@ class KnowledgeBaseAPI:
                 with con:
                     with closing(con.cursor()) as cursor:
                         cursor.execute("""
-                            INSERT INTO songs (main_artist_id, node_id, duration_ms, popularity)
-                            VALUES (?, ?, ?, ?);
-                        """, (artist_node_id, node_id, duration_ms, popularity))
+                            INSERT INTO songs (main_artist_id, node_id, duration_ms, popularity, spotify_id)
+                            VALUES (?, ?, ?, ?, ?);
+                        """, (artist_node_id, node_id, duration_ms, popularity, spotify_id))
 
         except sqlite3.OperationalError as e:
             print("ERROR: Could not add song '{}' with artist '{}'".format(
@@ -455,6 +938,8 @@ class KnowledgeBaseAPI:
 
         return node_id
 
+    @_instrumented
+    @_writes
     def add_genre(self, name):
         """Adds given value into two tables: genres and nodes.
 
@@ -536,3 +1021,142 @@ class KnowledgeBaseAPI:
         # NOTE: taking the max is a heuristic to disambiguate between multiplet matching ID:
         # Since we _just_ inserted the node and its id is autogenerated, it must have the largest id.
         return max(node_ids)
+
+    @_instrumented
+    @_writes
+    def bulk_load(self, records):
+        """Writes a batch of entity and edge records in a single transaction.
+
+        This is the write path of the ingestion pipeline: instead of opening a connection
+        (and committing) per row, a whole batch is applied at once. Records are applied
+        in order, so an edge may refer to an artist added earlier in the same batch.
+
+        Existing artists and genres, duplicate (song, artist) pairs and duplicate edges are
+        skipped, mirroring the add_* and connect_entities methods.
+
+        Params:
+            records (list of dicts): each dict has a "type" key, plus:
+                - "artist": name, genres, num_spotify_followers, spotify_id
+                - "song": name, artist, duration_ms, popularity, spotify_id
+                - "edge": source, dest, rel, score, symmetric (bool; also adds dest -> source)
+
+        Returns:
+            (int): number of records that were applied; None if the batch was rolled back.
+        """
+        num_applied = 0
+        try:
+            with closing(self.connection) as con:
+                with con:
+                    with closing(con.cursor()) as cursor:
+                        for record in records:
+                            if self._bulk_apply_record(cursor, record):
+                                num_applied += 1
+
+        except sqlite3.OperationalError as e:
+            print("ERROR: Could not load batch of {} records: {}".format(len(records), str(e)))
+            return None
+
+        except sqlite3.IntegrityError as e:
+            print("ERROR: Could not load batch of {} records due to schema constraints: {}"
+                .format(len(records), str(e)))
+            return None
+
+        return num_applied
+
+    def _bulk_apply_record(self, cursor, record):
+        """Applies one bulk_load record using the given cursor.
+
+        Returns:
+            (bool): True if the record was written, False if it was skipped.
+        """
+        record_type = record.get("type")
+        if record_type == "artist":
+            if self._bulk_get_node_ids(cursor, record["name"], "artist"):
+                return False
+
+            node_id = self._bulk_add_node(cursor, record["name"], "artist")
+            cursor.execute("""
+                INSERT INTO artists (node_id, num_spotify_followers, spotify_id) VALUES (?, ?, ?);
+            """, (node_id, record.get("num_spotify_followers"), record.get("spotify_id")))
+
+            genre_rel_str = self.approved_relations["genre"]
+            for genre in record.get("genres", []):
+                genre_ids = self._bulk_get_node_ids(cursor, genre, "genre")
+                if genre_ids:
+                    genre_id = genre_ids[0]
+                else:
+                    genre_id = self._bulk_add_node(cursor, genre, "genre")
+                    cursor.execute("""
+                        INSERT INTO genres (node_id) VALUES (?);
+                    """, (genre_id,))
+                self._bulk_add_edge(cursor, node_id, genre_id, genre_rel_str, 100)
+            return True
+
+        elif record_type == "song":
+            artist_ids = self._bulk_get_node_ids(cursor, record["artist"], "artist")
+            if len(artist_ids) != 1:
+                print("ERROR: Failed to add song '{}' because given artist '{}' corresponded to {} IDs (need 1)."
+                    .format(record["name"], record["artist"], len(artist_ids)))
+                return False
+
+            cursor.execute("""
+                SELECT 1
+                FROM songs JOIN nodes ON node_id == id
+                WHERE name == (?) AND main_artist_id == (?);
+            """, (record["name"], artist_ids[0]))
+            if cursor.fetchone() is not None:
+                return False
+
+            node_id = self._bulk_add_node(cursor, record["name"], "song")
+            cursor.execute("""
+                INSERT INTO songs (main_artist_id, node_id, duration_ms, popularity, spotify_id)
+                VALUES (?, ?, ?, ?, ?);
+            """, (artist_ids[0], node_id, record.get("duration_ms"), record.get("popularity"), record.get("spotify_id")))
+            return True
+
+        elif record_type == "edge":
+            source_ids = self._bulk_get_node_ids(cursor, record["source"])
+            dest_ids = self._bulk_get_node_ids(cursor, record["dest"])
+            if len(source_ids) != 1 or len(dest_ids) != 1:
+                print("ERROR: Could not find unique match for entities '{}', '{}'. Found {}, {} matches respectively"
+                    .format(record["source"], record["dest"], len(source_ids), len(dest_ids)))
+                return False
+
+            added = self._bulk_add_edge(cursor, source_ids[0], dest_ids[0], record["rel"], record["score"])
+            if record.get("symmetric"):
+                added |= self._bulk_add_edge(cursor, dest_ids[0], source_ids[0], record["rel"], record["score"])
+            return added
+
+        print("ERROR: Unknown record type '{}' in bulk load.".format(record_type))
+        return False
+
+    def _bulk_get_node_ids(self, cursor, entity_name, entity_type=None):
+        """Bulk-load counterpart of _get_matching_node_ids, optionally restricted to one entity type."""
+        if entity_type is None:
+            cursor.execute("""
+                SELECT id FROM nodes WHERE name == (?);
+            """, (entity_name,))
+        else:
+            cursor.execute("""
+                SELECT id FROM nodes WHERE name == (?) AND type == (?);
+            """, (entity_name, entity_type))
+        return [x[0] for x in cursor.fetchall()]
+
+    def _bulk_add_node(self, cursor, entity_name, entity_type):
+        """Bulk-load counterpart of _add_node; returns the new node's id."""
+        cursor.execute("""
+            INSERT INTO nodes (name, type, id) VALUES (?, ?, NULL);
+        """, (entity_name, entity_type))
+        return cursor.lastrowid
+
+    def _bulk_add_edge(self, cursor, source_node_id, dest_node_id, rel_str, score):
+        """Inserts an edge unless it already exists.
+
+        Returns:
+            (bool): True if a new edge was inserted.
+        """
+        cursor.execute("""
+            INSERT OR IGNORE INTO edges (source, dest, rel, score)
+            VALUES (?, ?, ?, ?);
+        """, (source_node_id, dest_node_id, rel_str, score))
+        return cursor.rowcount == 1
@@ -0,0 +1,309 @@
+"""
+An asyncio interface to KnowledgeBaseAPI.
+
+KnowledgeBaseAPI's methods block on sqlite3, so calling them from a
+coroutine stalls the event loop (e.g. of a server, or of a crawler)
+until the query returns. AsyncKnowledgeBaseAPI has the same public
+methods, as coroutines. They run on a bounded pool of threads, each
+with its own KnowledgeBaseAPI and a connection that stays open
+between calls.
+
+- Identical reads that are in flight at the same time (same method
+  and arguments) are coalesced into a single query, whose result each
+  caller gets a copy of.
+- Cancelling a call (e.g. through asyncio.wait_for) interrupts its
+  query, unless another caller is still waiting for the same read.
+  A call that has not started yet is dropped.
+- Each call can be given a timeout, after which it is cancelled and
+  raises asyncio.TimeoutError: pass `timeout_seconds` to any method,
+  or to AsyncKnowledgeBaseAPI for a default.
+
+Usage:
+    async with AsyncKnowledgeBaseAPI(db_path) as kb_api:
+        # Lookups for several entities run concurrently.
+        similar = await asyncio.gather(*[kb_api.get_related_entities(name) for name in names])
+        songs = await kb_api.get_songs_by_artist("Justin Bieber", timeout_seconds=0.5)
+"""
+import asyncio
+import copy
+import functools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from knowledge_base import api
+from knowledge_base import slow_query_log as sql_log
+
+# Methods of KnowledgeBaseAPI that only read the DB, and whose concurrent identical calls are coalesced.
+READ_METHODS = frozenset([
+    "get_related_entities",
+    "get_song_data",
+    "get_artist_data",
+    "get_songs_by_artist",
+    "get_related_entities_many",
+    "get_song_data_many",
+    "get_songs_by_artist_many",
+    "get_node_ids_by_entity_type",
+    "get_all_music_entities",
+    "filter_music_entities",
+    "get_entity_changes",
+    "get_entity_changelog_seq",
+    "get_data_version",
+    "get_spotify_ids",
+])
+# Methods of KnowledgeBaseAPI that may write to the DB.
+WRITE_METHODS = frozenset([
+    "connect_entities",
+    "update_spotify_followers",
+    "update_spotify_popularity",
+    "add_artist",
+    "add_song",
+    "add_genre",
+    "bulk_load",
+])
+DEFAULT_MAX_WORKERS = 4
+
+
+class _ReusedConnection(sqlite3.Connection):
+    """A connection that stays open when a KnowledgeBaseAPI method closes it,
+    for the next call of the same thread. `release` closes it.
+    """
+
+    def close(self):
+        # A method that failed mid-transaction leaves nothing behind for the next call.
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        super().close()
+
+
+class _ReusedTimedConnection(_ReusedConnection, sql_log.TimedConnection):
+    pass
+
+
+class _ThreadKnowledgeBaseAPI(api.KnowledgeBaseAPI):
+    """A KnowledgeBaseAPI used by a single thread of an AsyncKnowledgeBaseAPI, which
+    reuses its connection across calls.
+    """
+
+    def __init__(self, dbName, slow_query_log=None, connection_config=None):
+        super().__init__(dbName, slow_query_log=slow_query_log, connection_config=connection_config)
+        self._conn = None
+        self._conn_inode = None
+
+    @property
+    def connection(self):
+        # The connection would keep reading a DB file that was replaced at the same path.
+        inode = os.stat(self.dbName).st_ino
+        if self._conn is not None and inode != self._conn_inode:
+            self.release()
+        if self._conn is None:
+            # The connection is only used by this thread, but interrupted and released by others.
+            if self.slow_query_log is None:
+                conn = self.connection_config.connect(self.dbName, factory=_ReusedConnection,
+                                                      check_same_thread=False)
+            else:
+                conn = self.connection_config.connect(self.dbName, factory=_ReusedTimedConnection,
+                                                      check_same_thread=False)
+                conn.slow_query_log = self.slow_query_log
+            conn.execute("PRAGMA foreign_keys = 1")
+            self._conn = conn
+            self._conn_inode = inode
+        return self._conn
+
+    def interrupt(self):
+        """Aborts the query that the connection is running, from any thread."""
+        conn = self._conn
+        if conn is not None:
+            conn.interrupt()
+
+    def release(self):
+        if self._conn is not None:
+            self._conn.release()
+            self._conn = None
+
+
+class _Call:
+    """A call of a KnowledgeBaseAPI method, submitted to the thread pool, and the callers awaiting it."""
+
+    def __init__(self, future):
+        self.future = future
+        self.num_waiters = 0
+        self.shared = False
+        self.cancelled = False
+        # The KnowledgeBaseAPI running the call, while it runs.
+        self.kb_api = None
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.kb_api is not None:
+                self.kb_api.interrupt()
+        self.future.cancel()
+
+
+class AsyncKnowledgeBaseAPI:
+    """Runs KnowledgeBaseAPI methods on a thread pool, as coroutines.
+
+    Every public method of KnowledgeBaseAPI that queries the DB (see READ_METHODS and
+    WRITE_METHODS) is a coroutine method with the same parameters and result, and an
+    optional `timeout_seconds` (see `call`).
+
+    Params:
+        dbName (string): path to the DB file.
+        max_workers (int): number of threads, and so of queries that run at once.
+        timeout_seconds (float): timeout of each call, unless `call` is given another. None for none.
+        slow_query_log (SlowQueryLog): see KnowledgeBaseAPI.
+        connection_config (ConnectionConfig): see KnowledgeBaseAPI.
+    """
+
+    def __init__(self, dbName, max_workers=DEFAULT_MAX_WORKERS, timeout_seconds=None,
+                 slow_query_log=None, connection_config=None):
+        self.kb_api = api.KnowledgeBaseAPI(dbName, slow_query_log=slow_query_log,
+                                           connection_config=connection_config)
+        self.dbName = dbName
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb-async")
+        self._local = threading.local()
+        self._thread_apis = []
+        self._thread_apis_lock = threading.Lock()
+        # Key is (method name, args, kwargs, write count), val is the _Call of a read in flight.
+        self._reads_in_flight = dict()
+        self._closed = False
+
+    def __str__(self):
+        return "Async Knowledge Representation API object for {} DB.".format(self.dbName)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _thread_api(self):
+        kb_api = getattr(self._local, "kb_api", None)
+        if kb_api is None:
+            kb_api = _ThreadKnowledgeBaseAPI(self.dbName, slow_query_log=self.kb_api.slow_query_log,
+                                             connection_config=self.kb_api.connection_config)
+            self._local.kb_api = kb_api
+            with self._thread_apis_lock:
+                self._thread_apis.append(kb_api)
+        return kb_api
+
+    def _run(self, call, method_name, args, kwargs):
+        """Runs a call on a thread of the pool."""
+        kb_api = self._thread_api()
+        with call.lock:
+            if call.cancelled:
+                return None
+            call.kb_api = kb_api
+        try:
+            return getattr(kb_api, method_name)(*args, **kwargs)
+        finally:
+            with call.lock:
+                call.kb_api = None
+
+    def _read_key(self, method_name, args, kwargs):
+        # A read that started before a write of this process must not answer reads made after it.
+        key = (method_name, args, tuple(sorted(kwargs.items())), api._write_counts[self.kb_api._db_key])
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. a list of names.
+            return None
+        return key
+
+    async def call(self, method_name, *args, timeout_seconds=..., **kwargs):
+        """Calls a method of KnowledgeBaseAPI on the thread pool.
+
+        Params:
+            method_name (string): e.g. "get_related_entities".
+            args, kwargs: the method's arguments.
+            timeout_seconds (float): defaults to `self.timeout_seconds`. None for no timeout.
+
+        Returns:
+            the method's result.
+        Raises:
+            asyncio.TimeoutError: if the call did not complete within the timeout.
+            RuntimeError: if the AsyncKnowledgeBaseAPI was closed.
+        """
+        if method_name not in READ_METHODS and method_name not in WRITE_METHODS:
+            raise AttributeError("KnowledgeBaseAPI has no method '{}' to call asynchronously.".format(method_name))
+        if self._closed:
+            raise RuntimeError("{} is closed.".format(self))
+        if timeout_seconds is ...:
+            timeout_seconds = self.timeout_seconds
+
+        key = self._read_key(method_name, args, kwargs) if method_name in READ_METHODS else None
+        call = self._reads_in_flight.get(key) if key is not None else None
+        if call is None or call.cancelled:
+            loop = asyncio.get_event_loop()
+            call = _Call(None)
+            call.future = loop.run_in_executor(self._executor, self._run, call, method_name, args, kwargs)
+            if key is not None:
+                self._reads_in_flight[key] = call
+                call.future.add_done_callback(functools.partial(self._forget_read, key, call))
+        else:
+            call.shared = True
+
+        call.num_waiters += 1
+        try:
+            # The call itself is only cancelled once none of its callers await it anymore.
+            result = await asyncio.wait_for(asyncio.shield(call.future), timeout_seconds)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            call.num_waiters -= 1
+            if call.num_waiters == 0:
+                call.cancel()
+            raise
+        call.num_waiters -= 1
+        # Callers of a coalesced read each get their own result, which they may modify.
+        return copy.deepcopy(result) if call.shared else result
+
+    def _forget_read(self, key, call, future):
+        if self._reads_in_flight.get(key) is call:
+            del self._reads_in_flight[key]
+
+    def get_write_version(self):
+        """See KnowledgeBaseAPI.get_write_version. It runs no query, so it is not a coroutine."""
+        return self.kb_api.get_write_version()
+
+    def add_observer(self, callback):
+        """See KnowledgeBaseAPI.add_observer. Callbacks are called from the thread that made the change."""
+        self.kb_api.add_observer(callback)
+
+    def remove_observer(self, callback):
+        self.kb_api.remove_observer(callback)
+
+    async def aclose(self):
+        """Waits for the calls that are running, and closes the threads' connections."""
+        if self._closed:
+            return
+        self._closed = True
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.close)
+
+    def close(self):
+        """Like aclose, for code that is not in a coroutine."""
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._thread_apis_lock:
+            for kb_api in self._thread_apis:
+                kb_api.release()
+            self._thread_apis = []
+
+
+def _async_method(method_name):
+    method = getattr(api.KnowledgeBaseAPI, method_name)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.call(method_name, *args, **kwargs)
+
+    return wrapper
+
+
+for _method_name in READ_METHODS | WRITE_METHODS:
+    setattr(AsyncKnowledgeBaseAPI, _method_name, _async_method(_method_name))
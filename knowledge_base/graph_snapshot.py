@@ -0,0 +1,377 @@
+"""
+A read-only binary snapshot of the semantic network, that processes
+memory-map instead of querying the DB.
+
+Every process that serves utterances otherwise looks up the edges of
+the KB with SQL, and anything it derives from the whole graph costs a
+full scan of the `edges` table at startup, in every worker. The
+snapshot stores the graph once, in a file of aligned NumPy arrays:
+    - the ID of each node, in increasing order; a node's index in the
+      arrays is its rank by ID;
+    - the type of each node, as an index into the header's list of types;
+    - the names, as one UTF-8 buffer, and the offset of each name in it;
+    - the nodes' indexes in order of name, to find the nodes of a name
+      by binary search;
+    - for each relation, the edges in CSR form: the offsets of each
+      node's edges, the indexes of their destinations (in increasing
+      order, as the KB returns them) and their scores, as float32.
+
+The file (`<db path>.graph` by default) is written by export (see
+scripts/export_graph_snapshot.py) and tagged with the KB's data version.
+`load` maps it with np.memmap: nothing is read until it is used, and
+the pages are shared by all the processes that map it, e.g. the workers
+of a pre-forked server.
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from contextlib import closing
+
+import numpy as np
+
+# Bump when the layout of the snapshot changes, to invalidate existing files.
+FORMAT_VERSION = 1
+_MAGIC = b"IMRGRAPH"
+# Sections start on cache-line boundaries.
+_ALIGNMENT = 64
+# Number of edges read from the DB at a time.
+_FETCH_SIZE = 100000
+
+
+def snapshot_path(db_path):
+    return "{}.graph".format(db_path)
+
+
+def _fetch_nodes(con):
+    """Returns: (node IDs, type names, names) of all nodes, sorted by ID."""
+    node_ids, types, names = [], [], []
+    for node_id, node_type, name in con.execute("SELECT id, type, name FROM nodes ORDER BY id;"):
+        node_ids.append(node_id)
+        types.append(node_type)
+        names.append(name)
+    return np.array(node_ids, dtype=np.int64), types, names
+
+
+def _fetch_edges(con, node_ids):
+    """Returns: (relations, relation of each edge, source index, dest index, score), for the edges
+    between existing nodes.
+    """
+    relations = dict()
+    rels, sources, dests, scores = [], [], [], []
+    cursor = con.execute("SELECT source, dest, rel, score FROM edges;")
+    while True:
+        rows = cursor.fetchmany(_FETCH_SIZE)
+        if not rows:
+            break
+        source_col, dest_col, rel_col, score_col = zip(*rows)
+        rels.append(np.array([relations.setdefault(rel, len(relations)) for rel in rel_col], dtype=np.int32))
+        sources.append(np.array(source_col, dtype=np.int64))
+        dests.append(np.array(dest_col, dtype=np.int64))
+        scores.append(np.array(score_col, dtype=np.float32))
+    if not rels:
+        empty = np.zeros(0, dtype=np.int64)
+        return [], empty.astype(np.int32), empty, empty, empty.astype(np.float32)
+
+    rels, sources, dests, scores = [np.concatenate(a) for a in (rels, sources, dests, scores)]
+    source_indices = np.searchsorted(node_ids, sources)
+    dest_indices = np.searchsorted(node_ids, dests)
+    # Edges that point to deleted nodes are not returned by the KB either.
+    valid = ((source_indices < len(node_ids)) & (dest_indices < len(node_ids)))
+    valid[valid] &= ((node_ids[source_indices[valid]] == sources[valid])
+                     & (node_ids[dest_indices[valid]] == dests[valid]))
+    return (sorted(relations, key=relations.get), rels[valid], source_indices[valid],
+            dest_indices[valid], scores[valid])
+
+
+def build(db_path, kb_version=None):
+    """Lays out a snapshot of the DB's graph.
+
+    Params:
+        db_path (string): path to the DB file.
+        kb_version (string): data version of the KB (see KnowledgeBaseAPI.get_data_version).
+
+    Returns:
+        (bytes): the content of a snapshot file.
+    """
+    with closing(sqlite3.connect(db_path)) as con:
+        node_ids, types, names = _fetch_nodes(con)
+        relations, rels, sources, dests, scores = _fetch_edges(con, node_ids)
+    num_nodes = len(node_ids)
+
+    type_names = sorted(set(types))
+    type_codes = {name: i for i, name in enumerate(type_names)}
+    node_types = np.array([type_codes[t] for t in types], dtype=np.uint8 if len(type_names) < 256 else np.uint16)
+
+    encoded = [name.encode("UTF-8") for name in names]
+    name_offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+    names_buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    # Stable, so that the nodes of a name are in order of ID.
+    name_order = np.array(sorted(range(num_nodes), key=encoded.__getitem__), dtype=np.int32)
+
+    # The edges of each relation, then of each source, then of each dest.
+    order = np.lexsort((dests, sources, rels))
+    rels, sources, dests, scores = rels[order], sources[order], dests[order], scores[order]
+    edge_offsets = np.zeros((len(relations), num_nodes + 1), dtype=np.int64)
+    for r in range(len(relations)):
+        start, end = np.searchsorted(rels, [r, r + 1])
+        edge_offsets[r, 0] = start
+        np.cumsum(np.bincount(sources[start:end], minlength=num_nodes), out=edge_offsets[r, 1:])
+        edge_offsets[r, 1:] += start
+
+    sections = [
+        ("node_ids", node_ids),
+        ("node_types", node_types),
+        ("name_offsets", name_offsets),
+        ("names", names_buffer),
+        ("name_order", name_order),
+        ("edge_offsets", edge_offsets),
+        ("neighbours", dests.astype(np.int32)),
+        ("scores", scores.astype(np.float32)),
+    ]
+    header = dict(
+        format_version=FORMAT_VERSION,
+        kb_version=kb_version,
+        byteorder=sys.byteorder,
+        num_nodes=num_nodes,
+        num_edges=len(dests),
+        types=type_names,
+        relations=relations,
+        sections=dict(),
+    )
+
+    # The offsets of the sections are relative to the end of the (padded) header, as they
+    # depend on its size.
+    offset = 0
+    for name, data in sections:
+        header["sections"][name] = [offset, data.dtype.str, list(data.shape)]
+        offset += data.nbytes + (-data.nbytes % _ALIGNMENT)
+    header_bytes = json.dumps(header, sort_keys=True).encode("UTF-8")
+    prefix = _MAGIC + len(header_bytes).to_bytes(4, "little") + header_bytes
+    parts = [prefix, b"\x00" * (-len(prefix) % _ALIGNMENT)]
+    for _, data in sections:
+        parts.append(data.tobytes())
+        parts.append(b"\x00" * (-data.nbytes % _ALIGNMENT))
+    return b"".join(parts)
+
+
+def export(db_path, kb_api, path=None):
+    """Writes a snapshot of the DB's graph, atomically, so that processes that map the
+    previous one keep reading it.
+
+    Params:
+        db_path (string): path to the DB file.
+        kb_api (KnowledgeBaseAPI): the KB of the DB, whose data version tags the snapshot.
+        path (string): where to write it. Defaults to `<db path>.graph`.
+
+    Returns:
+        (string): the path of the snapshot, or None if it could not be written.
+    """
+    path = path or snapshot_path(db_path)
+    kb_version = kb_api.get_data_version()
+    if kb_version is None:
+        return None
+    try:
+        content = build(db_path, kb_version)
+    except sqlite3.Error as e:
+        print("ERROR: Could not read the graph of DB '{}': {}".format(db_path, e))
+        return None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print("ERROR: Could not write the graph snapshot to '{}': {}".format(path, e))
+        return None
+    return path
+
+
+def _int_view(array):
+    """Returns: a flat memoryview of an array of integers."""
+    return memoryview(array.reshape(-1)).cast("B").cast(array.dtype.char)
+
+
+class GraphSnapshot:
+    """A read-only view of a snapshot file, memory-mapped.
+
+    Params:
+        path (string): path to a file written by `export`.
+
+    Raises:
+        ValueError: if the file is not a snapshot of the current format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            prefix = f.read(len(_MAGIC) + 4)
+            if len(prefix) < len(_MAGIC) + 4 or not prefix.startswith(_MAGIC):
+                raise ValueError("'{}' is not a graph snapshot.".format(path))
+            header_size = int.from_bytes(prefix[len(_MAGIC):], "little")
+            header = json.loads(f.read(header_size).decode("UTF-8"))
+        if header["format_version"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError("'{}' is a snapshot of another format.".format(path))
+        self.kb_version = header["kb_version"]
+        self.num_nodes = header["num_nodes"]
+        self.num_edges = header["num_edges"]
+        self.types = header["types"]
+        self.relations = {rel: r for r, rel in enumerate(header["relations"])}
+
+        # One mapping of the whole file, of which each section is a view.
+        data_start = len(prefix) + header_size
+        data_start += -data_start % _ALIGNMENT
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        for name, (offset, dtype, shape) in header["sections"].items():
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            setattr(self, "_" + name, self._buffer[start:start + size].view(dtype).reshape(shape))
+        # Lookups index the sections element by element, which is much faster through
+        # memoryviews (whose items are Python ints) than through NumPy scalars.
+        self._names_view = memoryview(self._names)
+        self._name_offsets_view = _int_view(self._name_offsets)
+        self._name_order_view = _int_view(self._name_order)
+        self._edge_offsets_view = _int_view(self._edge_offsets)
+        self._neighbours_view = _int_view(self._neighbours)
+
+    def name(self, i):
+        offsets = self._name_offsets_view
+        return self._names_view[offsets[i]:offsets[i + 1]].tobytes().decode("UTF-8")
+
+    def node_id(self, i):
+        return int(self._node_ids[i])
+
+    def node_type(self, i):
+        return self.types[self._node_types[i]]
+
+    def node_indices(self, name):
+        """Returns: (list of ints) the indexes of the nodes with the given name, in order of ID."""
+        encoded = name.encode("UTF-8")
+        order, names, offsets = self._name_order_view, self._names_view, self._name_offsets_view
+        low, high = 0, len(order)
+        while low < high:
+            mid = (low + high) // 2
+            i = order[mid]
+            if names[offsets[i]:offsets[i + 1]].tobytes() < encoded:
+                low = mid + 1
+            else:
+                high = mid
+        indices = []
+        while low < len(order):
+            i = order[low]
+            if names[offsets[i]:offsets[i + 1]] != encoded:
+                break
+            indices.append(i)
+            low += 1
+        return indices
+
+    def _edge_range(self, i, rel_str):
+        r = self.relations.get(rel_str)
+        if r is None:
+            return 0, 0
+        offsets = self._edge_offsets_view
+        row = r * (self.num_nodes + 1) + i
+        return offsets[row], offsets[row + 1]
+
+    def neighbours(self, i, rel_str):
+        """Returns: (tuple of arrays) the indexes of the nodes that node i is related to by
+        rel_str, in order of ID, and the scores of the edges.
+        """
+        start, end = self._edge_range(i, rel_str)
+        return self._neighbours[start:end], self._scores[start:end]
+
+    def get_related_entities(self, entity_name, rel_str="similar to"):
+        """Same as KnowledgeBaseAPI.get_related_entities.
+
+        Returns:
+            (list of strings): names of the entities related to all the nodes with the given
+                name, each node listed once, in order of ID.
+        """
+        neighbours = self._neighbours_view
+        sources = self.node_indices(entity_name)
+        if len(sources) == 1:
+            start, end = self._edge_range(sources[0], rel_str)
+            dests = neighbours[start:end].tolist()
+        else:
+            dests = set()
+            for i in sources:
+                start, end = self._edge_range(i, rel_str)
+                dests.update(neighbours[start:end].tolist())
+            dests = sorted(dests)
+        return [self.name(i) for i in dests]
+
+    def get_related_entities_many(self, entity_names, rel_str="similar to"):
+        """Same as KnowledgeBaseAPI.get_related_entities_many."""
+        return {name: self.get_related_entities(name, rel_str) for name in dict.fromkeys(entity_names)}
+
+
+def load(db_path, kb_api, path=None):
+    """Returns the snapshot of the DB's graph, if it is up to date with the KB; else None.
+
+    Params:
+        db_path (string): path to the DB file.
+        kb_api (KnowledgeBaseAPI): the KB of the DB.
+        path (string): where the snapshot is. Defaults to `<db path>.graph`.
+    """
+    path = path or snapshot_path(db_path)
+    try:
+        snapshot = GraphSnapshot(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if snapshot.kb_version is None or snapshot.kb_version != kb_api.get_data_version():
+        return None
+    return snapshot
+
+
+class SnapshotKnowledgeBase:
+    """A view of a KnowledgeBaseAPI that answers related-entity lookups from a graph
+    snapshot, for as long as the DB is not written to.
+
+    After a write, lookups go to the DB, until the snapshot is exported again. All other
+    methods are passed on to the KnowledgeBaseAPI.
+
+    Params:
+        kb_api (KnowledgeBaseAPI): the KB of the DB.
+        path (string): where the snapshot is. Defaults to `<db path>.graph`.
+    """
+
+    def __init__(self, kb_api, path=None):
+        self.kb_api = kb_api
+        self.snapshot_path = path or snapshot_path(kb_api.dbName)
+        # Versions of the KB and of the snapshot file when the snapshot was loaded.
+        self._version = None
+        self._snapshot = None
+
+    def __getattr__(self, name):
+        return getattr(self.kb_api, name)
+
+    @property
+    def snapshot(self):
+        """Returns: the GraphSnapshot that is up to date with the KB, or None."""
+        try:
+            # Exports replace the file, rather than rewrite it.
+            stat = os.stat(self.snapshot_path)
+            file_version = (stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            file_version = None
+        version = (self.kb_api.get_write_version(), file_version)
+        if version != self._version:
+            self._snapshot = load(self.kb_api.dbName, self.kb_api, self.snapshot_path)
+            self._version = version
+        return self._snapshot
+
+    def get_related_entities(self, entity_name, rel_str="similar to"):
+        snapshot = self.snapshot
+        # The KB warns about relations that are not approved.
+        if snapshot is None or rel_str not in self.kb_api.approved_relations.values():
+            return self.kb_api.get_related_entities(entity_name, rel_str)
+        return snapshot.get_related_entities(entity_name, rel_str)
+
+    def get_related_entities_many(self, entity_names, rel_str="similar to"):
+        snapshot = self.snapshot
+        if snapshot is None or rel_str not in self.kb_api.approved_relations.values():
+            return self.kb_api.get_related_entities_many(entity_names, rel_str)
+        return snapshot.get_related_entities_many(entity_names, rel_str)
@@ -0,0 +1,58 @@
+class PrefetchedKnowledgeBase:
+    """A view of a KnowledgeBaseAPI that answers lookups from results
+    fetched ahead of time, with a few grouped queries.
+
+    Used to evaluate a batch of utterances: the entities that the batch
+    looks up are first fetched together (see the prefetch_* methods),
+    then each utterance is evaluated as usual against this view. Lookups
+    that were not prefetched, and all other methods, are passed on to
+    the KnowledgeBaseAPI.
+
+    Params:
+        kb_api (KnowledgeBaseAPI): the KB to fetch from.
+    """
+
+    def __init__(self, kb_api):
+        self.kb_api = kb_api
+        # Key is (entity name, rel_str), val is the list of related entities.
+        self._related_entities = dict()
+        # Key is a song name, val is its list of song data dicts.
+        self._song_data = dict()
+        # Key is an artist name, val is its list of songs, or None.
+        self._songs_by_artist = dict()
+
+    def __getattr__(self, name):
+        return getattr(self.kb_api, name)
+
+    def prefetch_related_entities(self, entity_names, rel_str="similar to"):
+        names = [name for name in entity_names if (name, rel_str) not in self._related_entities]
+        if names:
+            for name, related in self.kb_api.get_related_entities_many(names, rel_str).items():
+                self._related_entities[(name, rel_str)] = related
+
+    def prefetch_song_data(self, song_names):
+        names = [name for name in song_names if name not in self._song_data]
+        if names:
+            self._song_data.update(self.kb_api.get_song_data_many(names))
+
+    def prefetch_songs_by_artist(self, artists):
+        names = [name for name in artists if name not in self._songs_by_artist]
+        if names:
+            self._songs_by_artist.update(self.kb_api.get_songs_by_artist_many(names))
+
+    def get_related_entities(self, entity_name, rel_str="similar to"):
+        related = self._related_entities.get((entity_name, rel_str))
+        if related is None:
+            return self.kb_api.get_related_entities(entity_name, rel_str)
+        return list(related)
+
+    def get_song_data(self, song_name):
+        if song_name not in self._song_data:
+            return self.kb_api.get_song_data(song_name)
+        return [dict(song) for song in self._song_data[song_name]]
+
+    def get_songs_by_artist(self, artist):
+        if artist not in self._songs_by_artist:
+            return self.kb_api.get_songs_by_artist(artist)
+        songs = self._songs_by_artist[artist]
+        return None if songs is None else list(songs)
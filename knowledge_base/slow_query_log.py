@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+THRESHOLD_ENV_VAR = "IMR_SLOW_QUERY_MS"
+PATH_ENV_VAR = "IMR_SLOW_QUERY_LOG"
+
+# e.g. "SCAN nodes", "SCAN TABLE edges AS e", "SCAN nodes USING COVERING INDEX nodes_name_idx":
+# a scan visits every row of the table (or of the index), unlike a "SEARCH".
+_FULL_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+_NOT_TABLES = {"SUBQUERY", "CONSTANT"}
+
+
+class SlowQueryLog:
+    """Records SQL statements that take longer than a threshold.
+
+    Each entry holds the statement, its parameters, its duration, the number of rows it
+    returned (or modified), and the output of EXPLAIN QUERY PLAN for it, along with the
+    tables it fully scans. Entries are kept in a ring buffer of the most recent ones, and
+    optionally appended to a file as JSON lines.
+
+    Pass an instance to KnowledgeBaseAPI to time every statement it runs, or set the
+    IMR_SLOW_QUERY_MS (threshold) and, optionally, IMR_SLOW_QUERY_LOG (file path) environment
+    variables to enable a log shared by all KnowledgeBaseAPI instances (see `from_env`).
+
+    Params:
+        threshold_ms (float): statements that take at least this long are logged. 0 logs everything.
+        capacity (int): maximum number of entries kept in memory; older entries are dropped.
+        path (string): if given, every entry is also appended to this file.
+    """
+
+    def __init__(self, threshold_ms=100.0, capacity=1000, path=None):
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "Slow query log (threshold: {} ms, {} entries).".format(self.threshold_ms, len(self._entries))
+
+    @property
+    def entries(self):
+        """Returns the logged entries, oldest first.
+
+        Returns:
+            (list of dicts): e.g. {
+                "timestamp": 1571234567.8,
+                "sql": "SELECT name FROM nodes WHERE name = (?);",
+                "params": ["U2"],
+                "duration_ms": 120.5,
+                "rows": 1,
+                "plan": ["SCAN nodes"],
+                "full_scans": ["nodes"],
+            }
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, con, sql, params, duration_s, num_rows):
+        """Logs the statement if it took longer than the threshold."""
+        duration_ms = duration_s * 1000.0
+        if duration_ms < self.threshold_ms:
+            return
+
+        plan = explain_query_plan(con, sql, params)
+        entry = dict(
+            timestamp=time.time(),
+            sql=" ".join(sql.split()),
+            params=list(params) if params is not None else [],
+            duration_ms=duration_ms,
+            rows=num_rows,
+            plan=plan,
+            full_scans=full_scans(plan),
+        )
+        with self._lock:
+            self._entries.append(entry)
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(entry, default=repr) + "\n")
+
+
+def explain_query_plan(con, sql, params=None):
+    """Returns the detail column of EXPLAIN QUERY PLAN for the statement, one string per step.
+
+    Returns an empty list for statements that cannot be explained (e.g. PRAGMAs).
+    """
+    try:
+        rows = sqlite3.Connection.execute(con, "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    except sqlite3.Error:
+        return []
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """Returns the names of the tables that the query plan scans in full."""
+    tables = []
+    for detail in plan:
+        match = _FULL_SCAN_RE.match(detail.strip())
+        if match and match.group(1) not in _NOT_TABLES:
+            tables.append(match.group(1))
+    return tables
+
+
+_env_log = None
+_env_log_lock = threading.Lock()
+
+
+def from_env():
+    """Returns the log configured by the IMR_SLOW_QUERY_MS and IMR_SLOW_QUERY_LOG environment
+    variables, shared by the whole process, or None if IMR_SLOW_QUERY_MS is not set.
+    """
+    global _env_log
+    threshold_ms = os.environ.get(THRESHOLD_ENV_VAR)
+    if not threshold_ms:
+        return None
+    with _env_log_lock:
+        if _env_log is None:
+            _env_log = SlowQueryLog(float(threshold_ms), path=os.environ.get(PATH_ENV_VAR))
+        return _env_log
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor that reports the duration of each statement to the connection's slow query log.
+
+    The rows of a query are fetched as part of its execution, so that the recorded duration
+    covers the whole query, and not only the time to find its first row.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rows = None
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        super().execute(sql, params)
+        if self.description is not None:
+            self._rows = deque(super().fetchall())
+            num_rows = len(self._rows)
+        else:
+            self._rows = None
+            num_rows = self.rowcount
+        self.connection.slow_query_log.record(self.connection, sql, params, time.perf_counter() - start, num_rows)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self._rows = None
+        self.connection.slow_query_log.record(
+            self.connection, sql, seq_of_params[0] if seq_of_params else (),
+            time.perf_counter() - start, self.rowcount)
+        return self
+
+    def fetchone(self):
+        if self._rows is None:
+            return super().fetchone()
+        return self._rows.popleft() if self._rows else None
+
+    def fetchmany(self, size=None):
+        if self._rows is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        size = self.arraysize if size is None else size
+        return [self._rows.popleft() for _ in range(min(size, len(self._rows)))]
+
+    def fetchall(self):
+        if self._rows is None:
+            return super().fetchall()
+        rows = list(self._rows)
+        self._rows.clear()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose statements are timed by TimedCursor.
+
+    Set its `slow_query_log` attribute after connecting:
+        con = sqlite3.connect(path, factory=TimedConnection)
+        con.slow_query_log = SlowQueryLog()
+    """
+    slow_query_log = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
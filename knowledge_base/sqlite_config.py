@@ -0,0 +1,146 @@
+"""
+How KnowledgeBaseAPI connects to SQLite.
+
+By default, SQLite keeps a rollback journal, and a write locks the
+whole DB: while an ingestion or a `connect_entities` commits, the
+queries that serve users wait. In WAL mode (see https://www.sqlite.org/wal.html),
+readers keep reading the last committed state while a writer appends
+to the write-ahead log, so that only writers wait for each other.
+
+The settings are given to KnowledgeBaseAPI, or, for every
+KnowledgeBaseAPI of the process, through environment variables:
+    IMR_SQLITE_PRAGMAS: pragmas applied to every connection, e.g.
+        "journal_mode=WAL;mmap_size=268435456;cache_size=-65536;synchronous=NORMAL".
+        journal_mode persists in the DB file, so it is only set on the
+        first connection of the process to each DB.
+    IMR_DB_READ_ONLY: "1" to open the DB read-only, e.g. in processes
+        that only serve queries. Writes then fail (and are reported as
+        errors) instead of locking the DB.
+    IMR_DB_BUSY_TIMEOUT_MS: how long a statement waits for a lock held
+        by another connection before failing with "database is locked"
+        (default 5000).
+
+Example:
+    IMR_SQLITE_PRAGMAS="journal_mode=WAL;synchronous=NORMAL" python3 scripts/create_new_db.py ...
+    IMR_DB_READ_ONLY=1 python3 view/cli.py ...
+"""
+import os
+import re
+import sqlite3
+import sys
+import threading
+import urllib.parse
+
+PRAGMAS_ENV_VAR = "IMR_SQLITE_PRAGMAS"
+READ_ONLY_ENV_VAR = "IMR_DB_READ_ONLY"
+BUSY_TIMEOUT_ENV_VAR = "IMR_DB_BUSY_TIMEOUT_MS"
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+# Pragmas that can be configured. Values are interpolated in the
+# PRAGMA statements, so they are restricted to numbers and keywords.
+SUPPORTED_PRAGMAS = frozenset([
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "temp_store",
+    "wal_autocheckpoint",
+    "journal_size_limit",
+])
+_VALUE_RE = re.compile(r"^-?\w+$")
+
+# Pragmas that persist in the DB file, rather than apply to a connection.
+_PERSISTENT_PRAGMAS = frozenset(["journal_mode"])
+# (real path, inode) of the DBs that the persistent pragmas were set on by this process.
+_configured_dbs = set()
+_configured_dbs_lock = threading.Lock()
+
+
+def parse_pragmas(text):
+    """Parses pragmas given as "name=value;name=value".
+
+    Returns:
+        (dict): key=pragma name, val=value (string).
+    Raises:
+        ValueError: if a pragma is malformed or not supported.
+    """
+    pragmas = dict()
+    for item in text.replace(",", ";").split(";"):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError("Expected 'name=value', got '{}'".format(item.strip()))
+        pragmas[name.strip().lower()] = value.strip()
+    _validate(pragmas)
+    return pragmas
+
+
+def _validate(pragmas):
+    for name, value in pragmas.items():
+        if name not in SUPPORTED_PRAGMAS:
+            raise ValueError("Unsupported pragma '{}'. Supported: {}".format(name, sorted(SUPPORTED_PRAGMAS)))
+        if not _VALUE_RE.match(str(value)):
+            raise ValueError("Invalid value '{}' for pragma '{}'".format(value, name))
+
+
+class ConnectionConfig:
+    """Settings of the connections that KnowledgeBaseAPI opens.
+
+    Params:
+        pragmas (dict): key=pragma name (see SUPPORTED_PRAGMAS), val=its value,
+            e.g. dict(journal_mode="WAL", mmap_size=268435456).
+        read_only (bool): open the DB read-only.
+        busy_timeout_ms (int): how long a statement waits for another connection's lock.
+    """
+
+    def __init__(self, pragmas=None, read_only=False, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS):
+        self.pragmas = dict(pragmas or {})
+        _validate(self.pragmas)
+        self.read_only = read_only
+        self.busy_timeout_ms = busy_timeout_ms
+
+    def __repr__(self):
+        return "ConnectionConfig(pragmas={}, read_only={}, busy_timeout_ms={})".format(
+            self.pragmas, self.read_only, self.busy_timeout_ms)
+
+    def connect(self, db_path, factory=sqlite3.Connection, check_same_thread=True):
+        """Opens a connection to the DB, with the configured settings."""
+        timeout = self.busy_timeout_ms / 1000.0
+        if self.read_only:
+            uri = "file:{}?mode=ro".format(urllib.parse.quote(os.path.abspath(db_path)))
+            conn = sqlite3.connect(uri, uri=True, timeout=timeout, factory=factory,
+                                   check_same_thread=check_same_thread)
+        else:
+            conn = sqlite3.connect(db_path, timeout=timeout, factory=factory, check_same_thread=check_same_thread)
+
+        for name, value in self.pragmas.items():
+            if name not in _PERSISTENT_PRAGMAS:
+                conn.execute("PRAGMA {} = {}".format(name, value))
+        if not self.read_only and _PERSISTENT_PRAGMAS.intersection(self.pragmas):
+            self._set_persistent_pragmas(conn, db_path)
+        return conn
+
+    def _set_persistent_pragmas(self, conn, db_path):
+        db_key = os.path.realpath(db_path), os.stat(db_path).st_ino
+        with _configured_dbs_lock:
+            if db_key in _configured_dbs:
+                return
+            _configured_dbs.add(db_key)
+        for name in _PERSISTENT_PRAGMAS.intersection(self.pragmas):
+            value = self.pragmas[name]
+            result = conn.execute("PRAGMA {} = {}".format(name, value)).fetchone()
+            if result is not None and str(result[0]).lower() != str(value).lower():
+                print("WARN: Could not set {} to {} on DB '{}': it is {}.".format(name, value, db_path, result[0]),
+                      file=sys.stderr)
+
+
+def from_env():
+    """Returns the settings configured by the IMR_SQLITE_PRAGMAS, IMR_DB_READ_ONLY and
+    IMR_DB_BUSY_TIMEOUT_MS environment variables (the defaults if they are not set).
+    """
+    return ConnectionConfig(
+        pragmas=parse_pragmas(os.environ.get(PRAGMAS_ENV_VAR, "")),
+        read_only=os.environ.get(READ_ONLY_ENV_VAR, "") not in ("", "0"),
+        busy_timeout_ms=float(os.environ.get(BUSY_TIMEOUT_ENV_VAR, DEFAULT_BUSY_TIMEOUT_MS)),
+    )
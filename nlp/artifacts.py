@@ -0,0 +1,95 @@
+"""
+Parser artifacts cached on disk, next to the DB.
+
+Building a parser means loading every entity name of the catalogue,
+indexing them, and compiling keyword patterns and grammars from them.
+The entity names are stored in a table of their own, shared by the
+parsers (see nlp/entity_table.py); the rest is stored here.
+The result is written to `<db path>.<parser>.artifacts`, tagged with
+the KB's data version (see KnowledgeBaseAPI.get_data_version) and a
+hash of the parser's configuration (e.g. its keywords). Later processes
+load the file instead of rebuilding, as long as neither has changed.
+
+To build the artifacts ahead of time (e.g. before starting workers),
+see scripts/compile_parser_artifacts.py.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+
+# Bump when the content of the artifacts changes, to invalidate existing files.
+FORMAT_VERSION = 6
+
+
+def artifacts_path(db_path, parser_name):
+    return "{}.{}.artifacts".format(db_path, parser_name)
+
+
+def config_hash(config):
+    """Hashes a JSON-serializable parser configuration (e.g. its keywords)."""
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("UTF-8")).hexdigest()
+
+
+def _header(kb_api, config):
+    return dict(format_version=FORMAT_VERSION,
+                kb_version=kb_api.get_data_version(),
+                config_hash=config_hash(config),
+                )
+
+
+def read(path, header):
+    """Returns the artifacts stored at path if they were built with the given header, else None."""
+    try:
+        with open(path, "rb") as f:
+            if pickle.load(f) != header:
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def write(path, header, artifacts):
+    """Writes the artifacts atomically, so that concurrent readers never see a partial file.
+
+    Returns:
+        (bool): True on success.
+    """
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(artifacts, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print("WARN: Could not write parser artifacts to '{}': {}".format(path, e), file=sys.stderr)
+        return False
+
+
+def load_or_compile(db_path, kb_api, parser_name, config, compile_func, force=False):
+    """Loads a parser's artifacts from disk, or compiles and stores them if they are missing or stale.
+
+    Params:
+        parser_name (string): names the artifacts file.
+        config: JSON-serializable parser configuration that the artifacts depend on, besides the KB.
+        compile_func (function): builds the artifacts (any picklable object).
+        force (bool): compile even if up-to-date artifacts exist.
+
+    Returns:
+        the artifacts.
+    """
+    path = artifacts_path(db_path, parser_name)
+    header = _header(kb_api, config)
+
+    if header["kb_version"] is not None and not force:
+        artifacts = read(path, header)
+        if artifacts is not None:
+            return artifacts
+
+    artifacts = compile_func()
+    if header["kb_version"] is not None:
+        write(path, header, artifacts)
+    return artifacts
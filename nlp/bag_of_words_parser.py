@@ -1,9 +1,13 @@
 import re
 
-import nltk
-from nltk.corpus import stopwords
-
+from instrumentation import metrics
 from knowledge_base.api import KnowledgeBaseAPI
+from nlp import artifacts, entity_table
+from nlp.entity_index import EntityIndex
+from nlp.stopwords import ENGLISH_STOPWORDS
+
+_PUNCTUATION_RE = re.compile(r"[,.;@#?!&$']+\ *", flags=re.VERBOSE)
+_SINGLE_WORD_RE = re.compile(r"^\w+$")
 
 
 class BOWParser:
@@ -16,27 +20,44 @@ class BOWParser:
     """
     extra_stopwords = {'s', 'hey', 'want', 'you'}
 
-    def __init__(self, db_path, keywords):
-        # Download the stopwords if necessary.
-        try:
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            nltk.download('stopwords')
-
+    def __init__(self, db_path, keywords, recompile_artifacts=False):
         self.commands = keywords
         self.kb_api = KnowledgeBaseAPI(db_path)
-        self.db_nouns = self.kb_api.get_all_music_entities()
+
+        # The entities are mapped from a table shared with the other
+        # parsers of the DB (see nlp/entity_table.py), and the
+        # stopwords and regexes are loaded from disk, when they are
+        # up to date with the DB (see nlp/artifacts.py).
+        self.entity_index = EntityIndex(table=entity_table.load_or_build(db_path, self.kb_api,
+                                                                         force=recompile_artifacts))
+        compiled = artifacts.load_or_compile(db_path,
+                                             self.kb_api,
+                                             "bow",
+                                             self.artifacts_config,
+                                             self._compile_artifacts,
+                                             force=recompile_artifacts,
+                                             )
+        self.stop_words = compiled["stop_words"]
+        self.patterns = compiled["patterns"]
+        self.intent_regex = compiled["intent_regex"]
+
+    @property
+    def artifacts_config(self):
+        """Everything besides the DB that the compiled artifacts depend on."""
+        return dict(keywords=self.commands, extra_stopwords=sorted(BOWParser.extra_stopwords))
+
+    def _compile_artifacts(self):
+        return dict(
+            stop_words=frozenset(self._get_stop_words()),
+            patterns=self._gen_patterns(),
+            intent_regex=self._gen_intent_regex(),
+        )
 
     def _get_stop_words(self):
         # Remove all keywords from stopwords
-        stop_words = set(stopwords.words('english'))
-        stop_words |= BOWParser.extra_stopwords
-        for _, words in self.commands.items():
-            for word in words:
-                try:
-                    stop_words.remove(word)
-                except:
-                    pass
+        stop_words = set(ENGLISH_STOPWORDS) | BOWParser.extra_stopwords
+        for words in self.commands.values():
+            stop_words.difference_update(words)
         return stop_words
 
     def _gen_patterns(self):
@@ -46,34 +67,155 @@ class BOWParser:
             patterns[intent] = re.compile(r'\b'+r'\b|\b'.join(keys)+r'\b')
         return patterns
 
+    def _gen_intent_regex(self):
+        """Combines the keywords of all intents into a single
+        regex, with one named group per intent, so that all
+        intents are found in one pass over the message.
+
+        Matching the combined regex finds the same intents as
+        matching each intent's pattern in turn (see
+        `_match_intents_in_turn`) as long as every keyword is a
+        single word: matches of two keywords then either are
+        disjoint, or are the same word, in which case the
+        earlier intent wins in both cases.
+
+        Returns: (tuple) the regex, and the list of intents by
+            group name; or None if a keyword is not a single word.
+
+        """
+        groups = []
+        intent_by_group = {}
+        for i, (intent, keys) in enumerate(self.commands.items()):
+            if not keys:
+                continue
+            if not all(_SINGLE_WORD_RE.match(key) for key in keys):
+                return None
+            group = "intent{}".format(i)
+            groups.append(r'(?P<{}>\b(?:{})\b)'.format(group, '|'.join(keys)))
+            intent_by_group[group] = intent
+        if not groups:
+            return None
+        return re.compile('|'.join(groups)), intent_by_group
+
     def __call__(self, msg: str):
-        # Identify the first subject from the database that matches.
-        subjects = []
-        for noun in self.db_nouns:
-            if noun.lower() in msg.lower():
-                pattern = re.compile(noun, re.IGNORECASE)
-                msg = pattern.sub('', msg)
-                subjects.append(noun.strip())
+        # The whole pipeline is case-insensitive.
+        text = msg.lower()
+
+        # Identify the subjects from the database that match.
+        with metrics.timer("imr_parser_stage_seconds", parser="bow", stage="entity_match"):
+            subjects, text = self._match_entities(text)
 
         # Remove punctuation from the string
-        msg = re.sub(r"[,.;@#?!&$']+\ *",
-                     " ",
-                     msg,
-                     flags=re.VERBOSE)
+        text = _PUNCTUATION_RE.sub(" ", text)
 
         # Clean the stopwords from the input.
-        stop_words = self._get_stop_words()
-        clean_msg = ' '.join([word for word in msg.lower().split(' ')
-                              if word not in stop_words])
+        with metrics.timer("imr_parser_stage_seconds", parser="bow", stage="stopwords"):
+            text = ' '.join([word for word in text.split(' ') if word not in self.stop_words])
 
         # Parse the keywords from the filtered input.
-        patterns = self._gen_patterns()
-        intents = []
-        for intent, pattern in patterns.items():
-            sub_msg = re.sub(pattern, '', clean_msg)
-            if sub_msg != clean_msg:
-                intents.append(intent)
-                clean_msg = sub_msg
+        with metrics.timer("imr_parser_stage_seconds", parser="bow", stage="intent_match"):
+            if self.intent_regex is None:
+                intents, text = self._match_intents_in_turn(text)
+            else:
+                intents, text = self._match_intents(text)
 
-        remaining_text = clean_msg.strip()
+        remaining_text = text.strip()
         return subjects, intents, remaining_text
+
+    def warm_up(self, previous=None):
+        """Prepares the parser to serve requests. Everything is
+        compiled at construction, so there is nothing left to do.
+
+        """
+        pass
+
+    @property
+    def db_nouns(self):
+        return self.entity_index.entities
+
+    def update_entities(self, added=(), removed=()):
+        """Adds entities to, and removes entities from, the ones that
+        the parser recognizes, e.g. as songs or artists are added to
+        the KB (see KnowledgeBaseAPI.get_entity_changes).
+
+        """
+        for entity in removed:
+            self.entity_index.remove(entity)
+        for entity in added:
+            self.entity_index.add(entity)
+
+    @staticmethod
+    def cache_key(msg: str):
+        """Normalizes a message for caching: messages with the same
+        key have the same parse. As the pipeline is case-insensitive,
+        this is the lowercase message.
+
+        """
+        return msg.lower()
+
+    def parse_many(self, msgs):
+        """Parses several messages, e.g. a batch of logged
+        utterances.
+
+        The pipeline only depends on the lowercase message, so
+        repeated messages (up to case) are parsed once.
+
+        Yields: (tuple) the parse of each message, in order, as
+            returned by `__call__`.
+
+        """
+        parses = {}
+        for msg in msgs:
+            key = self.cache_key(msg)
+            if key not in parses:
+                parses[key] = self(msg)
+            subjects, intents, remaining_text = parses[key]
+            yield list(subjects), list(intents), remaining_text
+
+    def _match_entities(self, text):
+        """Finds the entities of the DB that occur in the
+        (lowercase) text, in catalogue order, removing each
+        from the text before looking for the next one.
+
+        Returns: (tuple) the names of the entities, and the
+            text without them.
+
+        """
+        subjects = []
+        noun = self.entity_index.first_match_lowercase(text)
+        while noun is not None:
+            text = text.replace(noun.lower(), '')
+            subjects.append(noun.strip())
+            noun = self.entity_index.first_match_lowercase(text, after=noun)
+        return subjects, text
+
+    def _match_intents(self, text):
+        """Finds the intents whose keywords occur in the text,
+        with a single pass of the combined intent regex.
+
+        Returns: (tuple) the intents, in order of precedence,
+            and the text without their keywords.
+
+        """
+        regex, intent_by_group = self.intent_regex
+        found = set(match.lastgroup for match in regex.finditer(text))
+        if not found:
+            return [], text
+        intents = [intent for group, intent in intent_by_group.items() if group in found]
+        return intents, regex.sub('', text)
+
+    def _match_intents_in_turn(self, text):
+        """Finds the intents whose keywords occur in the text,
+        matching each intent's pattern in turn.
+
+        Returns: (tuple) the intents, in order of precedence,
+            and the text without their keywords.
+
+        """
+        intents = []
+        for intent, pattern in self.patterns.items():
+            sub_text = pattern.sub('', text)
+            if sub_text != text:
+                intents.append(intent)
+                text = sub_text
+        return intents, text
@@ -0,0 +1,244 @@
+from bisect import bisect_right, insort
+from collections import Counter
+from heapq import merge
+
+# Number of leading characters by which names are grouped.
+_PREFIX_LENGTH = 3
+
+
+class EntityIndex:
+    """Finds which entities of the catalogue occur in a message.
+
+    The parsers look for the first entity, in catalogue order (i.e. sorted
+    by name), whose name occurs (case-insensitively) anywhere in the message,
+    other than within the longer name of another entity.
+    Rather than testing every entity of the catalogue against the message,
+    this index hashes the lowercase names, and looks up the substrings of the
+    message that could be one: at each position of the message, only the
+    lengths of the names that start with the next few characters are tried.
+    The cost of a lookup thus depends on the length of the message, but not
+    on the size of the catalogue.
+
+    Entities can be added and removed at a cost that does not depend on the
+    size of the catalogue either, e.g. as the KB changes (see
+    KnowledgeBaseAPI.get_entity_changes).
+
+    The catalogue can be given as an EntityTable (see nlp/entity_table.py),
+    which holds the names, keys and lengths compactly, in a buffer that is
+    shared rather than copied. The index then only keeps, as Python objects,
+    the entities added since, and the numbers of the ones removed.
+
+    Params:
+        entities (iterable of strings): the catalogue, or the entities added to the table's.
+        table (EntityTable): the catalogue.
+    """
+
+    def __init__(self, entities=(), table=None):
+        self.table = table
+        # Numbers of the entities of the table that were removed.
+        self._removed = set()
+        # The entities that are not in the table, indexed as follows.
+        self._names = set()
+        # Key is a lowercase name, val is the first entity with that name.
+        self._first_name = dict()
+        # Lowercase names shared by several entities, with all of them, sorted.
+        self._all_names = dict()
+        # Key is the prefix of some names, val counts these names by length.
+        # Names shorter than _PREFIX_LENGTH are their own prefix.
+        self._length_counts = dict()
+        # Key is the prefix of some names, val is the sorted lengths of these names.
+        self._lengths_by_prefix = dict()
+        # Number of prefixes of each length.
+        self._prefix_counts = Counter()
+        self._prefix_lengths = []
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self):
+        num_table_entities = len(self.table) - len(self._removed) if self.table is not None else 0
+        return num_table_entities + len(self._names)
+
+    def __contains__(self, entity):
+        return entity in self._names or self._find_in_table(entity) is not None
+
+    def _find_in_table(self, entity):
+        """Returns: the number of the entity in the table, unless it is not there or was removed."""
+        if self.table is None:
+            return None
+        number = self.table.find(entity)
+        return None if number in self._removed else number
+
+    @property
+    def entities(self):
+        """The catalogue, in order."""
+        if self.table is None:
+            return sorted(self._names)
+        table_entities = (self.table.name(number) for number in range(len(self.table))
+                          if number not in self._removed)
+        return list(merge(table_entities, sorted(self._names)))
+
+    def add(self, entity):
+        """Adds an entity to the catalogue.
+
+        Returns:
+            (bool): False if the entity was already in it.
+        """
+        if entity in self:
+            return False
+        if self.table is not None:
+            number = self.table.find(entity)
+            if number is not None:
+                self._removed.remove(number)
+                return True
+        self._names.add(entity)
+        key = entity.lower()
+        if not key:
+            return True
+        first = self._first_name.get(key)
+        if first is None:
+            self._first_name[key] = entity
+            self._add_length(key)
+        else:
+            names = self._all_names.get(key, [first])
+            insort(names, entity)
+            self._all_names[key] = names
+            self._first_name[key] = names[0]
+        return True
+
+    def remove(self, entity):
+        """Removes an entity from the catalogue.
+
+        Returns:
+            (bool): False if the entity was not in it.
+        """
+        if entity not in self._names:
+            number = self._find_in_table(entity)
+            if number is None:
+                return False
+            self._removed.add(number)
+            return True
+        self._names.remove(entity)
+        key = entity.lower()
+        if not key:
+            return True
+        names = self._all_names.get(key)
+        if names is None:
+            del self._first_name[key]
+            self._remove_length(key)
+        else:
+            names.remove(entity)
+            self._first_name[key] = names[0]
+            if len(names) == 1:
+                del self._all_names[key]
+        return True
+
+    def _add_length(self, key):
+        prefix = key[:_PREFIX_LENGTH]
+        counts = self._length_counts.get(prefix)
+        if counts is None:
+            counts = self._length_counts[prefix] = Counter()
+            self._prefix_counts[len(prefix)] += 1
+            self._prefix_lengths = sorted(self._prefix_counts)
+        counts[len(key)] += 1
+        if counts[len(key)] == 1:
+            self._lengths_by_prefix[prefix] = tuple(sorted(counts))
+
+    def _remove_length(self, key):
+        prefix = key[:_PREFIX_LENGTH]
+        counts = self._length_counts[prefix]
+        counts[len(key)] -= 1
+        if counts[len(key)]:
+            return
+        del counts[len(key)]
+        if counts:
+            self._lengths_by_prefix[prefix] = tuple(sorted(counts))
+            return
+        del self._length_counts[prefix]
+        del self._lengths_by_prefix[prefix]
+        self._prefix_counts[len(prefix)] -= 1
+        if not self._prefix_counts[len(prefix)]:
+            del self._prefix_counts[len(prefix)]
+        self._prefix_lengths = sorted(self._prefix_counts)
+
+    def first_match(self, text, after=None):
+        """Returns the first entity, after the given one, whose name occurs in the text, other
+        than as part of the longer name of another entity.
+
+        This is the entity that
+            next((e for e in entities if (after is None or e > after) and e.lower() in text.lower()), None)
+        would find, except that entities with an empty name never match, and that where
+        the names of several entities overlap, the longest match wins (e.g. "Justin Bieber"
+        rather than "Justin", or "Bieber", in "play justin bieber").
+
+        Returns:
+            (string): an entity, or None if no entity occurs in the text.
+        """
+        return self.first_match_lowercase(text.lower(), after)
+
+    def first_match_lowercase(self, text, after=None):
+        """Same as `first_match`, for a text that is already lowercase."""
+        # The occurrences of names, as (start, end, entity): a number in the table, or a name
+        # that was added; the entity is -1, or None, if it is not after the given one.
+        occurrences = []
+        if self.table is not None:
+            first = 0 if after is None else self._first_after(after)
+            occurrences.extend(self.table.matches_lowercase(text, first, self._removed))
+
+        if self._names:
+            text_length = len(text)
+            for start in range(text_length):
+                for prefix_length in self._prefix_lengths:
+                    lengths = self._lengths_by_prefix.get(text[start:start + prefix_length])
+                    if lengths is None:
+                        continue
+                    for length in lengths:
+                        if start + length > text_length:
+                            break
+                        key = text[start:start + length]
+                        name = self._first_name.get(key)
+                        if name is None:
+                            continue
+                        if after is not None and name <= after:
+                            name = self._next_name(key, after)
+                        occurrences.append((start, start + length, name))
+        if not occurrences:
+            return None
+
+        best_number = None
+        best_name = None
+        # Sorted by start, and from the longest occurrence to the shortest for a same start,
+        # an occurrence is within a longer one if one that starts before it ends after it, or
+        # if one that starts with it ends after it.
+        occurrences.sort(key=lambda occurrence: (occurrence[0], -occurrence[1]))
+        reach = -1
+        group_start = group_end = None
+        for start, end, entity in occurrences:
+            if start != group_start:
+                if group_end is not None:
+                    reach = max(reach, group_end)
+                group_start, group_end = start, end
+            if reach >= end or end < group_end:
+                continue
+            if isinstance(entity, int):
+                if entity >= 0 and (best_number is None or entity < best_number):
+                    best_number = entity
+            elif entity is not None and (best_name is None or entity < best_name):
+                best_name = entity
+
+        if best_number is None:
+            return best_name
+        table_name = self.table.name(best_number)
+        return table_name if best_name is None or table_name < best_name else best_name
+
+    def _first_after(self, entity):
+        """Returns: the number of the first entity of the table after the given one."""
+        # The entity is usually the previous match, i.e. in the table.
+        number = self.table.find(entity)
+        return number + 1 if number is not None else self.table.bisect_right(entity)
+
+    def _next_name(self, key, after):
+        names = self._all_names.get(key)
+        if names is None:
+            return None
+        pos = bisect_right(names, after)
+        return names[pos] if pos < len(names) else None
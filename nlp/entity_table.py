@@ -0,0 +1,417 @@
+"""
+A compact, read-only table of the catalogue's entities, shared through
+a memory-mapped file.
+
+Holding the entity names of a large catalogue as Python strings, in
+sets and dicts, takes hundreds of MB, in every parser of every
+process. The table instead stores them in a few flat arrays:
+    - the names, as one UTF-8 buffer, and the offset of each name in it;
+    - the lowercase names (the keys that messages are matched against),
+      the same way;
+    - the ID of each entity's node in the DB;
+    - an open-addressing hash table from the keys to the entities, and
+      one from the first bytes of the keys to the lengths of the keys
+      that start with them (see EntityIndex for how they are used).
+Keys are compared as UTF-8: a message is encoded once, and its
+substrings are looked up without being decoded.
+Entities are numbered by their rank in the catalogue, i.e. sorted by
+name, so that comparing two entities' numbers compares their names.
+
+The table is written to `<db path>.entities`, tagged with the KB's data
+version, and memory-mapped by the processes that use the DB: the pages
+are shared between the processes by the OS, and between the parsers of
+a process (see load_or_build). Entities added to or removed from the
+KB afterwards are tracked by EntityIndex, on top of the table.
+"""
+import json
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import weakref
+import zlib
+from array import array
+
+# Bump when the layout of the table changes, to invalidate existing files.
+FORMAT_VERSION = 1
+_MAGIC = b"IMRENTS\x00"
+_ALIGNMENT = 8
+# Number of leading bytes by which keys are grouped.
+PREFIX_LENGTH = 3
+_EMPTY = -1
+# Maximum number of prefixes, and of keys, whose lookup a table remembers. The
+# substrings of messages recur (e.g. "play", "the"), unlike the catalogue's keys.
+_MAX_MEMOIZED_PREFIXES = 1 << 16
+_MAX_MEMOIZED_KEYS = 1 << 16
+
+# Tables opened by this process, by (real path of the DB, KB data version).
+_tables = weakref.WeakValueDictionary()
+_tables_lock = threading.Lock()
+
+
+def table_path(db_path):
+    return "{}.entities".format(db_path)
+
+
+_hash = zlib.crc32
+
+
+def _offsets_typecode(size):
+    return "I" if size < 2 ** 32 else "Q"
+
+
+def _hash_table(keys):
+    """Returns: an array of slots, each the index of a key or _EMPTY, at most half full."""
+    capacity = 8
+    while capacity < 2 * len(keys):
+        capacity *= 2
+    mask = capacity - 1
+    slots = array("i", [_EMPTY]) * capacity
+    for i, key in enumerate(keys):
+        slot = _hash(key) & mask
+        while slots[slot] != _EMPTY:
+            slot = (slot + 1) & mask
+        slots[slot] = i
+    return slots
+
+
+def _concat(strings):
+    """Returns: the UTF-8 encoded strings, as one buffer, and the offset of each in it."""
+    encoded = [s.encode("UTF-8") for s in strings]
+    offsets = [0] * (len(encoded) + 1)
+    total = 0
+    for i, s in enumerate(encoded):
+        total += len(s)
+        offsets[i + 1] = total
+    return b"".join(encoded), array(_offsets_typecode(total), offsets)
+
+
+def build(entities, kb_version=None):
+    """Lays out a table of the given entities.
+
+    Params:
+        entities (list of tuples): (name, node ID), sorted by name and without duplicate
+            names, as returned by KnowledgeBaseAPI.get_all_music_entity_ids.
+        kb_version (string): data version of the KB the entities come from.
+
+    Returns:
+        (bytes): the content of a table file.
+    """
+    names = [name for name, _ in entities]
+    keys = [name.lower() for name in names]
+
+    # The first entity of each key, and the next entity of each entity with the same key.
+    first_entity = dict()
+    next_same_key = array("i", [_EMPTY]) * len(names)
+    last_entity = dict()
+    for i, key in enumerate(keys):
+        if not key:
+            continue
+        if key in last_entity:
+            next_same_key[last_entity[key]] = i
+        else:
+            first_entity[key] = i
+        last_entity[key] = i
+    unique_keys = list(first_entity)
+    encoded_keys = [key.encode("UTF-8") for key in unique_keys]
+    key_slots = _hash_table(encoded_keys)
+    key_slots = array("i", (first_entity[unique_keys[i]] if i != _EMPTY else _EMPTY for i in key_slots))
+
+    # Lengths of the keys, by prefix. Keys shorter than PREFIX_LENGTH are their own prefix.
+    lengths_by_prefix = dict()
+    for key in encoded_keys:
+        lengths_by_prefix.setdefault(key[:PREFIX_LENGTH], set()).add(len(key))
+    prefixes = sorted(lengths_by_prefix)
+    lengths = array("I")
+    length_offsets = array("I", [0])
+    for prefix in prefixes:
+        lengths.extend(sorted(lengths_by_prefix[prefix]))
+        length_offsets.append(len(lengths))
+
+    names_buffer, name_offsets = _concat(names)
+    keys_buffer, key_offsets = _concat(keys)
+    prefixes_buffer = b"".join(prefixes)
+    prefix_offsets = array("I", [0])
+    for prefix in prefixes:
+        prefix_offsets.append(prefix_offsets[-1] + len(prefix))
+    sections = [
+        ("names", names_buffer),
+        ("name_offsets", name_offsets),
+        ("keys", keys_buffer),
+        ("key_offsets", key_offsets),
+        ("node_ids", array("q", (node_id for _, node_id in entities))),
+        ("next_same_key", next_same_key),
+        ("key_slots", key_slots),
+        ("prefixes", prefixes_buffer),
+        ("prefix_offsets", prefix_offsets),
+        ("prefix_slots", _hash_table(prefixes)),
+        ("length_offsets", length_offsets),
+        ("lengths", lengths),
+    ]
+    header = dict(
+        format_version=FORMAT_VERSION,
+        kb_version=kb_version,
+        byteorder=sys.byteorder,
+        num_entities=len(names),
+        prefix_lengths=sorted(set(len(prefix) for prefix in prefixes)),
+        sections=dict(),
+    )
+
+    # The header is written first, but the offsets of the sections depend on its size:
+    # they are relative to the end of the (padded) header.
+    offset = 0
+    for name, data in sections:
+        typecode, itemsize = (data.typecode, data.itemsize) if isinstance(data, array) else ("B", 1)
+        size = len(data) * itemsize
+        header["sections"][name] = [offset, size, typecode, itemsize]
+        offset += size + (-size % _ALIGNMENT)
+    header_bytes = json.dumps(header, sort_keys=True).encode("UTF-8")
+    prefix = _MAGIC + len(header_bytes).to_bytes(4, "little") + header_bytes
+    parts = [prefix, b"\x00" * (-len(prefix) % _ALIGNMENT)]
+    for _, data in sections:
+        data = data.tobytes() if isinstance(data, array) else data
+        parts.append(data)
+        parts.append(b"\x00" * (-len(data) % _ALIGNMENT))
+    return b"".join(parts)
+
+
+class EntityTable:
+    """A read-only view of a table laid out by `build`.
+
+    Params:
+        buffer: the content of a table file (e.g. bytes, or an mmap).
+        path (string): the file the buffer maps, if any.
+    Raises:
+        ValueError: if the buffer is not a table of this format, on this platform.
+    """
+
+    def __init__(self, buffer, path=None):
+        if buffer[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Not an entity table.")
+        header_size = int.from_bytes(buffer[len(_MAGIC):len(_MAGIC) + 4], "little")
+        header_end = len(_MAGIC) + 4 + header_size
+        header = json.loads(bytes(buffer[len(_MAGIC) + 4:header_end]).decode("UTF-8"))
+        if header.get("format_version") != FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+            raise ValueError("Entity table of another format.")
+        self.header = header
+        self.path = path
+        self.kb_version = header["kb_version"]
+        self._buffer = buffer
+        self._base = header_end + (-header_end % _ALIGNMENT)
+        self._num_entities = header["num_entities"]
+
+        view = memoryview(buffer)
+        for name, (offset, size, typecode, itemsize) in header["sections"].items():
+            start = self._base + offset
+            if start + size > len(buffer) or array(typecode).itemsize != itemsize:
+                raise ValueError("Entity table of another format.")
+            if typecode == "B":
+                # Names are sliced from the buffer itself, which makes bytes objects directly.
+                setattr(self, "_{}_start".format(name), start)
+            else:
+                setattr(self, "_" + name, view[start:start + size].cast(typecode))
+        self._key_mask = len(self._key_slots) - 1
+        self._prefix_mask = len(self._prefix_slots) - 1
+        self.prefix_lengths = tuple(header["prefix_lengths"])
+        # Key is a prefix that was looked up, val is its key lengths.
+        self._key_lengths_memo = dict()
+        # Key is a key that was looked up, val is its first entity (or -1).
+        self._first_with_key_memo = dict()
+
+    def __len__(self):
+        return self._num_entities
+
+    def name(self, entity):
+        """Returns: the name of the given entity (its number in the table)."""
+        start = self._names_start
+        return self._buffer[start + self._name_offsets[entity]:start + self._name_offsets[entity + 1]].decode("UTF-8")
+
+    def node_id(self, entity):
+        """Returns: the ID of the node of the given entity in the DB."""
+        return self._node_ids[entity]
+
+    def names(self):
+        """Yields the names of the entities, in order."""
+        for entity in range(self._num_entities):
+            yield self.name(entity)
+
+    def find(self, name):
+        """Returns: the number of the entity with the given name, or None if there is none."""
+        if not name:
+            # The empty name has no key, and sorts first.
+            return 0 if self._num_entities and self.name(0) == name else None
+        entity = self.first_with_key(name.lower().encode("UTF-8"))
+        while entity != _EMPTY:
+            if self.name(entity) == name:
+                return entity
+            entity = self._next_same_key[entity]
+        return None
+
+    def bisect_right(self, name):
+        """Returns: the number of entities whose name is at most the given one."""
+        low, high = 0, self._num_entities
+        while low < high:
+            middle = (low + high) // 2
+            if name < self.name(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def first_with_key(self, key):
+        """Returns: the first entity whose UTF-8 encoded lowercase name is the given key, or -1."""
+        slots = self._key_slots
+        offsets = self._key_offsets
+        buffer = self._buffer
+        start = self._keys_start
+        slot = _hash(key) & self._key_mask
+        entity = slots[slot]
+        while entity != _EMPTY:
+            if buffer[start + offsets[entity]:start + offsets[entity + 1]] == key:
+                return entity
+            slot = (slot + 1) & self._key_mask
+            entity = slots[slot]
+        return _EMPTY
+
+    def next_with_same_key(self, entity):
+        """Returns: the next entity whose lowercase name is the same as the given one's, or -1."""
+        return self._next_same_key[entity]
+
+    def key_lengths(self, prefix):
+        """Returns: the lengths (in bytes) of the UTF-8 encoded keys that start with the given
+        prefix, in increasing order; None if there are none.
+        """
+        memo = self._key_lengths_memo
+        if prefix in memo:
+            return memo[prefix]
+        slots = self._prefix_slots
+        offsets = self._prefix_offsets
+        buffer = self._buffer
+        start = self._prefixes_start
+        slot = _hash(prefix) & self._prefix_mask
+        i = slots[slot]
+        lengths = None
+        while i != _EMPTY:
+            if buffer[start + offsets[i]:start + offsets[i + 1]] == prefix:
+                lengths = tuple(self._lengths[self._length_offsets[i]:self._length_offsets[i + 1]])
+                break
+            slot = (slot + 1) & self._prefix_mask
+            i = slots[slot]
+        if len(memo) >= _MAX_MEMOIZED_PREFIXES:
+            memo.clear()
+        memo[prefix] = lengths
+        return lengths
+
+    def matches_lowercase(self, text, first=0, excluded=()):
+        """Yields the occurrences in the (lowercase) text of the keys of the entities that are
+        not excluded, as tuples (start, end, entity): the offsets of the occurrence in the text,
+        and the first entity with that key, from the given one on (-1 if there is none).
+
+        Entities with an empty name never match.
+        """
+        data = text.encode("UTF-8")
+        data_length = len(data)
+        if data_length == len(text):
+            offsets = None
+        else:
+            # Keys only match at the start of a character, so only the offsets of characters are needed.
+            offsets = dict()
+            position = 0
+            for i, char in enumerate(text):
+                offsets[position] = i
+                position += len(char.encode("UTF-8"))
+            offsets[position] = len(text)
+        prefix_memo = self._key_lengths_memo
+        key_memo = self._first_with_key_memo
+        next_same_key = self._next_same_key
+        for start in range(data_length):
+            for prefix_length in self.prefix_lengths:
+                prefix = data[start:start + prefix_length]
+                lengths = prefix_memo[prefix] if prefix in prefix_memo else self.key_lengths(prefix)
+                if lengths is None:
+                    continue
+                for length in lengths:
+                    if start + length > data_length:
+                        break
+                    key = data[start:start + length]
+                    entity = key_memo.get(key)
+                    if entity is None:
+                        entity = self.first_with_key(key)
+                        if len(key_memo) >= _MAX_MEMOIZED_KEYS:
+                            key_memo.clear()
+                        key_memo[key] = entity
+                    while entity != _EMPTY and entity in excluded:
+                        entity = next_same_key[entity]
+                    if entity == _EMPTY:
+                        continue
+                    while entity != _EMPTY and (entity < first or entity in excluded):
+                        entity = next_same_key[entity]
+                    if offsets is None:
+                        yield start, start + length, entity
+                    else:
+                        yield offsets[start], offsets[start + length], entity
+
+
+def open_table(path, kb_version):
+    """Returns: the table stored at path, memory-mapped, if it was built from the given
+    version of the KB; else None.
+    """
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        table = EntityTable(buffer, path=path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if table.kb_version != kb_version:
+        return None
+    return table
+
+
+def write(path, content):
+    """Writes a table atomically, so that processes that map the previous one keep reading it.
+
+    Returns:
+        (bool): True on success.
+    """
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path), dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print("WARN: Could not write the entity table to '{}': {}".format(path, e), file=sys.stderr)
+        return False
+
+
+def load_or_build(db_path, kb_api, force=False):
+    """Returns the entity table of the DB, from `<db path>.entities` if it is up to date
+    with the KB, else built from the KB (and stored there).
+
+    Parsers of the same process that use the same version of the KB share the table.
+
+    Params:
+        force (bool): build the table even if an up-to-date one exists.
+    """
+    kb_version = kb_api.get_data_version()
+    if kb_version is None:
+        # The DB could not be read: nothing to share.
+        return EntityTable(build(kb_api.get_all_music_entity_ids()))
+
+    key = (os.path.realpath(db_path), kb_version)
+    with _tables_lock:
+        table = None if force else _tables.get(key)
+        if table is not None:
+            return table
+        path = table_path(db_path)
+        if not force:
+            table = open_table(path, kb_version)
+        if table is None:
+            content = build(kb_api.get_all_music_entity_ids(), kb_version)
+            if write(path, content):
+                table = open_table(path, kb_version)
+            if table is None:
+                table = EntityTable(content)
+        _tables[key] = table
+        return table
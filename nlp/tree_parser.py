@@ -1,10 +1,37 @@
 import re
-from functools import lru_cache
 from typing import List
 
-import nltk
-
+from caching.lru_cache import LRUCache
+from instrumentation import metrics
 from knowledge_base.api import KnowledgeBaseAPI
+from nlp import artifacts, entity_table
+from nlp.entity_index import EntityIndex
+
+
+# Stands for any entity in the grammar, and in the token shapes that
+# parses are memoized by.
+_ENTITY_PLACEHOLDER = "<Entity>"
+# Holds the probability of the entities that the placeholder does not
+# stand for in the grammar. It is never a token.
+_OTHER_ENTITIES = "<Other entities>"
+# Stands for the tree of a shape that has no parse.
+_NO_PARSE = object()
+
+
+def _fits_grammar(value: str):
+    """Returns: Whether the value can be a terminal of the grammar."""
+    # TODO: Here we remove entries containing ',
+    #       as it is a special character used by
+    #       the NLTK parser. We need to fix this
+    #       eventually.
+    return "\'" not in value
+
+
+def _strip_punctuation(msg: str):
+    return re.sub(r"[.?']+\ *",
+                  " ",
+                  msg,
+                  flags=re.VERBOSE)
 
 
 class TreeParser:
@@ -19,10 +46,93 @@ class TreeParser:
 
     """
 
-    def __init__(self, db_path, keywords):
+    def __init__(self, db_path, keywords, recompile_artifacts=False, parse_cache_size=1024):
         self.keywords = keywords
         self.kb_api = KnowledgeBaseAPI(db_path)
-        self.kb_named_entities = self.kb_api.get_all_music_entities()
+
+        # The entities are mapped from a table shared with the other
+        # parsers of the DB (see nlp/entity_table.py), and the command
+        # patterns are loaded from disk, when they are up to date with
+        # the DB (see nlp/artifacts.py).
+        self.entity_index = EntityIndex(table=entity_table.load_or_build(db_path, self.kb_api,
+                                                                         force=recompile_artifacts))
+        compiled = artifacts.load_or_compile(db_path,
+                                             self.kb_api,
+                                             "tree",
+                                             self.keywords,
+                                             self._compile_artifacts,
+                                             force=recompile_artifacts,
+                                             )
+        # Number of entities in the grammar (see `_gen_grammar_source`).
+        self._num_grammar_entities = compiled["num_grammar_entities"]
+        self._unary_command_regexes = compiled["unary_command_regexes"]
+        self._terminal_command_regexes = compiled["terminal_command_regexes"]
+        self._binary_command_regexes = compiled["binary_command_regexes"]
+        # Tokens of the commands in the grammar.
+        self._command_tokens = frozenset(token for command_type in ("unary", "terminal", "binary")
+                                         for token in self._grammar_values(self.keywords.get(command_type).keys()))
+        # Built on the first parse, and again when the entities change
+        # the grammar: a tuple of the NLTK parser and its version.
+        self._grammar = None
+
+        # Key is the shape of a list of tokens (see `_parser`), val
+        # is its tree. Entries are tagged with the grammar's version.
+        self._parse_cache = LRUCache(parse_cache_size, name="parse") if parse_cache_size > 0 else None
+
+    def _compile_artifacts(self):
+        return dict(
+            unary_command_regexes=self._gen_command_regexes("unary"),
+            terminal_command_regexes=self._gen_command_regexes("terminal"),
+            binary_command_regexes=self._gen_command_regexes("binary"),
+            num_grammar_entities=sum(1 for entity in self.entity_index.table.names() if _fits_grammar(entity)),
+        )
+
+    def warm_up(self, previous=None):
+        """Prepares the parser to serve requests, so that the first
+        one does not pay for building the grammar.
+
+        Args:
+            previous: A TreeParser that this one replaces (e.g. after
+                      the KB changed). If it has the same keywords,
+                      its cache of parse trees is reused; the trees
+                      that the change of entities affects are dropped
+                      when looked up, as they have another version.
+
+        """
+        self._get_grammar()
+        if (previous is not None and previous._parse_cache is not None and self._parse_cache is not None
+                and previous.keywords == self.keywords):
+            self._parse_cache = previous._parse_cache
+
+    @property
+    def kb_named_entities(self):
+        return self.entity_index.entities
+
+    def update_entities(self, added=(), removed=()):
+        """Adds entities to, and removes entities from, the ones that
+        the parser recognizes, e.g. as songs or artists are added to
+        the KB (see KnowledgeBaseAPI.get_entity_changes).
+
+        The grammar does not list the entities (see
+        `_gen_grammar_source`), so it is only rebuilt, at a cost
+        that does not depend on the size of the catalogue.
+
+        Args:
+            added: Names of entities.
+            removed: Names of entities.
+
+        """
+        num_grammar_entities = self._num_grammar_entities
+        for entity in removed:
+            if self.entity_index.remove(entity) and _fits_grammar(entity):
+                num_grammar_entities -= 1
+        for entity in added:
+            if self.entity_index.add(entity) and _fits_grammar(entity):
+                num_grammar_entities += 1
+        self._num_grammar_entities = num_grammar_entities
+        grammar = self._grammar
+        if grammar is not None and grammar[1] != self._grammar_version():
+            self._grammar = None
 
     def __call__(self, msg: str):
         """Creates an NLTK Parse Tree from the user input msg.
@@ -34,58 +144,86 @@ class TreeParser:
         Returns: An NLTK parse tree, as defined by the CFG given
                  in the "parser" function.
 
+        """
+        return self._parse(msg)
+
+    @staticmethod
+    def cache_key(msg: str):
+        """Normalizes a message for caching: messages with the same
+        key have the same parse. The punctuation that the parser
+        ignores is removed; case is kept, as keywords are matched
+        case-sensitively.
+
+        """
+        return _strip_punctuation(msg)
+
+    def parse_many(self, msgs: List[str]):
+        """Creates the NLTK Parse Trees of several messages,
+        e.g. a batch of logged utterances.
+
+        The lexing of a piece of text is done once for the whole
+        batch: messages sharing a phrase (e.g. 'play something
+        similar to') share the work of lexing it.
+
+        Args:
+            msgs: A list of strings of user input.
+
+        Yields: For each message in order, its NLTK parse tree, or
+                the exception raised while parsing it (e.g. if the
+                grammar does not cover its tokens).
+
+        """
+        lexing_memo = {}
+        for msg in msgs:
+            try:
+                tree = self._parse(msg, lexing_memo)
+            except Exception as e:
+                tree = e
+            yield tree
+
+    def _parse(self, msg: str, lexing_memo=None):
+        """Parses a message, sharing the work of lexing through
+        the given memo, if any.
+
+        Args:
+            lexing_memo: A dict of the tokens of already lexed pieces of text.
+
         """
         # Remove punctuation from the string
-        msg = re.sub(r"[.?']+\ *",
-                     " ",
-                     msg,
-                     flags=re.VERBOSE)
+        msg = _strip_punctuation(msg)
 
         # Parse sentence into list of tokens containing
         #  only entities and commands.
-        tokens = self._lexer(msg)
+        with metrics.timer("imr_parser_stage_seconds", parser="tree", stage="lexing"):
+            tokens = self._lexer(msg, lexing_memo)
 
         # Generate an NLTK parse tree
-        tree = self._parser(tokens)
+        with metrics.timer("imr_parser_stage_seconds", parser="tree", stage="grammar_parse"):
+            tree = self._parser(tokens)
         return tree
 
-    @property
-    @lru_cache(1)
-    def _unary_command_regexes(self):
-        """Generates RegEx patterns from command signifiers.
+    def parse_cache_info(self):
+        """Returns: A dict of the hits, misses, hit rate and size of
+                 the cache of parse trees by token shape, or None if
+                 there is no cache.
 
         """
-        patterns = {}
-        for intent, keys in self.keywords.get("unary").items():
-            if keys:
-                patterns[intent] = re.compile(r'\b' + r'\b|\b'.join(keys) + r'\b')
-        return patterns
+        return self._parse_cache.info() if self._parse_cache is not None else None
 
-    @property
-    @lru_cache(1)
-    def _terminal_command_regexes(self):
+    def _gen_command_regexes(self, command_type):
         """Generates RegEx patterns from command signifiers.
 
-        """
-        patterns = {}
-        for intent, keys in self.keywords.get("terminal").items():
-            if keys:
-                patterns[intent] = re.compile(r'\b' + r'\b|\b'.join(keys) + r'\b')
-        return patterns
-
-    @property
-    @lru_cache(1)
-    def _binary_command_regexes(self):
-        """Generates RegEx patterns from command signifiers.
+        Args:
+            command_type: "unary", "terminal" or "binary".
 
         """
         patterns = {}
-        for intent, keys in self.keywords.get("binary").items():
+        for intent, keys in self.keywords.get(command_type).items():
             if keys:
                 patterns[intent] = re.compile(r'\b' + r'\b|\b'.join(keys) + r'\b')
         return patterns
 
-    def _lexer(self, msg: str):
+    def _lexer(self, msg: str, memo=None):
         """Lexes an input string into a list of tokens.
 
         This lexer first looks for Entities in the input string
@@ -99,6 +237,8 @@ class TreeParser:
         Args:
             msg: A string of user input.
                  i.e 'play something similar to justin bieber'
+            memo: If given, a dict of the tokens of already lexed
+                 pieces of text, which is updated with new ones.
 
         Returns: A tokenized list of commands and Entities.
             i.e. ['control_play', 'query_similar_entities', 'Justin Bieber']
@@ -106,25 +246,28 @@ class TreeParser:
         """
 
         def lexing_algorithm(text):
-            # TODO: >= O(n^2) (horrible time complexity). In the interest of
-            # making forward progress, optimize this later.  Could use a
-            # bloom filter to look for matches, then binary search  on
-            # entities/commands find specific match once possible match is
-            # found.  Or even just use a hashmap for searching.
+            if memo is None:
+                return lex(text)
+            if text not in memo:
+                memo[text] = lex(text)
+            return memo[text]
+
+        def lex(text):
+            # Entities are looked up in a hashmap of their names (see
+            # EntityIndex), rather than by scanning the whole catalogue.
 
             # Base case.
             if text == "":
                 return []
 
             # 1. Parse named entities.
-            for entity in self.kb_named_entities:
-                if entity.lower() in text.lower():
-                    pieces = text.lower().split(entity.lower())
-                    left = pieces[0]
-                    right = pieces[1]
-                    if left == text or right == text:
-                        # Safety measure to prevent '' causing infinite recursion.
-                        break
+            entity = self.entity_index.first_match(text)
+            if entity is not None:
+                pieces = text.lower().split(entity.lower())
+                left = pieces[0]
+                right = pieces[1]
+                # Safety measure to prevent '' causing infinite recursion.
+                if left != text and right != text:
                     return lexing_algorithm(left) + [entity.strip()] + lexing_algorithm(right)
 
             # 2. Parse unary commands.
@@ -165,16 +308,39 @@ class TreeParser:
 
         return lexing_algorithm(msg)
 
-    def _parser(self, tokens: List[str]):
-        """Generates a Parse Tree from a list of tokens
-        provided by the Lexer.
+    @staticmethod
+    def _grammar_values(vals):
+        """Returns: The values that can be terminals of the grammar,
+                 or ["NONE"] if there are none.
+
+        """
+        return [s for s in vals if _fits_grammar(s)] or ["NONE"]
+
+    def _grammar_version(self):
+        """Returns: What the grammar depends on, besides the
+                 keywords: the number of entities in it, and the
+                 entities that are also commands.
+
+        """
+        return self._num_grammar_entities, frozenset(
+            token for token in self._command_tokens if token in self.entity_index)
+
+    def _gen_grammar_source(self, num_entities: int, ambiguous_entities: List[str]):
+        """Generates the grammar that the parser is built from.
+
+        Every entity is equally likely in the grammar, so rather than
+        listing all of them, which would make the grammar as large as
+        the catalogue, the Entity rule has a placeholder, which stands
+        for any entity that is not also a command, with the probability
+        of one entity. The entities that are also commands are listed,
+        as the parse of a sentence that contains one depends on them.
 
         Args:
-            tokens: A tokenized list of commands and Entities.
-            i.e. ['control_play', 'query_similar_entities', 'Justin Bieber']
+            num_entities: Number of named entities in the DB (whose
+                          name can be a terminal of the grammar).
+            ambiguous_entities: The named entities that are also commands.
 
-        Returns: An nltk parse tree, as defined by the CFG given
-                 in this function.
+        Returns: The source of an NLTK PCFG.
 
         """
 
@@ -183,37 +349,124 @@ class TreeParser:
         #          -  Play something similar to despicito but faster
         #          -  Play something similar to u2 and justin bieber
 
+        def format_prob(prob):
+            # NLTK does not read probabilities in exponent notation.
+            return "{:.15f}".format(prob)
+
         def gen_lexing_patterns(vals: List[str]):
-            # TODO: Here we remove entries containing ',
-            #       as it is a special character used by
-            #       the NLTK parser. We need to fix this
-            #       eventually.
-            safe_vals = [s for s in vals if "\'" not in s]
-            return "' | '".join(safe_vals) or "NONE"
+            safe_vals = self._grammar_values(vals)
+            # Every alternative is equally likely, so that the
+            # most likely tree of a sentence does not depend on
+            # which entities (or commands) it contains.
+            prob = format_prob(1.0 / len(safe_vals))
+            return " | ".join("'{}' [{}]".format(s, prob) for s in safe_vals)
+
+        def gen_entity_patterns():
+            if num_entities == 0:
+                return gen_lexing_patterns([])
+            prob = format_prob(1.0 / num_entities)
+            patterns = ["'{}' [{}]".format(s, prob) for s in sorted(ambiguous_entities)]
+            num_other_entities = num_entities - len(ambiguous_entities)
+            if num_other_entities > 0:
+                patterns.append("'{}' [{}]".format(_ENTITY_PLACEHOLDER, prob))
+            if num_other_entities > 1:
+                patterns.append("'{}' [{}]".format(_OTHER_ENTITIES, format_prob((num_other_entities - 1) / num_entities)))
+            return " | ".join(patterns)
 
         # A Probabilistic Context Free Grammar (PCFG)
         # can be used to simulate "operator precedence",
         # which removes the problems of ambiguity in
         # the grammar.
-        grammar = nltk.PCFG.fromstring("""
+        return """
         Root -> Terminal_Command Result         [0.6]
         Root -> Terminal_Command                [0.4]
         Result -> Entity                        [0.5]
         Result -> Unary_Command Result          [0.1]
         Result -> Result Binary_Command Result  [0.4]
-        Entity -> '{}'                          [1.0]
-        Unary_Command -> '{}'                   [1.0]
-        Terminal_Command -> '{}'                [1.0]
-        Binary_Command -> '{}'                  [1.0]
+        Entity -> {}
+        Unary_Command -> {}
+        Terminal_Command -> {}
+        Binary_Command -> {}
         """.format(
-            gen_lexing_patterns(self.kb_named_entities),
+            gen_entity_patterns(),
             gen_lexing_patterns(self.keywords.get("unary").keys()),
             gen_lexing_patterns(self.keywords.get("terminal").keys()),
             gen_lexing_patterns(self.keywords.get("binary").keys()),
-        ))
+        )
+
+    def _parser(self, tokens: List[str]):
+        """Generates a Parse Tree from a list of tokens
+        provided by the Lexer.
+
+        Lists of tokens that only differ by their entities (e.g.
+        ['control_play', 'query_similar_entities', 'U2'] and
+        ['control_play', 'query_similar_entities', 'Sorry'])
+        have the same shape, and thus the same tree but for its
+        leaves, as all entities are equally likely in the grammar.
+        Shapes are parsed, rather than tokens (see
+        `_gen_grammar_source`), and the trees of the most recently
+        used shapes are cached, so that only new shapes go through
+        chart parsing.
+
+        Args:
+            tokens: A tokenized list of commands and Entities.
+            i.e. ['control_play', 'query_similar_entities', 'Justin Bieber']
 
-        parser = nltk.ViterbiParser(grammar)
+        Returns: An nltk parse tree, as defined by the CFG given
+                 in `_gen_grammar_source`.
+
+        """
+        viterbi_parser, version = self._get_grammar()
+        shape = tuple(_ENTITY_PLACEHOLDER if self._is_entity_token(token) else token for token in tokens)
+        if self._parse_cache is None:
+            tree = self._viterbi_parse(viterbi_parser, shape)
+        else:
+            tree = self._parse_cache.get(shape, version)
+            if tree is None:
+                # Shapes that have no parse are cached too.
+                tree = self._viterbi_parse(viterbi_parser, shape) or _NO_PARSE
+                self._parse_cache.put(shape, tree, version)
+            if tree is _NO_PARSE:
+                tree = None
+            else:
+                # The cached tree is never handed out, but copied.
+                tree = tree.copy(deep=True)
+        if tree is None:
+            raise ValueError("The grammar has no parse for tokens {}".format(tokens))
+
+        for token, position in zip(tokens, tree.treepositions('leaves')):
+            tree[position] = token
+        return tree
+
+    def _is_entity_token(self, token: str):
+        """Returns: Whether the token can only be an Entity in the grammar."""
+        return token in self.entity_index and token not in self._command_tokens and _fits_grammar(token)
+
+    def _get_grammar(self):
+        """Returns: A tuple of the NLTK parser of the grammar, and
+                 the grammar's version.
+
+        """
+        grammar = self._grammar
+        if grammar is None:
+            # NLTK is slow to import, so only import it once a
+            # sentence has to be parsed.
+            import nltk
+
+            version = self._grammar_version()
+            source = self._gen_grammar_source(*version)
+            grammar = self._grammar = (nltk.ViterbiParser(nltk.PCFG.fromstring(source)), version)
+        return grammar
+
+    @staticmethod
+    def _viterbi_parse(viterbi_parser, tokens):
+        """Returns: The most likely parse tree of the tokens, or
+                 None if the grammar has no parse for them.
+
+        """
         # TODO: Returns the first tree, but need to deal with
         #       case where grammar is ambiguous, and more than
         #       one tree is returned.
-        return next(parser.parse(tokens))
+        for tree in viterbi_parser.parse(tokens):
+            return tree
+        return None
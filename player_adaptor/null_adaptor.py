@@ -0,0 +1,25 @@
+from player_adaptor.abstract_base_adaptor import AbstractBaseAdaptor
+
+
+class NullController(AbstractBaseAdaptor):
+    """A player-controller that ignores every action.
+
+    Used where the player's output does not matter (e.g. benchmarks,
+    batch processing), so that no time is spent sleeping or printing.
+
+    """
+
+    def play(self, entity=None):
+        pass
+
+    def pause(self, entity=None):
+        pass
+
+    def stop(self, entity=None):
+        pass
+
+    def skip(self, entity=None):
+        pass
+
+    def respond(self, response=None):
+        pass
@@ -0,0 +1,41 @@
+from player_adaptor.abstract_base_adaptor import AbstractBaseAdaptor
+
+
+class RecordingController(AbstractBaseAdaptor):
+    """A player-controller that records every action, and passes
+    it on to another player-controller, if one is given.
+
+    Used to find out how the system responded to each utterance
+    of a batch (see SystemEntry.process_batch).
+
+    """
+
+    def __init__(self, player_controller=None):
+        self.player = player_controller
+        # (action, argument) tuples, in the order they were requested.
+        self.actions = []
+
+    def take_actions(self):
+        """Returns the actions recorded since the last call, and forgets them."""
+        actions, self.actions = self.actions, []
+        return actions
+
+    def _record(self, action, argument):
+        self.actions.append((action, argument))
+        if self.player is not None:
+            getattr(self.player, action)(argument)
+
+    def play(self, entity=None):
+        self._record('play', entity)
+
+    def pause(self, entity=None):
+        self._record('pause', entity)
+
+    def stop(self, entity=None):
+        self._record('stop', entity)
+
+    def skip(self, entity=None):
+        self._record('skip', entity)
+
+    def respond(self, response=None):
+        self._record('respond', response)
@@ -12,6 +12,23 @@ from tests.test_knowledge_base_api import TestMusicKnowledgeBaseAPI
 from tests.test_system_entry_bag_of_words import TestSystemEntryBOW
 from tests.test_system_entry_tree_parser import TestSystemEntryTreeParser
 from tests.test_db_schema import TestDbSchema
+from tests.test_ingestion_pipeline import TestIngestionPipeline
+from tests.test_response_cache import TestResponseCache
+from tests.test_metrics import TestMetrics
+from tests.test_slow_query_log import TestSlowQueryLog
+from tests.test_profiling import TestProfiling
+from tests.test_parser_artifacts import TestEntityIndex, TestEntityTable, TestParserArtifacts
+from tests.test_batch_processing import TestBatchProcessing
+from tests.test_cli_batch import TestCliBatch
+from tests.test_utterance_cache import TestUtteranceCache
+from tests.test_tree_parser import TestTreeParser
+from tests.test_tree_eval_engine import TestTreeEvalEngine
+from tests.test_hot_reload import TestHotReload
+from tests.test_sqlite_config import TestSqliteConfig
+from tests.test_async_api import TestAsyncKnowledgeBaseAPI
+from tests.test_graph_snapshot import TestGraphSnapshot
+from tests.test_prefork_server import TestPreforkServer
+from tests.test_spotify_client import TestSpotifyClient
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+"""
+This is an executable script that compiles the parser artifacts
+of a DB (entity table, keyword patterns, stopwords, grammar) and
+stores them next to it, so that processes using the DB start
+without rebuilding them (see nlp/artifacts.py and nlp/entity_table.py).
+
+Parsers compile missing or stale artifacts on their own, but
+running this after updating the DB, before starting workers,
+keeps the first start fast too.
+
+Example:
+    python3 scripts/compile_parser_artifacts.py -d ./knowledge_base/knowledge_base.db
+
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append('../')
+sys.path.append('.')
+from command_evaluation.bag_of_words_eval_engine import BOWEvalEngine
+from command_evaluation.tree_eval_engine import TreeEvalEngine
+from nlp import artifacts
+from nlp.bag_of_words_parser import BOWParser
+from nlp.tree_parser import TreeParser
+from player_adaptor.null_adaptor import NullController
+
+# Parser type (as given to SystemEntry) => (parser class, eval engine class, artifacts name).
+PARSERS = {
+    'BagOfWords': (BOWParser, BOWEvalEngine, "bow"),
+    'TREE': (TreeParser, TreeEvalEngine, "tree"),
+}
+
+
+def compile_parser_artifacts(db_path, parser_type):
+    """Compiles and stores the artifacts of the given parser type, even if up-to-date ones exist.
+
+    Returns:
+        (string): path of the artifacts file.
+    """
+    parser_class, eval_engine_class, name = PARSERS[parser_type]
+    keywords = eval_engine_class(db_path, NullController()).keywords
+    parser_class(db_path, keywords, recompile_artifacts=True)
+    return artifacts.artifacts_path(db_path, name)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path", required=True,
+                        help=" Specifies a relative path to the DB, (include "
+                             "the filename). Ex: -d ./knowledge_base/knowledge_base.db")
+    parser.add_argument("--parsers", nargs="+", default=list(PARSERS), choices=list(PARSERS),
+                        help=" Parser types to compile artifacts for. Default: all")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db_path):
+        print("Error: DB file \"{}\" not found.".format(args.db_path), file=sys.stderr)
+        sys.exit(1)
+
+    for parser_type in args.parsers:
+        start = time.perf_counter()
+        path = compile_parser_artifacts(args.db_path, parser_type)
+        print("Compiled {} parser artifacts to {} in {:.2f}s.".format(parser_type, path, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
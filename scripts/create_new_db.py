@@ -8,6 +8,9 @@ Example:
     # With Spotify Credentials:
     python3 populate_db.py -d ./knowledge_base/knowledge_base.db -s 123 123
 
+    # Re-seed from previously cached Spotify responses, without touching the network:
+    python3 populate_db.py -d ./knowledge_base/knowledge_base.db --offline
+
 """
 
 import os
@@ -18,13 +21,17 @@ sys.path.append('../')
 sys.path.append('.')
 from player_adaptor.dummy_adaptor import DummyController
 from scripts import test_db_utils
+from scripts.response_cache import ResponseCache
 from controller.system_entry import SystemEntry
 
+DEFAULT_CACHE = "./spotify_cache.db"
+
 
 def setup_db_with_spotify_data(spotify_client_id,
                                spotify_secret_key,
                                artists,
                                db_path=None,
+                               cache=None,
                                ):
     try:
         db_path = test_db_utils \
@@ -32,6 +39,7 @@ def setup_db_with_spotify_data(spotify_client_id,
                                                  spotify_secret_key,
                                                  artists,
                                                  path=db_path,
+                                                 cache=cache,
                                                  )
     except FileNotFoundError as e:
         print("Please run cli.py from project directory!")
@@ -67,6 +75,18 @@ def main():
                         help=" Pulls data from Spotify, requires Spotify_client_id and"
                              " spotify_secret_key  "
                              "Ex: -s 12345 12345")
+    parser.add_argument("--cache", type=str, dest="cache_path", default=DEFAULT_CACHE,
+                        help=" Path to the on-disk cache of Spotify responses. "
+                             "Default: {}".format(DEFAULT_CACHE))
+    parser.add_argument("--no-cache", action="store_true", dest="no_cache",
+                        help=" Always fetch from Spotify, without reading or writing the cache.")
+    parser.add_argument("--cache-ttl", type=float, dest="cache_ttl_hours", default=None,
+                        help=" Treat cached responses older than this many hours as stale.")
+    parser.add_argument("--cache-max-mb", type=float, dest="cache_max_mb", default=None,
+                        help=" Evict least recently used responses once the cache exceeds this size.")
+    parser.add_argument("--offline", action="store_true",
+                        help=" Replay cached Spotify responses only; never go to the network. "
+                             "Spotify credentials are not needed in this mode.")
     args = parser.parse_args()
 
     db_path = args.db_path
@@ -76,6 +96,13 @@ def main():
               file=sys.stderr)
         sys.exit()
 
+    if args.offline and args.no_cache:
+        print("Error: --offline requires the response cache.", file=sys.stderr)
+        sys.exit()
+
+    if args.offline and not args.spotify_creds:
+        args.spotify_creds = ["", ""]
+
     if args.spotify_creds:
         try:
             spotify_client_id = args.spotify_creds[0]
@@ -94,10 +121,19 @@ def main():
                 "Justin Timberlake", "Justin Bieber",
                 "Shawn Mendes",
         ]
+        cache = None
+        if not args.no_cache:
+            cache = ResponseCache(
+                args.cache_path,
+                ttl_seconds=args.cache_ttl_hours * 3600 if args.cache_ttl_hours is not None else None,
+                max_size_bytes=int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb is not None else None,
+                offline=args.offline,
+            )
         setup_db_with_spotify_data(spotify_client_id,
                                    spotify_secret_key,
                                    test_artists,
                                    db_path=db_path,
+                                   cache=cache,
                                    )
     else:
         setup_db(db_path)
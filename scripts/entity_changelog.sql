@@ -0,0 +1,44 @@
+-- The entity changelog and its triggers. This script is run when a DB is
+-- created (after schema.sql) and by scripts/migrate_db.py on existing DBs,
+-- so every statement must be idempotent.
+
+-- Every insertion, deletion or renaming of a song or an artist, in order,
+-- so that other processes can update what they derived from the catalogue
+-- (e.g. the parsers' entity indexes) without reloading all of it.
+CREATE TABLE IF NOT EXISTS entity_changelog(
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    -- "insert" or "delete"
+    op      varchar(6) NOT NULL,
+    name    varchar(50) NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS artists_insert_changelog AFTER INSERT ON artists BEGIN
+    INSERT INTO entity_changelog(op, name) SELECT 'insert', name FROM nodes WHERE id = NEW.node_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_delete_changelog AFTER DELETE ON artists BEGIN
+    INSERT INTO entity_changelog(op, name) SELECT 'delete', name FROM nodes WHERE id = OLD.node_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_insert_changelog AFTER INSERT ON songs BEGIN
+    INSERT INTO entity_changelog(op, name) SELECT 'insert', name FROM nodes WHERE id = NEW.node_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS songs_delete_changelog AFTER DELETE ON songs BEGIN
+    INSERT INTO entity_changelog(op, name) SELECT 'delete', name FROM nodes WHERE id = OLD.node_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS nodes_rename_changelog AFTER UPDATE OF name ON nodes
+WHEN EXISTS (SELECT 1 FROM artists WHERE node_id = NEW.id) OR EXISTS (SELECT 1 FROM songs WHERE node_id = NEW.id)
+BEGIN
+    INSERT INTO entity_changelog(op, name) VALUES ('delete', OLD.name), ('insert', NEW.name);
+END;
+
+-- Retention: only the latest 100000 changes are kept, pruned every 1000 changes.
+-- A process that is further behind reloads the catalogue instead
+-- (see KnowledgeBaseAPI.get_entity_changes).
+CREATE TRIGGER IF NOT EXISTS entity_changelog_retention AFTER INSERT ON entity_changelog
+WHEN NEW.seq % 1000 = 0
+BEGIN
+    DELETE FROM entity_changelog WHERE seq <= NEW.seq - 100000;
+END;
@@ -0,0 +1,51 @@
+"""
+This is an executable script that exports the semantic network of
+a DB to a binary snapshot (see knowledge_base/graph_snapshot.py),
+which processes memory-map to look up related entities without
+querying the DB.
+
+Run it after updating the DB, before starting workers: a snapshot
+that is older than the DB is not used.
+
+Example:
+    python3 scripts/export_graph_snapshot.py -d ./knowledge_base/knowledge_base.db
+
+    # Workers then use it through the IMR_GRAPH_SNAPSHOT environment variable:
+    IMR_GRAPH_SNAPSHOT=./knowledge_base/knowledge_base.db.graph python3 view/cli.py
+
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append('../')
+sys.path.append('.')
+from knowledge_base import graph_snapshot
+from knowledge_base.api import KnowledgeBaseAPI
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path", required=True,
+                        help=" Specifies a relative path to the DB, (include "
+                             "the filename). Ex: -d ./knowledge_base/knowledge_base.db")
+    parser.add_argument("-o", type=str, dest="output_path",
+                        help=" Where to write the snapshot. Default: <DB path>.graph")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db_path):
+        print("Error: DB file \"{}\" not found.".format(args.db_path), file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    path = graph_snapshot.export(args.db_path, KnowledgeBaseAPI(args.db_path), args.output_path)
+    if path is None:
+        sys.exit(1)
+    snapshot = graph_snapshot.GraphSnapshot(path)
+    print("Exported {} nodes and {} edges to {} in {:.2f}s.".format(
+        snapshot.num_nodes, snapshot.num_edges, path, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
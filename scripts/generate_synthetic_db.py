@@ -0,0 +1,339 @@
+"""
+This is an executable script that generates a synthetic
+knowledge base at a configurable scale, for performance
+and scale testing.
+
+The generated semantic network uses the regular schema
+(see schema.sql), and has:
+    - artists with Zipf-distributed follower counts,
+    - songs per artist with Zipf-distributed popularity,
+    - genres assigned to artists with Zipf-distributed frequency,
+    - a power-law "similar to" graph between artists, with scores,
+      each link stored in both directions (as bulk_load does).
+
+Names are deliberately varied: multi-word, with punctuation
+(e.g. "Mr. Velvet & the Foxes", "Don't Stop (Neon, Pt. 2)"),
+to exercise the entity matching of the parsers.
+
+Example:
+    # ~1M nodes: 90k artists, 10 songs each, 200 genres.
+    python3 scripts/generate_synthetic_db.py -d ./synthetic.db --artists 90000 --songs-per-artist 10
+
+"""
+import os
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import closing
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILE_NAME = "schema.sql"
+ENTITY_CHANGELOG_FILE_NAME = "entity_changelog.sql"
+# Bump when the generated data changes, so that cached synthetic DBs get regenerated.
+GENERATOR_VERSION = 2
+
+ADJECTIVES = [
+    "Velvet", "Electric", "Golden", "Silent", "Neon", "Broken", "Wild", "Lonely", "Crimson", "Midnight",
+    "Crystal", "Rusty", "Cosmic", "Paper", "Savage", "Sweet", "Hollow", "Lucky", "Frozen", "Burning",
+    "Little", "Big", "Blue", "Black", "White", "Red", "Young", "Old", "Holy", "Dirty",
+]
+NOUNS = [
+    "Foxes", "Kings", "Ghosts", "Rivers", "Wolves", "Tigers", "Hearts", "Machines", "Daughters", "Sons",
+    "Lights", "Mountains", "Engines", "Saints", "Sisters", "Brothers", "Owls", "Riots", "Dreams", "Echoes",
+    "Shadows", "Horses", "Stars", "Vandals", "Pilots", "Monks", "Sharks", "Lovers", "Strangers", "Giants",
+]
+FIRST_NAMES = [
+    "Ava", "Liam", "Zoe", "Noah", "Mia", "Kai", "Lena", "Omar", "Ines", "Theo",
+    "Yara", "Luca", "Nina", "Ezra", "Maya", "Jonah", "Sofia", "Ravi", "Cleo", "Felix",
+]
+LAST_NAMES = [
+    "Stone", "Rivera", "Nakamura", "O'Brien", "Dubois", "Kowalski", "Okafor", "Lindqvist", "Moreau", "Haddad",
+    "Santos", "McKenzie", "Novak", "Fischer", "Delgado", "Ivanova", "Quinn", "Achebe", "Rossi", "Park",
+]
+ARTIST_TEMPLATES = [
+    "{adj} {noun}",
+    "The {adj} {noun}",
+    "{first} {last}",
+    "DJ {first}",
+    "{first} & the {noun}",
+    "Mr. {last}",
+    "{adj}!{noun}",
+    "{adj}/{adj2}",
+    "{first} {last} feat. {first2}",
+    "{last}'s {noun}",
+]
+SONG_WORDS = [
+    "Love", "Night", "Fire", "Rain", "Summer", "Gold", "Heart", "Road", "Dance", "Home",
+    "Light", "Sky", "Blood", "Dream", "Youth", "Money", "Ocean", "City", "Ghost", "Angel",
+]
+SONG_TEMPLATES = [
+    "{w1}",
+    "{w1} {w2}",
+    "Don't Stop the {w1}",
+    "{w1}, {w2} & {w3}",
+    "What's Your {w1}?",
+    "{w1} (feat. {first})",
+    "{w1} - Remastered",
+    "({w1}) {w2}",
+    "{w1}, Pt. {n}",
+    "I Can't {w1} Without You",
+]
+BASE_GENRES = [
+    "pop", "rock", "r&b", "hip hop", "jazz", "house", "techno", "folk", "metal", "punk",
+    "soul", "funk", "reggae", "country", "blues", "trap", "ambient", "disco", "grunge", "k-pop",
+]
+GENRE_PREFIXES = [
+    "", "indie ", "dark ", "nu ", "post-", "lo-fi ", "dream ", "deep ", "canadian ", "uk ",
+    "latin ", "alt ", "progressive ", "experimental ", "psychedelic ", "swedish ", "brazilian ", "acid ",
+]
+
+
+def zipf_weights(n, exponent, rng):
+    """Returns n Zipf-distributed weights (summing to 1), assigned to ranks in a random order."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def zipf_popularity(weights):
+    """Maps Zipf weights to Spotify-style popularity in [0,100] range.
+
+    Spotify popularity grows roughly with the logarithm of play counts, so the most
+    played entity gets 100 and popularity falls off logarithmically with rank.
+    """
+    log_w = np.log(weights)
+    low, high = log_w.min(), log_w.max()
+    if high == low:
+        return np.full(len(weights), 100, dtype=np.int64)
+    return np.rint(100 * (log_w - low) / (high - low)).astype(np.int64)
+
+
+def unique_names(count, gen_name):
+    """Generates `count` distinct names, adding a roman numeral (or number) to names that were already taken."""
+    names = []
+    seen = set()
+    # key: generated name, val: number of times it was generated so far.
+    num_taken = dict()
+    numerals = ["II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X"]
+    for i in range(count):
+        name = gen_name(i)
+        candidate = name
+        while candidate in seen:
+            suffix = num_taken.get(name, 1)
+            num_taken[name] = suffix + 1
+            if suffix <= len(numerals):
+                candidate = "{} {}".format(name, numerals[suffix - 1])
+            else:
+                candidate = "{} {}".format(name, suffix + 1)
+        seen.add(candidate)
+        names.append(candidate)
+    return names
+
+
+def gen_artist_names(num_artists, rng):
+    picks = rng.randint(0, 1 << 30, size=(num_artists, 7)).tolist()
+
+    def gen_name(i):
+        p = picks[i]
+        return ARTIST_TEMPLATES[p[0] % len(ARTIST_TEMPLATES)].format(
+            adj=ADJECTIVES[p[1] % len(ADJECTIVES)],
+            adj2=ADJECTIVES[p[2] % len(ADJECTIVES)],
+            noun=NOUNS[p[3] % len(NOUNS)],
+            first=FIRST_NAMES[p[4] % len(FIRST_NAMES)],
+            first2=FIRST_NAMES[p[5] % len(FIRST_NAMES)],
+            last=LAST_NAMES[p[6] % len(LAST_NAMES)],
+        )
+
+    return unique_names(num_artists, gen_name)
+
+
+def gen_song_names(num_songs, rng, pool_size=50000):
+    """Generates song names by sampling a pool of distinct titles.
+
+    Like in a real catalogue, many songs by different artists share a title.
+    """
+    picks = rng.randint(0, 1 << 30, size=(min(num_songs, pool_size), 6)).tolist()
+    pool = []
+    for p in picks:
+        pool.append(SONG_TEMPLATES[p[0] % len(SONG_TEMPLATES)].format(
+            w1=SONG_WORDS[p[1] % len(SONG_WORDS)],
+            w2=SONG_WORDS[p[2] % len(SONG_WORDS)],
+            w3=SONG_WORDS[p[3] % len(SONG_WORDS)],
+            first=FIRST_NAMES[p[4] % len(FIRST_NAMES)],
+            n=p[5] % 9 + 1,
+        ))
+    return np.array(pool, dtype=object)[rng.randint(0, len(pool), size=num_songs)].tolist()
+
+
+def gen_genre_names(num_genres):
+    names = [prefix + genre for prefix in GENRE_PREFIXES for genre in BASE_GENRES]
+    return unique_names(num_genres, lambda i: names[i % len(names)])
+
+
+def gen_similarity_edges(artist_weights, avg_degree, rng):
+    """Generates a power-law "similar to" graph between artists.
+
+    Each artist links to `avg_degree` others, picked with probability proportional to
+    their (Zipfian) popularity, so that in-degrees follow a power law: popular artists
+    are similar to many others (Chung-Lu model). Self-loops and duplicates are dropped.
+
+    As in the KBs built by the ingestion pipeline, where each related artist adds a
+    symmetric pair of edges (see KnowledgeBaseAPI.bulk_load), every link is returned in
+    both directions, with the same score.
+
+    Returns:
+        (tuple of np.arrays): source and dest artist indices, and scores in [0,100] range.
+    """
+    num_artists = len(artist_weights)
+    sources = np.repeat(np.arange(num_artists), avg_degree)
+    dests = rng.choice(num_artists, size=len(sources), p=artist_weights)
+
+    keep = sources != dests
+    # Links are undirected: a -> b and b -> a are the same link.
+    links = np.unique(np.sort(np.stack([sources[keep], dests[keep]], axis=1), axis=1), axis=0)
+
+    # Mostly strong similarities, with a long tail of weak ones.
+    scores = np.rint(100 * rng.beta(5, 2, size=len(links))).astype(np.int64)
+    return (np.concatenate([links[:, 0], links[:, 1]]),
+            np.concatenate([links[:, 1], links[:, 0]]),
+            np.concatenate([scores, scores]))
+
+
+def generate(db_path,
+             num_artists=10000,
+             songs_per_artist=10,
+             num_genres=200,
+             max_genres_per_artist=3,
+             avg_similar_artists=10,
+             zipf_exponent=1.1,
+             seed=0,
+             ):
+    """Generates a synthetic knowledge base and writes it to a new DB at db_path.
+
+    Returns:
+        (dict): number of rows written to each table.
+    """
+    rng = np.random.RandomState(seed)
+    num_songs = num_artists * songs_per_artist
+
+    artist_names = gen_artist_names(num_artists, rng)
+    genre_names = gen_genre_names(num_genres)
+    song_names = gen_song_names(num_songs, rng)
+
+    # Node ids: artists first, then genres, then songs.
+    artist_ids = np.arange(1, num_artists + 1)
+    genre_ids = np.arange(num_artists + 1, num_artists + num_genres + 1)
+    song_ids = np.arange(num_artists + num_genres + 1, num_artists + num_genres + num_songs + 1)
+
+    artist_weights = zipf_weights(num_artists, zipf_exponent, rng)
+    followers = np.rint(artist_weights / artist_weights.max() * 100000000).astype(np.int64)
+
+    song_artists = np.repeat(artist_ids, songs_per_artist)
+    song_popularity = zipf_popularity(zipf_weights(num_songs, zipf_exponent, rng))
+    song_durations = rng.randint(90000, 420000, size=num_songs)
+
+    genre_weights = zipf_weights(num_genres, zipf_exponent, rng)
+    genres_per_artist = rng.randint(1, max_genres_per_artist + 1, size=num_artists)
+    genre_sources = np.repeat(artist_ids, genres_per_artist)
+    genre_dests = genre_ids[rng.choice(num_genres, size=len(genre_sources), p=genre_weights)]
+    genre_pairs = np.unique(np.stack([genre_sources, genre_dests], axis=1), axis=0)
+
+    sim_sources, sim_dests, sim_scores = gen_similarity_edges(artist_weights, avg_similar_artists, rng)
+
+    schema = ""
+    for file_name in [SCHEMA_FILE_NAME, ENTITY_CHANGELOG_FILE_NAME]:
+        with open(os.path.join(SCRIPTS_DIR, file_name)) as f:
+            schema += f.read()
+
+    with closing(sqlite3.connect(db_path)) as con:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute("PRAGMA cache_size = -262144")
+        con.executescript(schema)
+
+        # Indexes are cheaper to build once, after the bulk insert, than to maintain row by row.
+        indexes = con.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+        for index_name, _ in indexes:
+            con.execute("DROP INDEX {}".format(index_name))
+        # The generated entities are the initial state of the DB, not changes to it:
+        # without its triggers, the bulk insert does not fill the entity changelog.
+        triggers = con.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+        for trigger_name, _ in triggers:
+            con.execute("DROP TRIGGER {}".format(trigger_name))
+
+        with con:
+            con.executemany("INSERT INTO nodes (name, type, id) VALUES (?, 'artist', ?)",
+                            zip(artist_names, artist_ids.tolist()))
+            con.executemany("INSERT INTO nodes (name, type, id) VALUES (?, 'genre', ?)",
+                            zip(genre_names, genre_ids.tolist()))
+            con.executemany("INSERT INTO nodes (name, type, id) VALUES (?, 'song', ?)",
+                            zip(song_names, song_ids.tolist()))
+
+            con.executemany("INSERT INTO artists (node_id, num_spotify_followers) VALUES (?, ?)",
+                            zip(artist_ids.tolist(), followers.tolist()))
+            con.executemany("INSERT INTO genres (node_id) VALUES (?)",
+                            ((x,) for x in genre_ids.tolist()))
+            con.executemany("""
+                INSERT INTO songs (main_artist_id, popularity, duration_ms, node_id) VALUES (?, ?, ?, ?)
+            """, zip(song_artists.tolist(), song_popularity.tolist(), song_durations.tolist(), song_ids.tolist()))
+
+            con.executemany("INSERT INTO edges (source, dest, rel, score) VALUES (?, ?, 'of genre', 100)",
+                            genre_pairs.tolist())
+            con.executemany("INSERT INTO edges (source, dest, rel, score) VALUES (?, ?, 'similar to', ?)",
+                            zip(artist_ids[sim_sources].tolist(), artist_ids[sim_dests].tolist(), sim_scores.tolist()))
+
+        for _, index_sql in indexes:
+            con.execute(index_sql)
+        for _, trigger_sql in triggers:
+            con.execute(trigger_sql)
+        con.commit()
+
+    return dict(
+        nodes=num_artists + num_genres + num_songs,
+        artists=num_artists,
+        songs=num_songs,
+        genres=num_genres,
+        edges=len(genre_pairs) + len(sim_sources),
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path", required=True,
+                        help=" Path of the new DB, (include the filename). Ex: -d ./synthetic.db")
+    parser.add_argument("--artists", type=int, default=10000, help=" Number of artists.")
+    parser.add_argument("--songs-per-artist", type=int, default=10, help=" Number of songs per artist.")
+    parser.add_argument("--genres", type=int, default=200, help=" Number of genres.")
+    parser.add_argument("--max-genres-per-artist", type=int, default=3,
+                        help=" Each artist gets between 1 and this many genres.")
+    parser.add_argument("--similar-artists", type=int, default=10,
+                        help=" Number of artists each artist is linked to as 'similar to'."
+                             " Links are stored in both directions.")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1,
+                        help=" Exponent of the Zipf distributions of popularity, followers and genres.")
+    parser.add_argument("--seed", type=int, default=0, help=" Random seed; the same seed gives the same DB.")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.db_path):
+        print("Error: File \"{}\" already exists.".format(args.db_path), file=sys.stderr)
+        sys.exit(1)
+
+    start = time.time()
+    counts = generate(
+        args.db_path,
+        num_artists=args.artists,
+        songs_per_artist=args.songs_per_artist,
+        num_genres=args.genres,
+        max_genres_per_artist=args.max_genres_per_artist,
+        avg_similar_artists=args.similar_artists,
+        zipf_exponent=args.zipf_exponent,
+        seed=args.seed,
+    )
+    print("Generated {} in {:.1f}s: {}".format(args.db_path, time.time() - start, counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import queue
+import threading
+import time
+
+from knowledge_base.api import KnowledgeBaseAPI
+
+# Marks the end of a stage's input.
+_END_OF_STREAM = object()
+
+
+class IngestionPipeline:
+    """Streams Spotify data into the knowledge base.
+
+    The pipeline has three stages connected by bounded queues:
+        1. fetch: several threads request artist, related-artist and top-song data from Spotify.
+        2. normalize: turns each artist's metadata into flat artist/song/edge records.
+        3. load: a single writer batches records into one transaction every
+           `batch_size` records or `flush_interval_ms` milliseconds, whichever comes first.
+
+    Because every queue is bounded, a slow stage applies back-pressure to the ones before it,
+    so memory use does not grow with the size of the crawl. Network requests (fetch) and
+    disk writes (load) run concurrently.
+
+    Example:
+        pipeline = IngestionPipeline(SpotifyClient(client_id, secret_key), "./new.db")
+        stats = pipeline.run(["U2", "Raveena"])
+    """
+
+    def __init__(self,
+                 spotify,
+                 db_path,
+                 num_fetchers=4,
+                 queue_size=64,
+                 batch_size=500,
+                 flush_interval_ms=250,
+                 country_iso_code="CA",
+                 ):
+        self.spotify = spotify
+        self.kb_api = KnowledgeBaseAPI(db_path)
+        self.num_fetchers = num_fetchers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.country_iso_code = country_iso_code
+        self.stats = dict(
+            artists_requested=0,
+            artists_fetched=0,
+            records_queued=0,
+            records_written=0,
+            batches_written=0,
+            batches_failed=0,
+        )
+        self._stats_lock = threading.Lock()
+        # The first unexpected error of a stage, re-raised by `run` once every stage has finished.
+        self._error = None
+
+    def run(self, artist_names):
+        """Runs the pipeline to completion.
+
+        Params:
+            artist_names (iterable): each element is an artist name; consumed lazily
+                (e.g. a file with one artist name per line).
+
+        Returns:
+            (dict): counts of requested/fetched artists and queued/written records and batches.
+        Raises:
+            Exception: the first unexpected error of a stage (e.g. a malformed Spotify payload,
+                or a DB error other than those bulk_load handles), after the pipeline has
+                processed the rest of its input.
+        """
+        self._error = None
+        names_queue = queue.Queue(maxsize=self.queue_size)
+        metadata_queue = queue.Queue(maxsize=self.queue_size)
+        records_queue = queue.Queue(maxsize=self.queue_size * 8)
+
+        threads = [
+            threading.Thread(target=self._fetch_stage, args=(names_queue, metadata_queue), daemon=True)
+            for _ in range(self.num_fetchers)
+        ]
+        threads.append(threading.Thread(target=self._normalize_stage, args=(metadata_queue, records_queue), daemon=True))
+        threads.append(threading.Thread(target=self._load_stage, args=(records_queue,), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        for artist_name in artist_names:
+            artist_name = artist_name.strip()
+            if artist_name:
+                self._increment("artists_requested")
+                names_queue.put(artist_name)
+
+        for _ in range(self.num_fetchers):
+            names_queue.put(_END_OF_STREAM)
+
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        return dict(self.stats)
+
+    def _fetch_stage(self, names_queue, metadata_queue):
+        while True:
+            artist_name = names_queue.get()
+            if artist_name is _END_OF_STREAM:
+                metadata_queue.put(_END_OF_STREAM)
+                return
+
+            try:
+                metadata = self._fetch_artist_metadata(artist_name)
+            except Exception as e:
+                print("ERROR: Failed to fetch data for artist '{}': {}".format(artist_name, str(e)))
+                continue
+
+            if metadata is not None:
+                self._increment("artists_fetched")
+                metadata_queue.put(metadata)
+
+    def _fetch_artist_metadata(self, artist_name):
+        """Fetches all metadata for the given artist.
+
+        Returns:
+            (dict): keys: name, ID, num_followers, genres, related_artists, songs. None if
+                the artist could not be found.
+        """
+        artist_summary = self.spotify.get_artist_data(artist_name)
+        if artist_summary is None:
+            return None
+
+        return dict(
+            name=artist_name,
+            ID=artist_summary["id"],
+            num_followers=artist_summary["num_followers"],
+            genres=artist_summary["genres"],
+            related_artists=self.spotify.get_related_artists(artist_summary["id"]) or {},
+            songs=self.spotify.get_top_songs(artist_summary["id"], self.country_iso_code) or {},
+        )
+
+    def _normalize_stage(self, metadata_queue, records_queue):
+        num_finished_fetchers = 0
+        while num_finished_fetchers < self.num_fetchers:
+            metadata = metadata_queue.get()
+            if metadata is _END_OF_STREAM:
+                num_finished_fetchers += 1
+                continue
+
+            # A stage that stopped reading its queue would block the ones before it, so
+            # errors are recorded, and the stage goes on with the next artist.
+            try:
+                records = list(self._to_records(metadata))
+            except Exception as e:
+                print("ERROR: Failed to normalize data for artist '{}': {}".format(metadata.get("name"), repr(e)))
+                self._record_error(e)
+                continue
+
+            for record in records:
+                self._increment("records_queued")
+                records_queue.put(record)
+
+        records_queue.put(_END_OF_STREAM)
+
+    def _to_records(self, metadata):
+        """Flattens one artist's metadata into bulk_load records.
+
+        Related artists are connected by one symmetric edge record per pair; the
+        writer ignores edges that already exist, so pairs seen from both sides
+        of the crawl cost nothing extra.
+        """
+        artist_name = metadata["name"]
+        yield dict(
+            type="artist",
+            name=artist_name,
+            genres=metadata["genres"],
+            num_spotify_followers=metadata["num_followers"],
+            spotify_id=metadata["ID"],
+        )
+
+        for song_name, song_info in metadata["songs"].items():
+            yield dict(
+                type="song",
+                name=song_name,
+                artist=artist_name,
+                duration_ms=song_info["duration_ms"],
+                popularity=song_info["popularity"],
+                spotify_id=song_info["id"],
+            )
+
+        for rel_artist_name, rel_artist_info in metadata["related_artists"].items():
+            yield dict(
+                type="artist",
+                name=rel_artist_name,
+                genres=rel_artist_info["genres"],
+                num_spotify_followers=rel_artist_info["num_followers"],
+                spotify_id=rel_artist_info["ID"],
+            )
+            yield dict(
+                type="edge",
+                source=artist_name,
+                dest=rel_artist_name,
+                rel=self.kb_api.approved_relations["similarity"],
+                score=100,
+                symmetric=True,
+            )
+
+    def _load_stage(self, records_queue):
+        flush_interval = self.flush_interval_ms / 1000.0
+        batch = []
+        deadline = time.monotonic() + flush_interval
+        while True:
+            try:
+                record = records_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = None
+
+            if record is _END_OF_STREAM:
+                self._flush(batch)
+                return
+
+            if record is not None:
+                batch.append(record)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + flush_interval
+
+    def _flush(self, batch):
+        if not batch:
+            return
+
+        try:
+            num_written = self.kb_api.bulk_load(batch)
+        except Exception as e:
+            print("ERROR: Failed to write a batch of {} records: {}".format(len(batch), repr(e)))
+            self._record_error(e)
+            num_written = None
+        if num_written is None:
+            self._increment("batches_failed")
+        else:
+            self._increment("batches_written")
+            self._increment("records_written", num_written)
+
+    def _record_error(self, error):
+        with self._stats_lock:
+            if self._error is None:
+                self._error = error
+
+    def _increment(self, stat, amount=1):
+        with self._stats_lock:
+            self.stats[stat] += amount
@@ -0,0 +1,76 @@
+"""
+This is an executable script that upgrades an existing DB
+to the current schema (see schema.sql and entity_changelog.sql),
+in place.
+
+Every migration is idempotent, so the script can be run
+on any DB, any number of times.
+
+Example:
+    python3 scripts/migrate_db.py -d ./knowledge_base/knowledge_base.db
+
+"""
+import os
+import sqlite3
+import sys
+from argparse import ArgumentParser
+from contextlib import closing
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The entity changelog and its triggers, shared with the creation of new DBs.
+ENTITY_CHANGELOG_FILE_NAME = "entity_changelog.sql"
+
+
+def _has_column(cursor, table, column):
+    cursor.execute("PRAGMA table_info({});".format(table))
+    return column in [x[1] for x in cursor.fetchall()]
+
+
+def migrate(db_path):
+    """Applies all migrations to the DB at the given path.
+
+    Returns:
+        (list of strings): descriptions of the migrations that changed the DB.
+    """
+    applied = []
+    with closing(sqlite3.connect(db_path)) as con:
+        with con:
+            with closing(con.cursor()) as cursor:
+                cursor.execute("CREATE INDEX IF NOT EXISTS nodes_name_idx ON nodes(name);")
+                cursor.execute("CREATE INDEX IF NOT EXISTS songs_node_id_idx ON songs(node_id);")
+
+                for table in ["artists", "songs"]:
+                    if not _has_column(cursor, table, "spotify_id"):
+                        cursor.execute("ALTER TABLE {} ADD COLUMN spotify_id varchar(22);".format(table))
+                        applied.append("added {}.spotify_id".format(table))
+                    cursor.execute("CREATE INDEX IF NOT EXISTS {0}_spotify_id_idx ON {0}(spotify_id);".format(table))
+
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entity_changelog';")
+                if cursor.fetchone() is None:
+                    applied.append("added entity_changelog")
+        # executescript commits first, so it runs after the migrations above.
+        with open(os.path.join(SCRIPTS_DIR, ENTITY_CHANGELOG_FILE_NAME)) as f:
+            entity_changelog_sql = f.read()
+        with con:
+            con.executescript(entity_changelog_sql)
+    return applied
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path", required=True,
+                        help=" Specifies a relative path to the DB, (include "
+                             "the filename). Ex: -d ./knowledge_base/knowledge_base.db")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db_path):
+        print("Error: DB file \"{}\" not found.".format(args.db_path), file=sys.stderr)
+        sys.exit(1)
+
+    applied = migrate(args.db_path)
+    print("Applied migrations: {}".format(applied or "none"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+This is an executable script that refreshes the Spotify
+follower counts of all artists and the popularity of all
+songs in an existing DB.
+
+Spotify's batch endpoints are used, so the whole catalogue
+is refreshed with one request per 50 artists/songs.
+
+Example:
+    python3 scripts/refresh_spotify_metadata.py -d ./knowledge_base/knowledge_base.db -s 123 123
+
+"""
+import os
+import sys
+from argparse import ArgumentParser
+
+sys.path.append('../')
+sys.path.append('.')
+from knowledge_base.api import KnowledgeBaseAPI
+from scripts.spotify_client import SpotifyClient
+
+
+def refresh_spotify_metadata(kb_api, spotify):
+    """Updates artists.num_spotify_followers and songs.popularity for every entity with a Spotify ID.
+
+    Returns:
+        (dict): number of artists and songs updated.
+    """
+    artist_IDs = kb_api.get_spotify_ids("artist") or []
+    artists = spotify.get_several_artists(artist_IDs)
+    num_artists_updated = kb_api.update_spotify_followers({
+        artist_ID: artist["num_followers"] for artist_ID, artist in artists.items() if artist is not None
+    })
+
+    song_IDs = kb_api.get_spotify_ids("song") or []
+    songs = spotify.get_several_tracks(song_IDs)
+    num_songs_updated = kb_api.update_spotify_popularity({
+        song_ID: song["popularity"] for song_ID, song in songs.items() if song is not None
+    })
+
+    return dict(artists=num_artists_updated, songs=num_songs_updated)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path", required=True,
+                        help=" Specifies a relative path to the DB, (include "
+                             "the filename). Ex: -d ./knowledge_base/knowledge_base.db")
+    parser.add_argument("-s", type=str, nargs=2, dest="spotify_creds", required=True,
+                        help=" Spotify_client_id and spotify_secret_key. Ex: -s 12345 12345")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db_path):
+        print("Error: DB file \"{}\" not found.".format(args.db_path), file=sys.stderr)
+        sys.exit(1)
+
+    spotify = SpotifyClient(args.spotify_creds[0], args.spotify_creds[1])
+    num_updated = refresh_spotify_metadata(KnowledgeBaseAPI(args.db_path), spotify)
+    print("Updated {artists} artists and {songs} songs.".format(**num_updated))
+
+
+if __name__ == "__main__":
+    main()
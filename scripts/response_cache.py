@@ -0,0 +1,169 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from urllib.parse import urlencode
+
+
+class CachedResponse:
+    """Stands in for a `requests.Response` that was served from the cache."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = body
+
+    def json(self):
+        return json.loads(self.content.decode("UTF-8"))
+
+
+class ResponseCache:
+    """A persistent, SQLite-backed cache of HTTP responses.
+
+    Responses are keyed by method, URL and query parameters (see `make_key`), so the
+    same request made by a later crawl is answered from disk instead of the network.
+
+    Params:
+        path (string): path to the cache's .db file (created if it does not exist).
+        ttl_seconds (float): entries older than this are treated as misses. None to never expire.
+        max_size_bytes (int): when the total size of cached bodies exceeds this, the least
+            recently used entries are evicted. None for no limit.
+        offline (bool): "replay only" mode: serve every cached entry regardless of its age,
+            and never go to the network (see SpotifyClient).
+    """
+
+    def __init__(self, path, ttl_seconds=None, max_size_bytes=None, offline=False):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        with closing(self.connection) as con:
+            with con:
+                con.execute("""
+                    CREATE TABLE IF NOT EXISTS responses(
+                        key         text PRIMARY KEY,
+                        status_code int NOT NULL,
+                        body        blob NOT NULL,
+                        size        int NOT NULL,
+                        created_at  real NOT NULL,
+                        last_access real NOT NULL
+                    );
+                """)
+                con.execute("""
+                    CREATE INDEX IF NOT EXISTS responses_last_access_idx ON responses(last_access);
+                """)
+                # The total size of the cached bodies, kept up to date by every write, so that
+                # `put` does not have to sum the sizes of every entry.
+                con.execute("""
+                    CREATE TABLE IF NOT EXISTS cache_size(
+                        id          int PRIMARY KEY CHECK (id = 0),
+                        total_size  int NOT NULL
+                    );
+                """)
+                con.execute("""
+                    INSERT OR IGNORE INTO cache_size (id, total_size)
+                    SELECT 0, COALESCE(SUM(size), 0) FROM responses;
+                """)
+
+    def __str__(self):
+        return "Response cache at {} (hits={}, misses={}).".format(self.path, self.hits, self.misses)
+
+    @property
+    def connection(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(method, url, params=None):
+        """Builds a cache key that does not depend on the order of the query parameters.
+
+        e.g. make_key("GET", "https://api.spotify.com/v1/search", dict(type="artist", q="U2"))
+            => "GET https://api.spotify.com/v1/search?q=U2&type=artist"
+        """
+        query = urlencode(sorted((params or {}).items()))
+        return "{} {}?{}".format(method.upper(), url, query)
+
+    def get(self, key):
+        """Looks up a cached response.
+
+        Returns:
+            (CachedResponse): None if the key is not cached or its entry has expired.
+        """
+        now = time.time()
+        with self._lock, closing(self.connection) as con:
+            with con:
+                row = con.execute("""
+                    SELECT status_code, body, created_at FROM responses WHERE key == (?);
+                """, (key,)).fetchone()
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                status_code, body, created_at = row
+                if not self.offline and self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                    con.execute("DELETE FROM responses WHERE key == (?);", (key,))
+                    self._add_to_total_size(con, -len(body))
+                    self.misses += 1
+                    return None
+
+                con.execute("UPDATE responses SET last_access = (?) WHERE key == (?);", (now, key))
+                self.hits += 1
+                return CachedResponse(status_code, bytes(body))
+
+    def put(self, key, status_code, body):
+        """Stores a response body, evicting least recently used entries if the cache is over its size limit.
+
+        Params:
+            body (bytes): raw response body.
+        """
+        now = time.time()
+        with self._lock, closing(self.connection) as con:
+            with con:
+                # The size of the replaced entry and the total are read and written in one
+                # transaction, in case other processes write to the cache too.
+                con.execute("BEGIN IMMEDIATE;")
+                row = con.execute("SELECT size FROM responses WHERE key == (?);", (key,)).fetchone()
+                con.execute("""
+                    INSERT OR REPLACE INTO responses (key, status_code, body, size, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, (key, status_code, body, len(body), now, now))
+                self._add_to_total_size(con, len(body) - (row[0] if row else 0))
+
+                if self.max_size_bytes is not None:
+                    self._evict(con)
+
+    @staticmethod
+    def _add_to_total_size(con, size):
+        con.execute("UPDATE cache_size SET total_size = total_size + (?) WHERE id = 0;", (size,))
+
+    def total_size(self):
+        """Returns: the total size of the cached bodies, in bytes."""
+        with closing(self.connection) as con:
+            return con.execute("SELECT total_size FROM cache_size WHERE id = 0;").fetchone()[0]
+
+    def _evict(self, con):
+        total_size = con.execute("SELECT total_size FROM cache_size WHERE id = 0;").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        # Only the least recently used entries are read, from the index, until enough are found.
+        evicted_keys = []
+        evicted_size = 0
+        with closing(con.execute("SELECT key, size FROM responses ORDER BY last_access ASC;")) as cursor:
+            for key, size in cursor:
+                if total_size - evicted_size <= self.max_size_bytes:
+                    break
+                evicted_keys.append((key,))
+                evicted_size += size
+        con.executemany("DELETE FROM responses WHERE key == (?);", evicted_keys)
+        self._add_to_total_size(con, -evicted_size)
+
+    def clear(self):
+        with self._lock, closing(self.connection) as con:
+            with con:
+                con.execute("DELETE FROM responses;")
+                con.execute("UPDATE cache_size SET total_size = 0 WHERE id = 0;")
@@ -13,6 +13,9 @@ CREATE TABLE nodes(
     id INTEGER PRIMARY KEY
 );
 
+-- Entities are looked up by name on every query and every ingested row.
+CREATE INDEX nodes_name_idx ON nodes(name);
+
 -- TODO: add constraints about node type (probably in a trigger function)
 CREATE TABLE edges(
     source  int NOT NULL REFERENCES nodes(id),
@@ -24,16 +27,28 @@ CREATE TABLE edges(
 
 CREATE TABLE artists(
     node_id                 int PRIMARY KEY REFERENCES nodes(id) NOT NULL,
-    num_spotify_followers   int
+    num_spotify_followers   int,
+    -- e.g. "1uNFoZAHBGtllmzznpCI3s"; used to refresh metadata in bulk
+    spotify_id              varchar(22)
 );
 
+CREATE INDEX artists_spotify_id_idx ON artists(spotify_id);
+
 CREATE TABLE songs(
     main_artist_id  int REFERENCES artists(node_id) NOT NULL,
     popularity      int CHECK ((popularity >= 0 AND popularity <= 100) OR popularity = NULL),
     duration_ms     int,
-    node_id         int REFERENCES nodes(id) NOT NULL
+    node_id         int REFERENCES nodes(id) NOT NULL,
+    spotify_id      varchar(22)
 );
 
+CREATE INDEX songs_spotify_id_idx ON songs(spotify_id);
+-- Songs are looked up by node, e.g. to tell whether a name is a song's.
+CREATE INDEX songs_node_id_idx ON songs(node_id);
+
 CREATE TABLE genres(
     node_id int REFERENCES nodes(id) NOT NULL
 );
+
+-- The entity changelog and its triggers are in entity_changelog.sql, which is
+-- run after this script, and by scripts/migrate_db.py on existing DBs.
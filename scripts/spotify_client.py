@@ -1,8 +1,14 @@
 import requests
 from base64 import b64encode
+import json
 import pprint
 import sys
 
+from scripts.response_cache import CachedResponse, ResponseCache
+
+# Maximum number of IDs accepted by Spotify's "several artists" and "several tracks" endpoints.
+MAX_IDS_PER_REQUEST = 50
+
 class SpotifyClient():
     """A simple object for interacting with Spotify's public web API.
 
@@ -17,12 +23,17 @@ class SpotifyClient():
     This client class strives to print helpful error messages when problems occur.
     This is why square bracket notation is used -- instead of .get() -- for accessing fields
     in Spotify's API objects: if the fields are not found, the error message should be quite clear.
+
+    If a ResponseCache is given, successful responses are stored in it and repeated requests are
+    served from disk. In the cache's offline mode, requests that miss the cache fail with HTTP 504
+    instead of going to the network.
     """
 
-    def __init__(self, client_id, secret_key):
+    def __init__(self, client_id, secret_key, cache=None):
         self.client_id = client_id
         self.secret_key = secret_key
         self.api_base = "https://api.spotify.com"
+        self.cache = cache
 
     @property
     def token(self):
@@ -69,6 +80,33 @@ class SpotifyClient():
 
         return headers
 
+    def _get(self, path, params=None):
+        """Sends a GET request to the Spotify web API, going through the response cache if there is one.
+
+        Params:
+            path (string): e.g. "/v1/search".
+            params (dict): query parameters.
+
+        Returns:
+            (requests.Response or CachedResponse): has `status_code` and `json()`.
+        """
+        url = self.api_base + path
+        if self.cache is None:
+            return requests.get(url, params=params, headers=self.set_token_in_auth_header(dict()))
+
+        key = ResponseCache.make_key("GET", url, params)
+        cached_resp = self.cache.get(key)
+        if cached_resp is not None:
+            return cached_resp
+
+        if self.cache.offline:
+            return CachedResponse(504, json.dumps(dict(error="offline mode: '{}' is not cached".format(key))).encode("UTF-8"))
+
+        resp = requests.get(url, params=params, headers=self.set_token_in_auth_header(dict()))
+        if resp.status_code == 200:
+            self.cache.put(key, resp.status_code, resp.content)
+        return resp
+
     def get_related_artists(self, artist_ID):
         """Retrieves metadata of artists related to the specified artist.
 
@@ -82,11 +120,7 @@ class SpotifyClient():
             related_artists (dict): key is ID of related artists, val is their metadata packaged in a dict.
                 None if an error occurs.
         """
-        headers = self.set_token_in_auth_header(dict())
-        resp = requests.get(
-            self.api_base + "/v1/artists/{}/related-artists".format(artist_ID),
-            headers=headers,
-        )
+        resp = self._get("/v1/artists/{}/related-artists".format(artist_ID))
 
         try:
             body = resp.json()
@@ -125,12 +159,7 @@ class SpotifyClient():
                 }
         """
         params = dict(q=artist, type="artist")
-        headers = self.set_token_in_auth_header(dict())
-        resp = requests.get(
-            self.api_base + "/v1/search",
-            params=params,
-            headers=headers,
-        )
+        resp = self._get("/v1/search", params=params)
 
         try:
             body = resp.json()
@@ -163,13 +192,8 @@ class SpotifyClient():
         Returns:
             top_songs (dict): key is song name, val is its metadata packaged in a dict. None if an error occurs.
         """
-        headers = self.set_token_in_auth_header(dict())
         params = dict(country=country_iso_code)
-        resp = requests.get(
-            self.api_base + "/v1/artists/{}/top-tracks".format(artist_ID),
-            headers=headers,
-            params=params,
-        )
+        resp = self._get("/v1/artists/{}/top-tracks".format(artist_ID), params=params)
 
         try:
             body = resp.json()
@@ -196,3 +220,85 @@ class SpotifyClient():
             )
         return top_songs
 
+    def get_several_artists(self, artist_IDs):
+        """Retrieves summary data for many artists, using one request per 50 artists.
+
+        Params:
+            artist_IDs (iterable of strings): Spotify IDs, e.g. ["1uNFoZAHBGtllmzznpCI3s", ...]
+
+        Returns:
+            (dict): key is artist ID, in the order given, val is dict with keys: name, num_followers,
+                genres; or None for IDs that Spotify does not know, or whose request failed.
+                e.g. {
+                    "1uNFoZAHBGtllmzznpCI3s": dict(
+                        name="Justin Bieber",
+                        num_followers=25683438,
+                        genres=["canadian pop", "dance pop", "pop", "post-teen pop"],
+                    ),
+                    "0000000000000000000000": None,
+                    ...
+                }
+        """
+        artists = dict.fromkeys(artist_IDs)
+        for chunk in _chunks(list(artists), MAX_IDS_PER_REQUEST):
+            body = self._get_several("/v1/artists", chunk, "artists")
+            # Spotify returns the artists in the order of the IDs, with null for unknown IDs.
+            for artist_ID, artist in zip(chunk, body.get("artists", []) if body else []):
+                if artist is None:
+                    continue
+                artists[artist_ID] = dict(
+                    name=artist["name"],
+                    num_followers=int(artist["followers"]["total"]),
+                    genres=artist["genres"],
+                )
+        return artists
+
+    def get_several_tracks(self, track_IDs):
+        """Retrieves metadata for many songs, using one request per 50 songs.
+
+        Params:
+            track_IDs (iterable of strings): Spotify IDs, e.g. ["6ohzjop0VYBRZ12ichlwg5", ...]
+
+        Returns:
+            (dict): key is song ID, in the order given, val is dict with keys: name, duration_ms,
+                popularity, uri; or None for IDs that Spotify does not know, or whose request failed.
+        """
+        tracks = dict.fromkeys(track_IDs)
+        for chunk in _chunks(list(tracks), MAX_IDS_PER_REQUEST):
+            body = self._get_several("/v1/tracks", chunk, "tracks")
+            # Spotify returns the tracks in the order of the IDs, with null for unknown IDs.
+            for track_ID, track in zip(chunk, body.get("tracks", []) if body else []):
+                if track is None:
+                    continue
+                tracks[track_ID] = dict(
+                    name=track["name"],
+                    duration_ms=int(track["duration_ms"]),
+                    popularity=int(track["popularity"]),
+                    uri=track["uri"],
+                )
+        return tracks
+
+    def _get_several(self, path, IDs, entity_description):
+        """Requests one chunk of IDs from a "several entities" endpoint.
+
+        Returns:
+            (dict): parsed response body. None if an error occurs.
+        """
+        resp = self._get(path, params=dict(ids=",".join(IDs)))
+
+        try:
+            body = resp.json()
+        except Exception as e:
+            print("ERROR: Could not parse response body of request for {} {} ".format(len(IDs), entity_description))
+            return None
+
+        if resp.status_code != 200:
+            print("ERROR: Request for {} {} failed. Received HTTP code:{}".format(len(IDs), entity_description, resp.status_code))
+            print(body)
+            return None
+        return body
+
+
+def _chunks(items, size):
+    """Splits the given list into lists of at most `size` items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -1,12 +1,18 @@
+import atexit
+import glob
 import os
 import pprint
-import subprocess
+import shutil
+import sqlite3
 import sys
+import tempfile
+from argparse import ArgumentParser
+from contextlib import closing
 
 sys.path.append('../')  # if running this script from 'scripts/' directory
 sys.path.append('.')  # if running this script from project root
 sys.path.append('./scripts')  # if running this script from project root
-from knowledge_base.api import KnowledgeBaseAPI
+from scripts.ingestion_pipeline import IngestionPipeline
 from scripts.spotify_client import SpotifyClient
 
 pp = pprint.PrettyPrinter(
@@ -17,185 +23,155 @@ pp = pprint.PrettyPrinter(
 
 TEST_DB_NAME = "test.db"
 SCHEMA_FILE_NAME = "schema.sql"
+ENTITY_CHANGELOG_FILE_NAME = "entity_changelog.sql"
 TEST_DATA_FILE_NAME = "test_data.sql"
 
+# SQL scripts are found relative to this module, wherever it is invoked from.
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def exec_sql_script(db_path, path_to_sql_file, DB_name: str = None):
-    """Equivalent to running the following command in terminal:
+# Template DBs are built once per process, then cloned for every test.
+# key: tuple of SQL script names, val: path to template .db file.
+_templates = dict()
+_tmp_dir = None
+
+
+def exec_sql_script(db_path, path_to_sql_file):
+    """Runs the given SQL script against the DB at db_path (creating it if dne).
+
+    Equivalent to running the following command in terminal, but in-process:
         $ sqlite3 path_to_test_db_file < schema_file.sql
 
     Params:
-        path_prefix (string): specifies directory to test db (creating it if dne).
+        db_path (string): path to db file.
         path_to_sql_file (string): path to sql script.
     """
     with open(path_to_sql_file) as f:
-        subprocess.run(["sqlite3", db_path], stdin=f)
+        script = f.read()
 
+    with closing(sqlite3.connect(db_path)) as con:
+        con.executescript(script)
+        con.commit()
 
-def create_and_populate_db(path: str = None):
-    """Creates and fills sqlite database, saving .db file to 'tests/'
-   directory, unless another path is specified.
 
-   Tries to find SQL scripts depending on where this module is invoked from.
+def create_and_populate_db(path: str = None):
+    """Creates a sqlite database from the schema and fills it with the test data.
 
-   Returns:
-       (string): (relative) path to newly created .db file.
-   """
-    test_db_path_prefix, scripts_path_prefix = _get_path_prefixes()
-    db_path = path or (test_db_path_prefix + TEST_DB_NAME)
+    Unless a path is specified, the .db file gets a new, unique path in a temporary
+    directory, so that tests do not share a DB file and may run in parallel.
 
-    exec_sql_script(db_path, scripts_path_prefix + SCHEMA_FILE_NAME)
-    exec_sql_script(db_path, scripts_path_prefix + TEST_DATA_FILE_NAME)
-    return db_path
+    Returns:
+        (string): path to newly created .db file.
+    """
+    return _clone_template([SCHEMA_FILE_NAME, ENTITY_CHANGELOG_FILE_NAME, TEST_DATA_FILE_NAME], path)
 
 
 def create_db(path: str = None):
-    """Creates sqlite db file, saving it to 'tests/' directory.
+    """Creates an empty sqlite database from the schema.
+
+    Unless a path is specified, the .db file gets a new, unique path in a temporary directory.
+
+    Returns:
+        (string): path to newly created .db file.
+    """
+    return _clone_template([SCHEMA_FILE_NAME, ENTITY_CHANGELOG_FILE_NAME], path)
 
-    NOTE: copy+paste (near) duplicate of create_and_populate_db.
 
-    Tries to find SQL scripts depending on where this module is invoked from.
+def remove_db(db_path: str = None):
+    """Deletes the given DB file, along with the parser artifacts, entity table and graph snapshot
+    compiled for it.
 
     Returns:
-        (string): (relative) path to newly created .db file.
+        (bool): True if the file was removed, False otherwise.
     """
-    test_db_path_prefix, scripts_path_prefix = _get_path_prefixes()
-    db_path = path or (test_db_path_prefix + TEST_DB_NAME)
+    if db_path is None:
+        print("ERROR: No DB path given for removal.")
+        return False
+
+    try:
+        os.remove(db_path)
+        for artifacts_path in (glob.glob(glob.escape(db_path) + ".*.artifacts")
+                               + glob.glob(glob.escape(db_path) + ".entities")
+                               + glob.glob(glob.escape(db_path) + ".graph")):
+            os.remove(artifacts_path)
+    except OSError as e:
+        print("ERROR: Could not remove DB '{}': {}".format(db_path, str(e)))
+        return False
+    return True
+
+
+def _clone_template(sql_file_names, path=None):
+    """Copies the template DB built from the given SQL scripts to path (or to a new unique path).
+
+    The template is built on first use; after that, creating a DB is a page-level copy
+    through SQLite's backup API, rather than a re-run of the SQL scripts.
+    """
+    template_path = _get_template(tuple(sql_file_names))
+    db_path = path or _new_db_path()
 
-    exec_sql_script(db_path, scripts_path_prefix + SCHEMA_FILE_NAME)
-    return db_path
+    if not hasattr(sqlite3.Connection, "backup"):
+        # The backup API is only exposed from Python 3.7 on.
+        shutil.copyfile(template_path, db_path)
+        return db_path
 
+    with closing(sqlite3.connect(template_path)) as src, closing(sqlite3.connect(db_path)) as dst:
+        src.backup(dst)
+    return db_path
 
-def _get_path_prefixes():
-    # Used for adjusting path based on where the script is run from.
-    cur_dir = os.getcwd().split("/")[-1]
 
-    # From tests folder in project root dir
-    if cur_dir == "tests":
-        test_db_path_prefix = ""
-        scripts_path_prefix = "../scripts/"
+def _get_template(sql_file_names):
+    template_path = _templates.get(sql_file_names)
+    if template_path is None:
+        template_path = _new_db_path()
+        for sql_file_name in sql_file_names:
+            exec_sql_script(template_path, os.path.join(SCRIPTS_DIR, sql_file_name))
+        _templates[sql_file_names] = template_path
+    return template_path
 
-    # From scripts folder in project root dir
-    elif cur_dir == "scripts":
-        test_db_path_prefix = "../tests/"
-        scripts_path_prefix = ""
 
-    # From project root dir
-    else:
-        test_db_path_prefix = "tests/"
-        scripts_path_prefix = "scripts/"
-    return test_db_path_prefix, scripts_path_prefix
+def _new_db_path():
+    global _tmp_dir
+    if _tmp_dir is None:
+        _tmp_dir = tempfile.mkdtemp(prefix="music_kb_test_")
+        atexit.register(shutil.rmtree, _tmp_dir, True)
 
+    fd, db_path = tempfile.mkstemp(suffix=".db", dir=_tmp_dir)
+    os.close(fd)
+    return db_path
 
-def remove_db():
-    "Returns True if command succeeded, False otherwise."
-    test_db_path, _ = _get_path_prefixes()
-    return subprocess.run(["rm", test_db_path + TEST_DB_NAME]).returncode == 0
 
+def create_and_populate_db_with_spotify(spotify_client_id, spotify_secret_key, artists, path=None, cache=None):
+    """Creates a new DB and streams Spotify data for the given artists into it.
 
-def get_artist_data(spotify, artists):
-    """
     Params:
-        spotify (SpotifyClient): for making requests to Spotify web API.
         artists (iterable): each element is an artist name.
             (e.g. list of strings, file with artist names on each line)
+        cache (ResponseCache): if given, Spotify responses are served from / saved to it.
 
     Returns:
-        artist_data (dict): key is artist name, value is a dict containing artist metadata.
-            e.g. {
-                "Justin Bieber": {
-                    id=1uNFoZAHBGtllmzznpCI3s,
-                    num_followers=25683438,
-                    genres=["canadian pop", "dance pop", "pop", "post-teen pop"]
-                }
-                ...
-            }
-    """
-    artist_data = dict()
-    for tmp_artist_name in artists:
-        tmp_artist_name = tmp_artist_name.strip()
-        data = spotify.get_artist_data(tmp_artist_name)
-        if data is not None:
-            artist_data[tmp_artist_name] = data
-    return artist_data
-
-
-def get_artist_metadata(spotify, artist_names):
-    """Fetches metadata for each artists specified in stdin.
-
-    Returns:
-        full_artist_metadata (dict): key is artist name, val is dict with:
-            Spotify ID, genres, number of Spotify followers, related artists, and songs.
-
-    e.g. {
-        "Raveena": {
-            'ID': '2kQnsbKnIiMahOetwlfcaS',
-            'genres': ['indie r&b'],
-            'num_followers': 19191,
-            'related_artists': {
-                'Alextbh': {
-                    'ID': '0kXDB5aeESWj5BD9TCLkMu',
-                    'genres': ['indie r&b', 'malaysian indie'],
-                    'num_followers': 19517
-                },
-                ...
-            },
-            'songs': {
-                'Honey': {
-                    'duration_ms': 272331,
-                    'id': '6ohzjop0VYBRZ12ichlwg5',
-                    'popularity': 60,
-                    'uri': 'spotify:track:6ohzjop0VYBRZ12ichlwg5'
-                },
-                ...
-            }
-        }
-        ...
-
+        (string): (relative) path to newly created .db file.
     """
-    artist_summaries = get_artist_data(spotify, artist_names)
-    full_artist_metadata = dict()
-    for artist, artist_summary in artist_summaries.items():
-        full_artist_metadata[artist] = dict(
-            ID=artist_summary["id"],
-            num_followers=artist_summary["num_followers"],
-            genres=artist_summary["genres"],
-            related_artists=spotify.get_related_artists(artist_summary["id"]),
-            songs=spotify.get_top_songs(artist_summary["id"], "CA")
-        )
-    return full_artist_metadata
-
-
-def create_and_populate_db_with_spotify(spotify_client_id, spotify_secret_key, artists, path=None):
     path_to_db = create_db(path=path)
-    artist_metadata = get_artist_metadata(SpotifyClient(spotify_client_id, spotify_secret_key), artists)
-    kb_api = KnowledgeBaseAPI(path_to_db)
-    for artist_name, artist_info in artist_metadata.items():
-        kb_api.add_artist(artist_name, artist_info["genres"], artist_info["num_followers"])
-
-        for song_name, song_info in artist_info["songs"].items():
-            kb_api.add_song(
-                song_name,
-                artist_name,
-                song_info["popularity"],
-                song_info["duration_ms"],
-            )
-
-        for rel_artist_name, rel_artist_info in artist_info["related_artists"].items():
-            kb_api.add_artist(rel_artist_name, rel_artist_info["genres"], rel_artist_info["num_followers"])
-            kb_api.connect_entities(artist_name, rel_artist_name, "similar to", 100)
-            kb_api.connect_entities(rel_artist_name, artist_name, "similar to", 100)
+    pipeline = IngestionPipeline(SpotifyClient(spotify_client_id, spotify_secret_key, cache=cache), path_to_db)
+    stats = pipeline.run(artists)
+    print("Ingestion finished: {}".format(stats))
     return path_to_db
 
 
 def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", type=str, dest="db_path", default=os.path.join("tests", TEST_DB_NAME),
+                        help=" Where to write the DB, (include the filename). "
+                             "Default: {}".format(os.path.join("tests", TEST_DB_NAME)))
+    args = parser.parse_args()
+
     print("Enter Spotify client ID:")
     spotify_client_id = sys.stdin.readline().split(" ")[-1].strip("\n")
     print("Enter Spotify secret key:")
     spotify_secret_key = sys.stdin.readline().split(" ")[-1].strip("\n")
 
     print("Enter names of artists, separated by new-lines:")
-    create_and_populate_db_with_spotify(spotify_client_id, spotify_secret_key, sys.stdin)
+    db_path = create_and_populate_db_with_spotify(spotify_client_id, spotify_secret_key, sys.stdin, path=args.db_path)
+    print("Wrote DB to {}".format(db_path))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from knowledge_base import api
+from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.async_api import AsyncKnowledgeBaseAPI, _ThreadKnowledgeBaseAPI
+from scripts import test_db_utils
+
+
+class TestAsyncKnowledgeBaseAPI(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.kb_api = KnowledgeBaseAPI(self.DB_path)
+        self.async_api = AsyncKnowledgeBaseAPI(self.DB_path, max_workers=2)
+
+    def tearDown(self):
+        self.async_api.close()
+        test_db_utils.remove_db(self.DB_path)
+
+    def _run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def _block_calls(self, method_name):
+        """Makes the thread KnowledgeBaseAPIs' method wait until the returned event is set.
+
+        Returns:
+            (tuple): the event, and the list of arguments of the calls that started.
+        """
+        release = threading.Event()
+        started = []
+        method = getattr(api.KnowledgeBaseAPI, method_name)
+
+        def blocked(kb_api, *args, **kwargs):
+            started.append(args)
+            release.wait(5)
+            return method(kb_api, *args, **kwargs)
+
+        setattr(_ThreadKnowledgeBaseAPI, method_name, blocked)
+        self.addCleanup(delattr, _ThreadKnowledgeBaseAPI, method_name)
+        return release, started
+
+    def test_same_results(self):
+        async def lookups():
+            return await asyncio.gather(
+                self.async_api.get_related_entities("Justin Bieber"),
+                self.async_api.get_song_data("Despacito"),
+                self.async_api.get_songs_by_artist("Justin Bieber"),
+                self.async_api.get_related_entities_many(["Justin Bieber", "Justin Timberlake"]),
+                self.async_api.get_node_ids_by_entity_type("Justin Bieber"),
+            )
+
+        self.assertEqual(self._run(lookups()), [
+            self.kb_api.get_related_entities("Justin Bieber"),
+            self.kb_api.get_song_data("Despacito"),
+            self.kb_api.get_songs_by_artist("Justin Bieber"),
+            self.kb_api.get_related_entities_many(["Justin Bieber", "Justin Timberlake"]),
+            self.kb_api.get_node_ids_by_entity_type("Justin Bieber"),
+        ])
+
+    def test_writes(self):
+        async def add():
+            return await self.async_api.add_artist("Heart")
+
+        self.assertIsNotNone(self._run(add()))
+        self.assertIn("artist", self.kb_api.get_node_ids_by_entity_type("Heart"))
+
+    def test_coalesces_identical_reads(self):
+        release, started = self._block_calls("get_related_entities")
+
+        async def lookups():
+            calls = [asyncio.ensure_future(self.async_api.get_related_entities(name))
+                     for name in ["Justin Bieber", "Justin Bieber", "Justin Bieber", "Shawn Mendes"]]
+            await asyncio.sleep(0.1)
+            release.set()
+            return await asyncio.gather(*calls)
+
+        results = self._run(lookups())
+        self.assertEqual(sorted(started), [("Justin Bieber",), ("Shawn Mendes",)])
+        self.assertEqual(results[0], self.kb_api.get_related_entities("Justin Bieber"))
+        self.assertEqual(results[0], results[1])
+        self.assertIsNot(results[0], results[1], "Expected each caller to get its own copy.")
+
+    def test_timeout(self):
+        release, started = self._block_calls("get_song_data")
+
+        async def lookups():
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.async_api.get_song_data("Despacito", timeout_seconds=0.05)
+            release.set()
+            # Later calls are not affected.
+            return await self.async_api.get_related_entities("Justin Bieber")
+
+        self.assertEqual(self._run(lookups()), self.kb_api.get_related_entities("Justin Bieber"))
+
+    def test_cancellation_interrupts_query(self):
+        # A query that runs until it is interrupted.
+        def slow_query(kb_api):
+            con = kb_api.connection
+            try:
+                return con.execute("""
+                    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+                    SELECT COUNT(*) FROM n;
+                """).fetchone()
+            except Exception as e:
+                return e
+            finally:
+                con.close()
+
+        _ThreadKnowledgeBaseAPI.get_spotify_ids = slow_query
+        self.addCleanup(delattr, _ThreadKnowledgeBaseAPI, "get_spotify_ids")
+
+        async def cancel():
+            call = asyncio.ensure_future(self.async_api.get_spotify_ids())
+            await asyncio.sleep(0.1)
+            in_flight = list(self.async_api._reads_in_flight.values())
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+            start = time.time()
+            while in_flight[0].kb_api is not None and time.time() - start < 5:
+                await asyncio.sleep(0.01)
+            return in_flight[0].kb_api
+
+        self.assertIsNone(self._run(cancel()), "Expected the query to be interrupted.")
+
+    def test_closed(self):
+        self.async_api.close()
+        with self.assertRaises(RuntimeError):
+            self._run(self.async_api.get_related_entities("Justin Bieber"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+
+from controller.system_entry import SystemEntry
+from player_adaptor.recording_adaptor import RecordingController
+from scripts import test_db_utils
+
+
+class TestBatchProcessing(unittest.TestCase):
+    utterances = [
+        "play justin bieber",
+        "who are artists like justin bieber",
+        "play some songs like despacito",
+        "Play some songs like Despacito",
+        "play songs by U2",
+        "who is the artist of despacito",
+        "blah",
+        "hello",
+        "skip",
+    ]
+
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.player_controller = RecordingController()
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def _check_matches_single_calls(self, parser_type):
+        system_entry = SystemEntry(db_path=self.DB_path,
+                                   player_controller=self.player_controller,
+                                   parser_type=parser_type)
+        expected_actions = []
+        for utterance in self.utterances:
+            system_entry(utterance)
+            expected_actions.append(self.player_controller.take_actions())
+
+        results = system_entry.process_batch(self.utterances)
+        self.assertEqual([r["utterance"] for r in results], self.utterances)
+        self.assertEqual([r["actions"] for r in results], expected_actions)
+        # The player controller performed the actions of the batch too.
+        self.assertEqual(self.player_controller.take_actions(), [a for actions in expected_actions for a in actions])
+        return results
+
+    def test_bag_of_words(self):
+        results = self._check_matches_single_calls("BagOfWords")
+        self.assertEqual(results[0]["parse"], (["Justin Bieber"], ["control_play"], ""))
+        self.assertTrue(all(r["error"] is None for r in results))
+
+    def test_tree(self):
+        results = self._check_matches_single_calls("TREE")
+        failed = [r["utterance"] for r in results if r["error"] is not None]
+        self.assertEqual(failed, ["blah"], "Expected errors to be reported per utterance.")
+        self.assertEqual(results[6]["parse"], None)
+        self.assertEqual(results[6]["actions"], [("respond", "I'm sorry, I don't understand.")])
+
+    def test_workers(self):
+        system_entry = SystemEntry(db_path=self.DB_path,
+                                   player_controller=self.player_controller)
+        results = system_entry.process_batch(self.utterances, workers=2)
+        self.assertEqual([r["actions"] for r in results],
+                         [r["actions"] for r in system_entry.process_batch(self.utterances)])
+
+    def test_worker_pool(self):
+        system_entry = SystemEntry(db_path=self.DB_path,
+                                   player_controller=self.player_controller)
+        expected_actions = [r["actions"] for r in system_entry.process_batch(self.utterances)]
+        with system_entry.worker_pool(2) as executor:
+            with mock.patch.object(system_entry, "worker_pool", side_effect=AssertionError("Started new workers.")):
+                for _ in range(2):
+                    results = system_entry.process_batch(self.utterances, workers=2, executor=executor)
+                    self.assertEqual([r["actions"] for r in results], expected_actions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+from controller.system_entry import SystemEntry
+from scripts import test_db_utils
+from view.cli import read_utterances, run_batch
+
+
+class TestCliBatch(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.tmp_dir, "utterances.txt")
+        self.output_path = os.path.join(self.tmp_dir, "results.jsonl")
+        with open(self.input_path, "w") as f:
+            f.write("play justin bieber\n\nblah\n{\"utterance\": \"who are artists like justin bieber\"}\n")
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+        shutil.rmtree(self.tmp_dir)
+
+    def _run_batch(self, parser_type, workers=1):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            run_batch(self.DB_path, parser_type, self.input_path, self.output_path, batch_size=2, workers=workers)
+        with open(self.output_path) as f:
+            results = [json.loads(line) for line in f]
+        return results, stderr.getvalue()
+
+    def test_read_utterances(self):
+        self.assertEqual(list(read_utterances(["play U2\n", " \n", '{"utterance": "stop"}\n', "{not json\n"])),
+                         ["play U2", "stop", "{not json"])
+
+    def test_bag_of_words(self):
+        results, summary = self._run_batch("BagOfWords")
+        self.assertEqual([r["utterance"] for r in results],
+                         ["play justin bieber", "blah", "who are artists like justin bieber"])
+        self.assertEqual(results[0]["entities"], ["Justin Bieber"])
+        self.assertEqual(results[0]["intents"], ["control_play"])
+        self.assertEqual(results[0]["actions"], [["play", ["Justin Bieber"]]])
+        self.assertEqual(results[1]["response"], ["I'm sorry, I don't understand."])
+        self.assertIn("Processed 3 utterances (0 errors)", summary)
+
+    def test_tree(self):
+        results, summary = self._run_batch("TREE")
+        self.assertEqual(results[0]["tree"], "(Root (Terminal_Command control_play) (Result (Entity Justin Bieber)))")
+        self.assertIsNotNone(results[1]["error"])
+        self.assertIn("Shawn Mendes", results[2]["response"][0])
+        self.assertIn("Processed 3 utterances (1 errors)", summary)
+
+    def test_workers(self):
+        expected, _ = self._run_batch("BagOfWords")
+        with mock.patch.object(SystemEntry, "worker_pool", autospec=True,
+                               side_effect=SystemEntry.worker_pool) as worker_pool:
+            results, summary = self._run_batch("BagOfWords", workers=2)
+        self.assertEqual(worker_pool.call_count, 1, "Expected the workers to be reused across batches.")
+        self.assertEqual([r["actions"] for r in results], [r["actions"] for r in expected])
+        self.assertIn("Processed 3 utterances (0 errors)", summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
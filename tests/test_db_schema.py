@@ -8,12 +8,12 @@ import unittest
 class TestDbSchema(unittest.TestCase):
     @classmethod
     def setUpClass(self):
-        DB_path = test_db_utils.create_and_populate_db()
-        self.kb_api = KnowledgeBaseAPI(dbName=DB_path)
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.kb_api = KnowledgeBaseAPI(dbName=self.DB_path)
 
     @classmethod
     def tearDownClass(self):
-        test_db_utils.remove_db()
+        test_db_utils.remove_db(self.DB_path)
 
     def test_rejects_unknown_entity(self):
         res = self.kb_api.connect_entities("Unknown Entity", "Justin Timberlake", "similar to", 0)
@@ -70,5 +70,21 @@ class TestDbSchema(unittest.TestCase):
         self.assertEqual(node_id, None,
             "Expected 'None' value for entity type to be rejected.")
 
+    def test_synthetic_db_changelog(self):
+        from scripts.generate_synthetic_db import generate
+        db_path = test_db_utils._new_db_path()
+        try:
+            generate(db_path, num_artists=20, songs_per_artist=2, num_genres=5)
+            kb_api = KnowledgeBaseAPI(dbName=db_path)
+            self.assertEqual(kb_api.get_entity_changelog_seq(), 0,
+                "Expected the generated entities not to be recorded as changes.")
+
+            kb_api.add_artist("Heart")
+            self.assertEqual([(change.op, change.name) for change in kb_api.get_entity_changes()],
+                             [("insert", "Heart")],
+                "Expected the changelog triggers to be restored after the bulk insert.")
+        finally:
+            test_db_utils.remove_db(db_path)
+
 if __name__ == '__main__':
     unittest.main()
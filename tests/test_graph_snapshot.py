@@ -0,0 +1,85 @@
+import sqlite3
+import unittest
+from contextlib import closing
+
+import numpy as np
+
+from controller.system_entry import SystemEntry
+from knowledge_base import graph_snapshot
+from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.graph_snapshot import GraphSnapshot, SnapshotKnowledgeBase
+from scripts import test_db_utils
+from tests.mock_objects import MockController
+
+
+class TestGraphSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.kb_api = KnowledgeBaseAPI(self.DB_path)
+        # A song with the same name as an artist, with edges of its own.
+        self.song_id = self.kb_api.add_song("U2", "U2")
+        self._add_edge(self.song_id, 20, "of genre")
+        self.path = graph_snapshot.export(self.DB_path, self.kb_api)
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def _add_edge(self, source, dest, rel_str):
+        # connect_entities refuses names shared by several nodes.
+        with closing(sqlite3.connect(self.DB_path)) as con:
+            with con:
+                con.execute("INSERT INTO edges (source, dest, rel, score) VALUES (?, ?, ?, 100);",
+                            (source, dest, rel_str))
+
+    def test_layout(self):
+        snapshot = GraphSnapshot(self.path)
+        self.assertEqual(snapshot.num_nodes, 12)
+        self.assertEqual(snapshot.node_indices("Justin Bieber"), [0])
+        self.assertEqual([snapshot.node_type(i) for i in snapshot.node_indices("U2")], ["artist", "song"])
+        self.assertEqual(snapshot.name(snapshot.node_indices("Despacito")[0]), "Despacito")
+        self.assertEqual(snapshot.node_indices("Nobody"), [])
+
+        neighbours, scores = snapshot.neighbours(0, "similar to")
+        self.assertEqual([snapshot.node_id(i) for i in neighbours], [2, 4])
+        self.assertEqual(scores.dtype, np.float32)
+        self.assertEqual(scores.tolist(), [75.0, 100.0])
+        self.assertIsInstance(snapshot._neighbours, np.ndarray)
+        self.assertFalse(snapshot._neighbours.flags.writeable)
+
+    def test_same_results_as_kb(self):
+        snapshot = graph_snapshot.load(self.DB_path, self.kb_api)
+        self.assertIsNotNone(snapshot)
+        names = ["Justin Bieber", "Justin Timberlake", "U2", "Despacito", "Pop", "Nobody", ""]
+        for rel_str in ["similar to", "of genre", "other relation", "unknown relation"]:
+            for name in names:
+                self.assertEqual(snapshot.get_related_entities(name, rel_str),
+                                 self.kb_api.get_related_entities(name, rel_str),
+                                 "Expected the same entities related to '{}' by '{}'.".format(name, rel_str))
+            self.assertEqual(snapshot.get_related_entities_many(names, rel_str),
+                             self.kb_api.get_related_entities_many(names, rel_str))
+
+    def test_stale(self):
+        kb = SnapshotKnowledgeBase(self.kb_api)
+        self.assertIsNotNone(kb.snapshot)
+        self._add_edge(4, self.song_id, "similar to")
+        self.assertIsNone(graph_snapshot.load(self.DB_path, self.kb_api))
+        self.assertIsNone(kb.snapshot, "Expected a snapshot older than the DB not to be used.")
+        self.assertEqual(kb.get_related_entities("Shawn Mendes"), ["U2"])
+
+        # Until it is exported again.
+        graph_snapshot.export(self.DB_path, self.kb_api)
+        self.assertIsNotNone(kb.snapshot)
+        self.assertEqual(kb.get_related_entities("Shawn Mendes"), ["U2"])
+
+    def test_system_entry(self):
+        results_dict = {'respond': None}
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=MockController(results_dict),
+                                   parser_type="TREE", graph_snapshot_path=self.path)
+        self.assertIsNotNone(system_entry.eval_engine.kb_api.snapshot)
+        system_entry('who are artists like justin bieber')
+        self.assertIn('Justin Timberlake', results_dict['respond'])
+        self.assertIn('Shawn Mendes', results_dict['respond'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import sqlite3
+import unittest
+from contextlib import closing
+
+from controller.hot_reload import KnowledgeBaseWatcher
+from controller.system_entry import SystemEntry
+from knowledge_base.api import KnowledgeBaseAPI
+from player_adaptor.recording_adaptor import RecordingController
+from scripts import test_db_utils
+
+
+class TestHotReload(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.player_controller = RecordingController()
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def _execute(self, *statements):
+        """Writes to the DB as another process would, without going through a KnowledgeBaseAPI."""
+        with closing(sqlite3.connect(self.DB_path)) as con:
+            with con:
+                for statement in statements:
+                    con.execute(statement)
+
+    def _drop_changelog(self):
+        """Makes the DB one that predates the entity changelog."""
+        triggers = ["{}_{}_changelog".format(table, op)
+                    for table, op in [("artists", "insert"), ("artists", "delete"), ("songs", "insert"),
+                                      ("songs", "delete"), ("nodes", "rename")]]
+        self._execute(*["DROP TRIGGER {};".format(trigger) for trigger in triggers] + ["DROP TABLE entity_changelog;"])
+
+    def _add_artist(self, name):
+        self._execute("INSERT INTO nodes (name, type) VALUES ('{}', 'artist');".format(name),
+                      "INSERT INTO artists (node_id) SELECT id FROM nodes WHERE name = '{}';".format(name))
+
+    def _plays(self, system_entry, utterance, entity):
+        system_entry(utterance)
+        return ("play", [entity]) in self.player_controller.take_actions()
+
+    def _check_changes_of_other_processes(self, parser_type):
+        system_entry = SystemEntry(db_path=self.DB_path,
+                                   player_controller=self.player_controller,
+                                   parser_type=parser_type)
+        watcher = KnowledgeBaseWatcher(system_entry)
+        self.assertFalse(watcher.check(), "Expected no update while the DB is unchanged.")
+        parser = system_entry.parser
+        self.assertFalse(self._plays(system_entry, "play heart", "Heart"))
+
+        self._add_artist("Heart")
+        self.assertTrue(watcher.check())
+        self.assertIs(system_entry.parser, parser, "Expected the parser to be updated in place.")
+        self.assertTrue(self._plays(system_entry, "play heart", "Heart"))
+        self.assertFalse(watcher.check())
+
+        self._execute("DELETE FROM artists WHERE node_id IN (SELECT id FROM nodes WHERE name = 'Heart');")
+        self.assertTrue(watcher.check())
+        self.assertFalse(self._plays(system_entry, "play heart", "Heart"))
+        self.assertEqual(watcher.num_reloads, 2)
+        watcher.stop()
+
+    def test_bag_of_words(self):
+        self._check_changes_of_other_processes("BagOfWords")
+
+    def test_tree(self):
+        self._check_changes_of_other_processes("TREE")
+
+    def test_changes_of_this_process(self):
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=self.player_controller)
+        watcher = KnowledgeBaseWatcher(system_entry)
+        KnowledgeBaseAPI(self.DB_path).add_artist("Heart")
+        self.assertTrue(self._plays(system_entry, "play heart", "Heart"),
+                        "Expected writes of this process to be applied without a check.")
+        watcher.stop()
+
+    def test_reload_without_changelog(self):
+        self._drop_changelog()
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=self.player_controller)
+        watcher = KnowledgeBaseWatcher(system_entry)
+        old_parser = system_entry.parser
+
+        self._add_artist("Heart")
+        self.assertTrue(watcher.check())
+        self.assertIsNot(system_entry.parser, old_parser)
+        self.assertTrue(self._plays(system_entry, "play heart", "Heart"))
+
+        # The replaced parser keeps working for requests that still hold it.
+        self.assertNotIn("Heart", old_parser.entity_index)
+        system_entry._evaluate(old_parser, "play justin bieber")
+        self.assertEqual(self.player_controller.take_actions(), [("play", ["Justin Bieber"])])
+        watcher.stop()
+
+    def test_reload_after_pruned_changes(self):
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=self.player_controller)
+        watcher = KnowledgeBaseWatcher(system_entry)
+        old_parser = system_entry.parser
+
+        self._add_artist("Heart")
+        # Prunes the insertion of "Heart" from the changelog, before the watcher has read it.
+        self._execute("INSERT INTO entity_changelog(seq, op, name) VALUES (200000, 'insert', 'Unknown Entity');")
+        self.assertTrue(watcher.check())
+        self.assertIsNot(system_entry.parser, old_parser, "Expected the parser to be rebuilt.")
+        self.assertTrue(self._plays(system_entry, "play heart", "Heart"))
+
+        self._add_artist("Wilco")
+        self.assertTrue(watcher.check())
+        self.assertTrue(self._plays(system_entry, "play wilco", "Wilco"),
+                        "Expected the changes after the rebuild to be applied.")
+        watcher.stop()
+
+    def test_failed_reload_keeps_parser(self):
+        self._drop_changelog()
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=self.player_controller)
+        watcher = KnowledgeBaseWatcher(system_entry)
+        parser = system_entry.parser
+        self._add_artist("Heart")
+
+        build_parser = system_entry._build_parser
+        system_entry._build_parser = lambda: 1 / 0
+        self.assertFalse(watcher.check())
+        self.assertIs(system_entry.parser, parser)
+
+        system_entry._build_parser = build_parser
+        self.assertTrue(watcher.check(), "Expected the failed reload to be retried.")
+        watcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import threading
+import unittest
+from unittest import mock
+
+from knowledge_base.api import KnowledgeBaseAPI
+from scripts import test_db_utils
+from scripts.ingestion_pipeline import IngestionPipeline
+
+
+class FakeSpotifyClient:
+    """Serves canned responses in place of Spotify's web API."""
+
+    def __init__(self):
+        self.artists = {
+            "U2": dict(id="u2", num_followers=200, genres=["rock"]),
+            "Coldplay": dict(id="coldplay", num_followers=300, genres=["rock", "pop"]),
+        }
+        self.related_artists = {
+            "u2": {"Coldplay": dict(ID="coldplay", genres=["rock", "pop"], num_followers=300)},
+            "coldplay": {"U2": dict(ID="u2", genres=["rock"], num_followers=200)},
+        }
+        self.songs = {
+            "u2": {"One": dict(duration_ms=1000, id="one", popularity=80, uri="spotify:track:one")},
+            "coldplay": {"Yellow": dict(duration_ms=2000, id="yellow", popularity=90, uri="spotify:track:yellow")},
+        }
+
+    def get_artist_data(self, artist):
+        return self.artists.get(artist)
+
+    def get_related_artists(self, artist_ID):
+        return self.related_artists[artist_ID]
+
+    def get_top_songs(self, artist_ID, country_iso_code):
+        return self.songs[artist_ID]
+
+
+class TestIngestionPipeline(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_db()
+        self.kb_api = KnowledgeBaseAPI(self.DB_path)
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def test_run(self):
+        pipeline = IngestionPipeline(FakeSpotifyClient(), self.DB_path, num_fetchers=2, batch_size=2)
+        stats = pipeline.run(["U2\n", "Coldplay\n", "Unknown artist\n"])
+        self.assertEqual(stats["artists_requested"], 3)
+        self.assertEqual(stats["artists_fetched"], 2)
+        self.assertEqual(stats["batches_failed"], 0)
+
+        self.assertEqual(self.kb_api.get_songs_by_artist("U2"), ["One"])
+        self.assertEqual(self.kb_api.get_song_data("Yellow")[0]["popularity"], 90)
+        self.assertEqual(self.kb_api.get_related_entities("U2"), ["Coldplay"])
+        self.assertEqual(self.kb_api.get_related_entities("Coldplay"), ["U2"])
+        self.assertEqual(set(self.kb_api.get_artist_data("Coldplay")[0]["genres"]), {"rock", "pop"})
+
+    def _run_in_thread(self, pipeline, artist_names):
+        """Runs the pipeline, failing the test rather than hanging if it does not finish.
+
+        Returns:
+            (tuple): the stats returned by run, and the exception it raised.
+        """
+        outcome = dict(stats=None, error=None)
+
+        def run():
+            try:
+                outcome["stats"] = pipeline.run(artist_names)
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "Expected the pipeline to finish.")
+        return outcome["stats"], outcome["error"]
+
+    def test_load_error(self):
+        # Small queues, so that a stage that stopped reading them would block the others.
+        pipeline = IngestionPipeline(FakeSpotifyClient(), self.DB_path, num_fetchers=2, queue_size=1, batch_size=2)
+        with mock.patch.object(pipeline.kb_api, "bulk_load", side_effect=RuntimeError("disk on fire")) as bulk_load:
+            stats, error = self._run_in_thread(pipeline, ["U2", "Coldplay"] * 20)
+        self.assertIsInstance(error, RuntimeError)
+        self.assertEqual(pipeline.stats["batches_failed"], bulk_load.call_count)
+        self.assertEqual(pipeline.stats["batches_written"], 0)
+        self.assertEqual(pipeline.stats["records_queued"], 40 * 4)
+
+    def test_normalize_error(self):
+        spotify = FakeSpotifyClient()
+        # A malformed payload: the song has no popularity.
+        del spotify.songs["u2"]["One"]["popularity"]
+        pipeline = IngestionPipeline(spotify, self.DB_path, num_fetchers=2, queue_size=1, batch_size=2)
+        stats, error = self._run_in_thread(pipeline, ["U2", "Coldplay"] * 20)
+        self.assertIsInstance(error, KeyError)
+        # The other artists are still loaded.
+        self.assertEqual(pipeline.stats["batches_failed"], 0)
+        self.assertEqual(self.kb_api.get_songs_by_artist("Coldplay"), ["Yellow"])
+
+    def test_bulk_load_skips_duplicates(self):
+        records = [
+            dict(type="artist", name="U2", genres=["rock"], num_spotify_followers=1),
+            dict(type="artist", name="U2", genres=["rock"], num_spotify_followers=1),
+            dict(type="song", name="One", artist="U2"),
+            dict(type="song", name="One", artist="U2"),
+        ]
+        self.assertEqual(self.kb_api.bulk_load(records), 2)
+        self.assertEqual(len(self.kb_api.get_artist_data("U2")), 1)
+        self.assertEqual(self.kb_api.get_songs_by_artist("U2"), ["One"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
 import os
+from contextlib import closing
 
 from knowledge_base.api import KnowledgeBaseAPI
 from scripts import test_db_utils
@@ -8,11 +9,11 @@ from scripts import test_db_utils
 class TestMusicKnowledgeBaseAPI(unittest.TestCase):
 
     def setUp(self):
-        DB_path = test_db_utils.create_and_populate_db()
-        self.kb_api = KnowledgeBaseAPI(dbName=DB_path)
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.kb_api = KnowledgeBaseAPI(dbName=self.DB_path)
 
     def tearDown(self):
-        test_db_utils.remove_db()
+        test_db_utils.remove_db(self.DB_path)
 
     def test_get_song_data(self):
         song_data = self.kb_api.get_song_data("Despacito")
@@ -106,6 +107,55 @@ class TestMusicKnowledgeBaseAPI(unittest.TestCase):
         self.assertEqual(rel_genres, ["Pop"],
             "Did not find expected related genres for artist 'Justin Timberlake'")
 
+    def test_get_many_matches_single_lookups(self):
+        names = self.kb_api.get_all_music_entities() + ["Unknown Entity"]
+        genre_rel_str = self.kb_api.approved_relations["genre"]
+        related = self.kb_api.get_related_entities_many(names)
+        genres = self.kb_api.get_related_entities_many(names, rel_str=genre_rel_str)
+        song_data = self.kb_api.get_song_data_many(names)
+        songs = self.kb_api.get_songs_by_artist_many(names)
+        for name in names:
+            self.assertEqual(related[name], self.kb_api.get_related_entities(name),
+                             "Related entities of '{}' did not match.".format(name))
+            self.assertEqual(genres[name], self.kb_api.get_related_entities(name, rel_str=genre_rel_str),
+                             "Genres of '{}' did not match.".format(name))
+            self.assertEqual(song_data[name], self.kb_api.get_song_data(name),
+                             "Song data of '{}' did not match.".format(name))
+            self.assertEqual(songs[name], self.kb_api.get_songs_by_artist(name),
+                             "Songs by '{}' did not match.".format(name))
+
+    def test_entity_changelog(self):
+        seq = self.kb_api.get_entity_changelog_seq()
+        notified = []
+        self.kb_api.add_observer(notified.append)
+        try:
+            KnowledgeBaseAPI(self.DB_path).add_artist("Heart")
+            self.kb_api.add_song("Alone", "Heart")
+            self.kb_api.add_genre("Rock")
+        finally:
+            self.kb_api.remove_observer(notified.append)
+
+        changes = self.kb_api.get_entity_changes(seq)
+        self.assertEqual([(change.op, change.name) for change in changes], [("insert", "Heart"), ("insert", "Alone")])
+        self.assertEqual(notified, [changes[:1], changes[1:]],
+                         "Expected observers to be notified of the changes of each write.")
+        self.assertEqual(self.kb_api.get_entity_changelog_seq(), changes[-1].seq)
+        self.assertEqual(self.kb_api.filter_music_entities(["Heart", "Alone", "Rock", "Unknown Entity"]),
+                         {"Heart", "Alone"})
+
+    def test_entity_changelog_retention(self):
+        seq = self.kb_api.get_entity_changelog_seq()
+        self.kb_api.add_artist("Heart")
+        self.assertEqual(len(self.kb_api.get_entity_changes(seq)), 1)
+
+        # Every 1000 changes, the changes older than the latest 100000 are pruned.
+        with closing(self.kb_api.connection) as con, con:
+            con.execute("INSERT INTO entity_changelog(seq, op, name) VALUES (200000, 'insert', 'Heart');")
+        self.assertEqual(self.kb_api.get_entity_changes(seq), None,
+                         "Expected pruned changes to be reported as unavailable.")
+        self.assertEqual(self.kb_api.get_entity_changes(199999), [(200000, "insert", "Heart")])
+        self.assertEqual(self.kb_api.get_entity_changes(200000), [])
+
     def test_connect_entities_by_similarity(self):
         res = self.kb_api.get_related_entities("Shawn Mendes")
         self.assertEqual(len(res), 0)
@@ -281,6 +331,20 @@ class TestMusicKnowledgeBaseAPI(unittest.TestCase):
         self.assertEqual(len(res), 0,
             "Insertion of song with unknown artist should not have been added to nodes table")
 
+    def test_update_by_spotify_id(self):
+        self.kb_api.add_artist("Heart", num_spotify_followers=1, spotify_id="heart_id")
+        self.kb_api.add_song("Barracuda", "Heart", popularity=10, spotify_id="barracuda_id")
+        self.assertEqual(self.kb_api.get_spotify_ids("artist"), ["heart_id"])
+        self.assertEqual(self.kb_api.get_spotify_ids("song"), ["barracuda_id"])
+
+        res = self.kb_api.update_spotify_followers({"heart_id": 500, "unknown_id": 1})
+        self.assertEqual(res, 1, "Expected exactly one artist to be updated.")
+        self.assertEqual(self.kb_api.get_artist_data("Heart")[0]["num_spotify_followers"], 500)
+
+        res = self.kb_api.update_spotify_popularity({"barracuda_id": 99})
+        self.assertEqual(res, 1, "Expected exactly one song to be updated.")
+        self.assertEqual(self.kb_api.get_song_data("Barracuda")[0]["popularity"], 99)
+
     def test_add_genre(self):
         node_id = self.kb_api.add_genre("hip hop")
         self.assertEqual(type(node_id), int,
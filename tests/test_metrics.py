@@ -0,0 +1,94 @@
+import unittest
+
+from instrumentation import metrics
+from knowledge_base.api import KnowledgeBaseAPI
+from scripts.test_db_utils import create_and_populate_db, remove_db
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_disabled(self):
+        metrics.disable()
+        with metrics.timer("stage_seconds", stage="a"):
+            pass
+        metrics.increment("calls_total")
+        self.assertEqual(metrics.snapshot(), dict(histograms=dict(), counters=dict()))
+
+    def test_timer_and_counter(self):
+        for _ in range(3):
+            with metrics.timer("stage_seconds", stage="a"):
+                pass
+        metrics.increment("calls_total", 2, stage="a")
+
+        snapshot = metrics.snapshot()
+        series = snapshot["histograms"]["stage_seconds"]
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]["labels"], dict(stage="a"))
+        self.assertEqual(series[0]["count"], 3)
+        self.assertEqual(series[0]["buckets"][-1], [float("inf"), 3])
+        self.assertEqual(snapshot["counters"]["calls_total"], [dict(labels=dict(stage="a"), value=2)])
+
+    def test_timed_counts_rows(self):
+        @metrics.timed("call_seconds", rows_counter="rows_total", method="f")
+        def f(n):
+            return list(range(n))
+
+        self.assertEqual(f(2), [0, 1])
+        self.assertEqual(f(3), [0, 1, 2])
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["histograms"]["call_seconds"][0]["count"], 2)
+        self.assertEqual(snapshot["counters"]["rows_total"], [dict(labels=dict(method="f"), value=5)])
+
+    def test_trace(self):
+        metrics.disable()
+        with metrics.trace() as stages:
+            with metrics.timer("stage_seconds", parser="tree", stage="lexing"):
+                pass
+        with metrics.timer("stage_seconds", parser="tree", stage="parse"):
+            pass
+
+        self.assertEqual([(name, labels) for name, labels, _ in stages],
+                         [("stage_seconds", dict(parser="tree", stage="lexing"))])
+        self.assertRegex(metrics.format_trace(stages), r"^stage\[tree\.lexing\]=\d+\.\d\dms$")
+        self.assertEqual(metrics.snapshot()["histograms"], dict(),
+                         "Expected traces not to record metrics while they are disabled.")
+
+    def test_render_text(self):
+        metrics.observe("stage_seconds", 0.002, stage='say "hi"')
+        metrics.increment("calls_total")
+        text = metrics.render_text()
+        self.assertIn("# TYPE stage_seconds histogram", text)
+        self.assertIn('stage_seconds_bucket{stage="say \\"hi\\"",le="0.0025"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 1', text)
+        self.assertIn('stage_seconds_count{stage="say \\"hi\\""} 1', text)
+        self.assertIn("# TYPE calls_total counter\ncalls_total 1", text)
+
+    def test_percentile(self):
+        self.assertEqual(metrics.percentile([], 50), None)
+        self.assertEqual(metrics.percentile([3.0], 99), 3.0)
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.assertEqual([metrics.percentile(values, p) for p in (0, 50, 90, 100)], [1.0, 3.0, 4.6, 5.0])
+
+    def test_knowledge_base_api(self):
+        db_path = create_and_populate_db()
+        try:
+            kb_api = KnowledgeBaseAPI(db_path)
+            res = kb_api.get_related_entities("Justin Bieber")
+        finally:
+            remove_db(db_path)
+
+        snapshot = metrics.snapshot()
+        labels = dict(method="get_related_entities")
+        self.assertIn(dict(labels=labels, value=len(res)), snapshot["counters"]["imr_kb_rows_returned_total"])
+        self.assertTrue(any(s["labels"] == labels for s in snapshot["histograms"]["imr_kb_call_seconds"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
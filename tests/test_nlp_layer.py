@@ -19,7 +19,7 @@ class TestNLP(unittest.TestCase):
         self.keywords = self.interactions.keywords
 
     def tearDown(self):
-        test_db_utils.remove_db()
+        test_db_utils.remove_db(self.DB_path)
 
     def test_parse_input_play(self):
         """Test that `control_play` intention is parsed."""
@@ -34,14 +34,15 @@ class TestNLP(unittest.TestCase):
         self.assertEqual(str(output[0]), '[]')
 
     def test_parse_input_KB_API(self):
-        save_state = KnowledgeBaseAPI.get_all_music_entities
-        KnowledgeBaseAPI.get_all_music_entities = MagicMock(return_value=['The Who'])
-        nlp = BOWParser(self.DB_path, self.keywords)  # Re-instantiate nlp so it uses the mock value.
+        save_state = KnowledgeBaseAPI.get_all_music_entity_ids
+        KnowledgeBaseAPI.get_all_music_entity_ids = MagicMock(return_value=[('The Who', 1)])
+        # Re-instantiate nlp, recompiling its artifacts, so it uses the mock value.
+        nlp = BOWParser(self.DB_path, self.keywords, recompile_artifacts=True)
         output = nlp('play the who')
         self.assertEqual(str(output[1]), "['control_play']")
         self.assertEqual(str(output[0]), "['The Who']")
         self.assertEqual(str(output[2]), '')
-        KnowledgeBaseAPI.get_all_music_entities = save_state
+        KnowledgeBaseAPI.get_all_music_entity_ids = save_state
 
     def test_call_functional_test(self):
         output = self.nlp('play Justin bieber')
@@ -49,6 +50,45 @@ class TestNLP(unittest.TestCase):
         self.assertEqual(str(output[0]), "['Justin Bieber']")
         self.assertEqual(str(output[2]), '')
 
+    def test_intent_regex(self):
+        """Test that the combined intent regex finds the same intents as the per-intent patterns."""
+        self.assertIsNotNone(self.nlp.intent_regex)
+        for text in ["play", "skip next", "hi how are you", "stop pause play", "who is like heart",
+                     "artists playing skipper", "similar artist play", "nothing here", ""]:
+            self.assertEqual(self.nlp._match_intents(text), self.nlp._match_intents_in_turn(text),
+                             "Mismatch for text '{}'".format(text))
+        self.assertEqual(self.nlp._match_intents("play who like"),
+                         (['query_similar_entities', 'control_play', 'query_artist'], '  '))
+
+    def test_intent_regex_fallback(self):
+        """Test that keywords of several words are matched by the per-intent patterns."""
+        keywords = dict(self.keywords)
+        keywords['control_forward'] = ['skip', 'next song']
+        nlp = BOWParser(self.DB_path, keywords)
+        self.assertIsNone(nlp.intent_regex)
+        self.assertEqual(nlp._gen_intent_regex(), None)
+        output = nlp('next song please')
+        self.assertEqual(output[1], ['control_forward'])
+        self.assertEqual(output[2], 'please')
+
+    def test_entities_with_regex_metacharacters(self):
+        """Test that entity names are removed from the text literally."""
+        self.kb_api.add_artist("(Love) Night")
+        self.kb_api.add_artist("A+B*")
+        nlp = BOWParser(self.DB_path, self.keywords)
+        self.assertEqual(nlp._match_entities("play (love) night and a+b* now"),
+                         (["(Love) Night", "A+B*"], "play  and  now"))
+        output = nlp('play (Love) Night')
+        self.assertEqual(output, (["(Love) Night"], ['control_play'], ''))
+
+    def test_overlapping_entities(self):
+        """Test that the longest of overlapping entity names is matched."""
+        self.kb_api.add_artist("Justin")
+        self.kb_api.add_artist("Bieber")
+        nlp = BOWParser(self.DB_path, self.keywords)
+        self.assertEqual(nlp('play justin bieber')[0], ['Justin Bieber'])
+        self.assertEqual(nlp('play justin and bieber')[0], ['Bieber', 'Justin'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,196 @@
+import os
+import unittest
+
+from knowledge_base.api import KnowledgeBaseAPI
+from nlp import artifacts, entity_table
+from nlp.entity_index import EntityIndex
+from nlp.entity_table import EntityTable
+from scripts.test_db_utils import create_and_populate_db, remove_db
+
+
+class TestEntityIndex(unittest.TestCase):
+    entities = ["U2", "Justin Bieber", "justin", "The Who", "u2", "Bieber", "Who"]
+
+    def _first_match(self, entities, text, after=None):
+        text = text.lower()
+        keys = set(e.lower() for e in entities if e)
+        occurrences = [(start, start + len(key)) for key in keys
+                       for start in range(len(text)) if text.startswith(key, start)]
+
+        def within_longer_name(start, end):
+            return any(s <= start and end <= e and e - s > end - start for s, e in occurrences)
+
+        return next((e for e in sorted(entities) if e and (after is None or e > after)
+                     and any(not within_longer_name(start, start + len(e))
+                             for start in range(len(text)) if text.startswith(e.lower(), start))), None)
+
+    def _check_first_match(self, index, entities):
+        for text in ["play u2", "Play JUSTIN BIEBER", "the who and u2", "nothing here", "", "Who"]:
+            for after in [None] + sorted(entities):
+                self.assertEqual(index.first_match(text, after), self._first_match(entities, text, after),
+                                 "Mismatch for text '{}' after {}".format(text, after))
+
+    def _index(self, entities):
+        return EntityIndex(entities)
+
+    def test_ignores_empty_names(self):
+        self.assertEqual(EntityIndex(["", "U2"]).first_match("play u2"), "U2")
+
+    def test_after(self):
+        # Sorted: "Heart", "U2", "Wilco", "u2".
+        index = self._index(["Heart", "U2", "u2", "Wilco"])
+        text = "play u2, heart and wilco"
+        self.assertEqual(index.first_match_lowercase(text), "Heart")
+        self.assertEqual(index.first_match_lowercase(text, after="Heart"), "U2")
+        self.assertEqual(index.first_match_lowercase(text, after="U2"), "Wilco")
+        self.assertEqual(index.first_match_lowercase(text, after="Wilco"), "u2",
+                         "Expected the other entity with the same name to match.")
+        self.assertEqual(index.first_match_lowercase(text, after="u2"), None)
+        self.assertEqual(index.first_match_lowercase(text, after="Unknown Entity"), "Wilco",
+                         "Expected the entity after a name that is not in the catalogue to match.")
+        self.assertEqual(index.first_match_lowercase("play heart", after="Heart"), None)
+
+    def test_short_names(self):
+        """Names shorter than the prefix length are their own prefix."""
+        index = self._index(["A", "AB", "ABC", "ABCD", "Xy"])
+        self.assertEqual(index.first_match_lowercase("a"), "A")
+        self.assertEqual(index.first_match_lowercase("ab"), "AB")
+        self.assertEqual(index.first_match_lowercase("x y"), None)
+        self.assertEqual(index.first_match_lowercase("xy"), "Xy")
+        self.assertEqual(index.first_match_lowercase("abc"), "ABC")
+        self.assertEqual(index.first_match_lowercase("abcd and a"), "A")
+        self.assertEqual(index.first_match_lowercase("abcd and a", after="A"), "ABCD")
+
+    def test_overlapping_names(self):
+        """The longest of overlapping names wins, whether they share their start, end, or neither."""
+        index = self._index(["Justin", "Justin Bieber", "Bieber", "Bieber Fever", "Fever", "The Who", "Who"])
+        self.assertEqual(index.first_match_lowercase("play justin bieber"), "Justin Bieber")
+        self.assertEqual(index.first_match_lowercase("play bieber fever"), "Bieber Fever")
+        self.assertEqual(index.first_match_lowercase("play the who"), "The Who")
+        self.assertEqual(index.first_match_lowercase("justin bieber fever"), "Bieber Fever",
+                         "Expected names that overlap without one containing the other to both match.")
+        self.assertEqual(index.first_match_lowercase("justin bieber fever", after="Bieber Fever"), "Justin Bieber")
+        self.assertEqual(index.first_match_lowercase("justin bieber and bieber"), "Bieber",
+                         "Expected an occurrence outside of the longer name to match.")
+        self.assertEqual(index.first_match_lowercase("play justin bieber", after="Justin Bieber"), None)
+
+    def test_first_match(self):
+        self._check_first_match(EntityIndex(self.entities), self.entities)
+
+    def test_add_and_remove(self):
+        index = EntityIndex(self.entities)
+        self.assertFalse(index.add("U2"))
+        self.assertTrue(index.remove("U2"))
+        self.assertFalse(index.remove("U2"))
+        self.assertTrue(index.remove("Who"))
+        self.assertTrue(index.add("Heart"))
+        entities = [e for e in self.entities if e not in ("U2", "Who")] + ["Heart"]
+        self.assertEqual(index.entities, sorted(entities))
+        self._check_first_match(index, entities)
+        self.assertEqual(index.first_match("play heart"), "Heart")
+
+        for entity in entities:
+            index.remove(entity)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.first_match("play u2 and heart"), None)
+
+
+class TestEntityTable(TestEntityIndex):
+    entities = TestEntityIndex.entities + ["Beyoncé", "BEYONCÉ"]
+
+    def _table(self, entities):
+        return EntityTable(entity_table.build([(name, i) for i, name in enumerate(sorted(entities))]))
+
+    def _index(self, entities):
+        return EntityIndex(table=self._table(entities))
+
+    def test_ignores_empty_names(self):
+        self.assertEqual(EntityIndex(table=self._table(["", "U2"])).first_match("play u2"), "U2")
+
+    def test_overlapping_added_names(self):
+        """Names added to the index and names of the table are matched together."""
+        index = EntityIndex(table=self._table(["Justin", "Bieber", "Beyoncé"]))
+        index.add("Justin Bieber")
+        index.add("Beyoncé Knowles")
+        self.assertEqual(index.first_match_lowercase("play justin bieber"), "Justin Bieber")
+        self.assertEqual(index.first_match_lowercase("play beyoncé knowles and justin"), "Beyoncé Knowles")
+        index.remove("Justin Bieber")
+        self.assertEqual(index.first_match_lowercase("play justin bieber"), "Bieber")
+
+    def test_table(self):
+        entities = sorted(self.entities + [""])
+        table = self._table(entities)
+        self.assertEqual(list(table.names()), entities)
+        self.assertEqual(table.find("u2"), entities.index("u2"))
+        self.assertEqual(table.find(""), 0)
+        self.assertEqual(table.find("Heart"), None)
+
+    def test_first_match(self):
+        self._check_first_match(EntityIndex(table=self._table(self.entities)), self.entities)
+        self.assertEqual(EntityIndex(table=self._table(self.entities)).first_match("by beyoncé"), "BEYONCÉ")
+
+    def test_add_and_remove(self):
+        index = EntityIndex(table=self._table(self.entities))
+        self.assertTrue(index.remove("U2"))
+        self.assertTrue(index.add("Heart"))
+        self.assertTrue(index.add("U2"))
+        self.assertTrue(index.remove("Who"))
+        self.assertFalse(index.remove("Who"))
+        entities = [e for e in self.entities if e != "Who"] + ["Heart"]
+        self.assertEqual(index.entities, sorted(entities))
+        self.assertEqual(len(index), len(entities))
+        self._check_first_match(index, entities)
+
+    def test_load_or_build(self):
+        DB_path = create_and_populate_db()
+        try:
+            kb_api = KnowledgeBaseAPI(DB_path)
+            table = entity_table.load_or_build(DB_path, kb_api)
+            self.assertTrue(os.path.isfile(entity_table.table_path(DB_path)))
+            self.assertIs(entity_table.load_or_build(DB_path, kb_api), table,
+                          "Expected the parsers of a process to share the table.")
+            for name, node_id in kb_api.get_all_music_entity_ids():
+                self.assertEqual(table.node_id(table.find(name)), node_id)
+
+            kb_api.add_artist("Heart")
+            new_table = entity_table.load_or_build(DB_path, kb_api)
+            self.assertIsNot(new_table, table)
+            self.assertIsNotNone(new_table.find("Heart"))
+            self.assertIsNone(table.find("Heart"), "Expected the previous table to be left as it was.")
+        finally:
+            remove_db(DB_path)
+        self.assertFalse(os.path.isfile(entity_table.table_path(DB_path)))
+
+
+class TestParserArtifacts(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = create_and_populate_db()
+        self.kb_api = KnowledgeBaseAPI(self.DB_path)
+        self.num_compilations = 0
+
+    def tearDown(self):
+        remove_db(self.DB_path)
+
+    def _compile(self):
+        self.num_compilations += 1
+        return dict(entities=self.kb_api.get_all_music_entities())
+
+    def test_load_or_compile(self):
+        config = dict(keywords=["play"])
+        compiled = artifacts.load_or_compile(self.DB_path, self.kb_api, "test", config, self._compile)
+        self.assertTrue(os.path.isfile(artifacts.artifacts_path(self.DB_path, "test")))
+        self.assertEqual(artifacts.load_or_compile(self.DB_path, self.kb_api, "test", config, self._compile),
+                         compiled)
+        self.assertEqual(self.num_compilations, 1, "Expected up-to-date artifacts to be loaded from disk.")
+
+        artifacts.load_or_compile(self.DB_path, self.kb_api, "test", dict(keywords=["start"]), self._compile)
+        self.assertEqual(self.num_compilations, 2, "Expected a change of config to invalidate the artifacts.")
+
+        self.kb_api.add_artist("Heart")
+        compiled = artifacts.load_or_compile(self.DB_path, self.kb_api, "test", config, self._compile)
+        self.assertEqual(self.num_compilations, 3, "Expected a change of the DB to invalidate the artifacts.")
+        self.assertIn("Heart", compiled["entities"])
+
+
+if __name__ == '__main__':
+    unittest.main()
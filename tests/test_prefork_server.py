@@ -0,0 +1,85 @@
+import json
+import os
+import signal
+import time
+import unittest
+import urllib.request
+
+from controller.prefork_server import PreforkServer, _exit_code
+from scripts import test_db_utils
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "Needs os.fork.")
+class TestPreforkServer(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.server = PreforkServer(self.DB_path, parser_type="TREE", workers=2, address=("127.0.0.1", 0),
+                                    warm_up_utterances=["play justin bieber"])
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        test_db_utils.remove_db(self.DB_path)
+
+    def _request(self, path, data=None):
+        url = "http://{}:{}{}".format(self.server.address[0], self.server.address[1], path)
+        with urllib.request.urlopen(url, data=data, timeout=10) as response:
+            return json.loads(response.read().decode("UTF-8"))
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 10
+        while not condition() and time.time() < deadline:
+            self.server.poll()
+            time.sleep(0.05)
+        self.assertTrue(condition())
+
+    def test_utterances(self):
+        result = self._request("/utterance", b"play justin bieber")
+        self.assertEqual(result["actions"], [["play", ["Justin Bieber"]]])
+        self.assertIn(result["worker"], self.server.worker_pids)
+
+        result = self._request("/utterance", json.dumps(dict(utterance="who are artists like justin bieber")).encode())
+        self.assertIn("Shawn Mendes", result["response"][0])
+
+    def test_stats(self):
+        for _ in range(4):
+            self._request("/utterance", b"play justin bieber")
+        stats = self._request("/stats")
+        self.assertEqual(stats["server"]["pid"], os.getpid())
+        self.assertEqual([worker["pid"] for worker in stats["workers"]], self.server.worker_pids)
+        self.assertEqual(sum(worker["requests"] for worker in stats["workers"]), 4)
+        self.assertEqual(sum(worker["errors"] for worker in stats["workers"]), 0)
+
+    def test_restarts_dead_workers(self):
+        dead, alive = self.server.worker_pids
+        os.kill(dead, signal.SIGKILL)
+        self._wait_for(lambda: len(self.server.worker_pids) == 2 and dead not in self.server.worker_pids)
+        self.assertIn(alive, self.server.worker_pids)
+        self.assertEqual(self._request("/stats")["server"]["restarts"], 1)
+        self.assertEqual(self._request("/utterance", b"play justin bieber")["actions"], [["play", ["Justin Bieber"]]])
+
+    def test_graceful_restart(self):
+        previous = self.server.worker_pids
+        self.server.restart()
+        self._wait_for(lambda: len(self.server._workers) == 2)
+        self.assertFalse(set(previous) & set(self.server.worker_pids))
+        stats = self._request("/stats")
+        self.assertEqual(stats["server"]["generation"], 1)
+        self.assertEqual([worker["generation"] for worker in stats["workers"]], [1, 1])
+
+    def test_exit_code(self):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(3)
+        self.assertEqual(_exit_code(os.waitpid(pid, 0)[1]), 3)
+
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(10)
+            os._exit(0)
+        os.kill(pid, signal.SIGKILL)
+        self.assertEqual(_exit_code(os.waitpid(pid, 0)[1]), -signal.SIGKILL)
+
+
+if __name__ == '__main__':
+    unittest.main()
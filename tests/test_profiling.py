@@ -0,0 +1,53 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from instrumentation import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for kind in profiling.PROFILE_KINDS:
+            profiling.stop(kind)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cpu_pstats(self):
+        output_path = os.path.join(self.tmp_dir, "cpu.pstats")
+        self.assertIsNotNone(profiling.start("cpu", output_path))
+        self.assertIsNone(profiling.start("cpu", output_path), "Expected a running profile not to be restarted.")
+        sorted(range(1000))
+        profiling.stop("cpu")
+        self.assertTrue(pstats.Stats(output_path).total_calls > 0)
+
+    def test_cpu_collapsed(self):
+        output_path = os.path.join(self.tmp_dir, "cpu.collapsed")
+        profiler = profiling.start("cpu", output_path, cpu_format="collapsed")
+        profiler._stopped.wait(0.05)
+        profiling.stop("cpu")
+        with open(output_path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines, "Expected at least one sampled stack.")
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertIn("test_cpu_collapsed (test_profiling.py:", stack)
+        self.assertTrue(int(count) > 0)
+
+    def test_mem(self):
+        output_path = os.path.join(self.tmp_dir, "mem.txt")
+        profiling.start("mem", output_path)
+        data = [str(i) for i in range(10000)]
+        profiling.stop("mem")
+        with open(output_path) as f:
+            self.assertIn("test_profiling.py", f.read())
+        self.assertEqual(len(data), 10000)
+
+    def test_unknown_kind(self):
+        self.assertRaises(ValueError, profiling.start, "gpu")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from unittest.mock import MagicMock, patch
+
+from scripts.response_cache import ResponseCache
+from scripts.spotify_client import SpotifyClient
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, "cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_make_key_ignores_param_order(self):
+        self.assertEqual(
+            ResponseCache.make_key("get", "https://x/v1/search", dict(q="U2", type="artist")),
+            ResponseCache.make_key("GET", "https://x/v1/search", dict(type="artist", q="U2")),
+        )
+
+    def test_get_put(self):
+        cache = ResponseCache(self.cache_path)
+        self.assertEqual(cache.get("key"), None)
+        cache.put("key", 200, b'{"a": 1}')
+        resp = cache.get("key")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"a": 1})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_ttl(self):
+        cache = ResponseCache(self.cache_path, ttl_seconds=-1)
+        cache.put("key", 200, b'{}')
+        self.assertEqual(cache.get("key"), None, "Expected expired entry to be treated as a miss.")
+
+        # Offline mode replays entries regardless of their age.
+        cache.put("key", 200, b'{}')
+        offline_cache = ResponseCache(self.cache_path, ttl_seconds=-1, offline=True)
+        self.assertNotEqual(offline_cache.get("key"), None)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(self.cache_path, max_size_bytes=10)
+        cache.put("old", 200, b'12345')
+        cache.put("new", 200, b'12345')
+        cache.get("old")
+        cache.put("newest", 200, b'12345')
+        self.assertNotEqual(cache.get("old"), None)
+        self.assertEqual(cache.get("new"), None, "Expected least recently used entry to be evicted.")
+        self.assertNotEqual(cache.get("newest"), None)
+
+    def test_total_size(self):
+        cache = ResponseCache(self.cache_path, max_size_bytes=12)
+        cache.put("a", 200, b'12345')
+        cache.put("b", 200, b'123')
+        self.assertEqual(cache.total_size(), 8)
+        cache.put("a", 200, b'1')
+        self.assertEqual(cache.total_size(), 4, "Expected a replaced entry not to count twice.")
+        cache.put("c", 200, b'123456789')
+        self.assertEqual(cache.total_size(), 10)
+        self.assertEqual(cache.get("b"), None, "Expected the least recently used entry to be evicted.")
+
+        ResponseCache(self.cache_path, ttl_seconds=-1).get("c")
+        self.assertEqual(cache.total_size(), 1, "Expected an expired entry to be deducted.")
+        cache.clear()
+        self.assertEqual(cache.total_size(), 0)
+
+    def test_total_size_of_existing_cache(self):
+        cache = ResponseCache(self.cache_path)
+        cache.put("a", 200, b'12345')
+        with closing(sqlite3.connect(self.cache_path)) as con:
+            with con:
+                con.execute("DROP TABLE cache_size;")
+        self.assertEqual(ResponseCache(self.cache_path).total_size(), 5)
+
+    def test_spotify_client_replays_from_cache(self):
+        body = b'{"artists": {"items": [{"id": "u2", "followers": {"total": 5}, "genres": ["rock"]}]}}'
+        network_resp = MagicMock(status_code=200, content=body)
+        network_resp.json.return_value = {"artists": {"items": [{"id": "u2", "followers": {"total": 5}, "genres": ["rock"]}]}}
+
+        client = SpotifyClient("id", "secret", cache=ResponseCache(self.cache_path))
+        with patch("scripts.spotify_client.requests.get", return_value=network_resp) as mock_get, \
+                patch.object(SpotifyClient, "token", "token"):
+            client.get_artist_data("U2")
+            self.assertEqual(mock_get.call_count, 1)
+
+        offline_client = SpotifyClient("", "", cache=ResponseCache(self.cache_path, offline=True))
+        with patch("scripts.spotify_client.requests.get") as mock_get:
+            self.assertEqual(offline_client.get_artist_data("U2"), dict(id="u2", num_followers=5, genres=["rock"]))
+            self.assertEqual(offline_client.get_artist_data("Unknown"), None)
+            self.assertEqual(mock_get.call_count, 0, "Expected no network requests in offline mode.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.slow_query_log import SlowQueryLog, full_scans
+from scripts.test_db_utils import create_and_populate_db, remove_db
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = create_and_populate_db()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        remove_db(self.DB_path)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_logs_statements_with_plan(self):
+        log_path = os.path.join(self.tmp_dir, "slow_queries.jsonl")
+        log = SlowQueryLog(threshold_ms=0, path=log_path)
+        kb_api = KnowledgeBaseAPI(self.DB_path, slow_query_log=log)
+
+        res = kb_api.get_related_entities("Justin Bieber")
+        self.assertEqual(set(res), set(["Justin Timberlake", "Shawn Mendes"]),
+                         "Timing statements should not change their results.")
+
+        entries = [e for e in log.entries if e["sql"].startswith("SELECT")]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["params"], ["Justin Bieber", "similar to"])
+        self.assertEqual(entries[0]["rows"], 2)
+        self.assertTrue(entries[0]["plan"], "Expected the query plan to be captured.")
+        self.assertEqual(entries[0]["full_scans"], [], "Expected related entities to be found through indexes.")
+
+        with open(log_path) as f:
+            logged = [json.loads(line) for line in f]
+        self.assertEqual(logged, log.entries)
+
+    def test_threshold_and_capacity(self):
+        log = SlowQueryLog(threshold_ms=60 * 1000)
+        KnowledgeBaseAPI(self.DB_path, slow_query_log=log).get_all_music_entities()
+        self.assertEqual(log.entries, [], "Expected fast statements not to be logged.")
+
+        log = SlowQueryLog(threshold_ms=0, capacity=2)
+        kb_api = KnowledgeBaseAPI(self.DB_path, slow_query_log=log)
+        for _ in range(3):
+            kb_api.get_all_music_entities()
+        self.assertEqual(len(log.entries), 2)
+
+    def test_writes(self):
+        log = SlowQueryLog(threshold_ms=0)
+        kb_api = KnowledgeBaseAPI(self.DB_path, slow_query_log=log)
+        node_id = kb_api.add_artist("Heart")
+        self.assertEqual(kb_api.get_artist_data("Heart")[0]["id"], node_id)
+        inserts = [e for e in log.entries if e["sql"].startswith("INSERT INTO nodes")]
+        self.assertEqual([e["rows"] for e in inserts], [1])
+
+    def test_full_scans(self):
+        self.assertEqual(full_scans([
+            "SCAN nodes",
+            "SCAN TABLE edges AS e",
+            "SCAN nodes USING COVERING INDEX nodes_name_idx",
+            "SEARCH artists USING INTEGER PRIMARY KEY (rowid=?)",
+            "SCAN SUBQUERY 1",
+        ]), ["nodes", "edges", "nodes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
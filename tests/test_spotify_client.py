@@ -0,0 +1,89 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from scripts.response_cache import CachedResponse
+from scripts.spotify_client import MAX_IDS_PER_REQUEST, SpotifyClient, _chunks
+
+
+def _artist(artist_ID):
+    return dict(id=artist_ID, name="Artist " + artist_ID, followers=dict(total=int(artist_ID)), genres=["pop"])
+
+
+def _track(track_ID):
+    return dict(id=track_ID, name="Song " + track_ID, duration_ms=1000, popularity=int(track_ID) % 100,
+                uri="spotify:track:" + track_ID)
+
+
+class TestSpotifyClient(unittest.TestCase):
+    def setUp(self):
+        self.client = SpotifyClient("client_id", "secret_key")
+        # IDs of entities that Spotify does not know.
+        self.unknown_IDs = set()
+        self.requested_IDs = []
+
+    def _get(self, path, params=None):
+        """Stands in for the Spotify web API's "several artists" and "several tracks" endpoints."""
+        IDs = params["ids"].split(",")
+        self.requested_IDs.append(IDs)
+        if len(IDs) > MAX_IDS_PER_REQUEST:
+            return CachedResponse(400, json.dumps(dict(error="Too many ids requested")).encode("UTF-8"))
+        if path == "/v1/artists":
+            body = dict(artists=[None if x in self.unknown_IDs else _artist(x) for x in IDs])
+        else:
+            body = dict(tracks=[None if x in self.unknown_IDs else _track(x) for x in IDs])
+        return CachedResponse(200, json.dumps(body).encode("UTF-8"))
+
+    def test_chunks(self):
+        self.assertEqual(_chunks([], 2), [])
+        self.assertEqual(_chunks([1, 2, 3, 4, 5], 2), [[1, 2], [3, 4], [5]])
+        self.assertEqual(_chunks([1, 2], 2), [[1, 2]])
+
+    def test_get_several_artists(self):
+        artist_IDs = [str(x) for x in range(120, 0, -1)]
+        self.unknown_IDs = {"7", "60", "61"}
+        with patch.object(self.client, "_get", side_effect=self._get) as get:
+            artists = self.client.get_several_artists(iter(artist_IDs))
+
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual([len(IDs) for IDs in self.requested_IDs], [50, 50, 20])
+        self.assertEqual([x for IDs in self.requested_IDs for x in IDs], artist_IDs)
+        self.assertEqual(list(artists), artist_IDs, "Expected the results in the order of the IDs.")
+        self.assertEqual(artists["120"], dict(name="Artist 120", num_followers=120, genres=["pop"]))
+        self.assertEqual([x for x, artist in artists.items() if artist is None], ["61", "60", "7"])
+
+    def test_get_several_tracks(self):
+        track_IDs = [str(x) for x in range(1, MAX_IDS_PER_REQUEST + 2)]
+        self.unknown_IDs = {"51"}
+        with patch.object(self.client, "_get", side_effect=self._get) as get:
+            tracks = self.client.get_several_tracks(track_IDs + ["3", "1"])
+
+        self.assertEqual(get.call_count, 2, "Expected each ID to be requested once.")
+        self.assertEqual(self.requested_IDs, [track_IDs[:50], ["51"]])
+        self.assertEqual(list(tracks), track_IDs)
+        self.assertEqual(tracks["2"], dict(name="Song 2", duration_ms=1000, popularity=2, uri="spotify:track:2"))
+        self.assertEqual(tracks["51"], None)
+
+    def test_failed_request(self):
+        def get(path, params=None):
+            if "1" in params["ids"].split(","):
+                return CachedResponse(500, json.dumps(dict(error="Server error")).encode("UTF-8"))
+            return self._get(path, params)
+
+        artist_IDs = [str(x) for x in range(1, 61)]
+        with patch.object(self.client, "_get", side_effect=get):
+            artists = self.client.get_several_artists(artist_IDs)
+
+        self.assertEqual(list(artists), artist_IDs)
+        self.assertEqual([x for x, artist in artists.items() if artist is not None], artist_IDs[50:],
+                         "Expected the IDs of the failed request to map to None.")
+
+    def test_no_ids(self):
+        with patch.object(self.client, "_get", side_effect=self._get) as get:
+            self.assertEqual(self.client.get_several_artists([]), {})
+            self.assertEqual(self.client.get_several_tracks([]), {})
+        self.assertEqual(get.call_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import unittest
+from contextlib import closing
+from unittest import mock
+
+from knowledge_base import sqlite_config
+from knowledge_base.api import KnowledgeBaseAPI
+from knowledge_base.sqlite_config import ConnectionConfig
+from scripts import test_db_utils
+
+
+class TestSqliteConfig(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+        for suffix in ["-wal", "-shm"]:
+            if os.path.exists(self.DB_path + suffix):
+                os.remove(self.DB_path + suffix)
+
+    def test_parse_pragmas(self):
+        self.assertEqual(sqlite_config.parse_pragmas("journal_mode=WAL; mmap_size=268435456;"),
+                         dict(journal_mode="WAL", mmap_size="268435456"))
+        self.assertEqual(sqlite_config.parse_pragmas(""), dict())
+        for text in ["journal_mode", "foreign_keys=0", "synchronous=OFF; DROP TABLE nodes"]:
+            with self.assertRaises(ValueError, msg="Expected '{}' to be rejected.".format(text)):
+                sqlite_config.parse_pragmas(text)
+
+    def test_from_env(self):
+        with mock.patch.dict(os.environ, {sqlite_config.PRAGMAS_ENV_VAR: "cache_size=-2000",
+                                          sqlite_config.READ_ONLY_ENV_VAR: "1",
+                                          sqlite_config.BUSY_TIMEOUT_ENV_VAR: "100"}):
+            config = KnowledgeBaseAPI(self.DB_path).connection_config
+        self.assertEqual(config.pragmas, dict(cache_size="-2000"))
+        self.assertTrue(config.read_only)
+        self.assertEqual(config.busy_timeout_ms, 100)
+
+    def test_wal_mode(self):
+        kb_api = KnowledgeBaseAPI(self.DB_path, connection_config=ConnectionConfig(
+            dict(journal_mode="WAL", synchronous="NORMAL", mmap_size=1 << 20)))
+        with closing(kb_api.connection) as con:
+            self.assertEqual(con.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(con.execute("PRAGMA synchronous").fetchone()[0], 1)
+        self.assertEqual(kb_api.get_related_entities("Justin Bieber"), ["Justin Timberlake", "Shawn Mendes"])
+
+        # Commits of other processes go to the write-ahead log, which the versions must reflect.
+        write_version = kb_api.get_write_version()
+        data_version = kb_api.get_data_version()
+        with closing(sqlite3.connect(self.DB_path)) as con:
+            with con:
+                con.execute("UPDATE artists SET num_spotify_followers = 1;")
+        self.assertNotEqual(kb_api.get_write_version(), write_version)
+        self.assertNotEqual(kb_api.get_data_version(), data_version)
+
+    def test_read_only(self):
+        kb_api = KnowledgeBaseAPI(self.DB_path, connection_config=ConnectionConfig(read_only=True))
+        self.assertEqual(kb_api.get_related_entities("Justin Bieber"), ["Justin Timberlake", "Shawn Mendes"])
+        self.assertEqual(kb_api.add_artist("Heart"), None, "Expected writes to a read-only DB to fail.")
+        self.assertEqual(KnowledgeBaseAPI(self.DB_path).get_node_ids_by_entity_type("Heart"), dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
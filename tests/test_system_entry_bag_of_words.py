@@ -18,7 +18,7 @@ class TestSystemEntryBOW(unittest.TestCase):
                                         )
 
     def tearDown(self):
-        test_db_utils.remove_db()
+        test_db_utils.remove_db(self.DB_path)
 
     def test_call(self):
         save_state = KnowledgeBaseAPI.get_all_music_entities
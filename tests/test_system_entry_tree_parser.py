@@ -15,7 +15,7 @@ class TestSystemEntryTreeParser(unittest.TestCase):
                                         parser_type="TREE")
 
     def tearDown(self):
-        test_db_utils.remove_db()
+        test_db_utils.remove_db(self.DB_path)
 
     def test_call_functional_test(self):
         self.results_dict['play'] = None
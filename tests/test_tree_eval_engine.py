@@ -0,0 +1,56 @@
+import unittest
+
+from command_evaluation.tree_eval_engine import TreeEvalEngine
+from nlp.tree_parser import TreeParser
+from player_adaptor.recording_adaptor import RecordingController
+from scripts import test_db_utils
+
+
+class TestTreeEvalEngine(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.player_controller = RecordingController()
+        self.eval_engine = TreeEvalEngine(self.DB_path, self.player_controller)
+        self.parser = TreeParser(self.DB_path, self.eval_engine.keywords)
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def _evaluate(self, text, eval_engine=None):
+        (eval_engine or self.eval_engine)(self.parser, text)
+        return self.player_controller.take_actions()
+
+    def test_result_cache_is_shared_across_requests(self):
+        uncached_eval_engine = TreeEvalEngine(self.DB_path, self.player_controller, result_cache_size=0)
+        for text in ["play something similar to justin bieber",
+                     "who is similar to justin bieber",
+                     "play something similar to justin bieber or u2",
+                     "play songs by justin bieber and songs by u2"]:
+            self.assertEqual(self._evaluate(text), self._evaluate(text, uncached_eval_engine),
+                             "Mismatch for '{}'.".format(text))
+        self.assertIsNone(uncached_eval_engine.result_cache_info())
+
+        info = self.eval_engine.result_cache_info()
+        self.assertEqual(info["hits"], 2, "Expected 'similar to justin bieber' to be evaluated once.")
+        self.assertEqual(info["misses"], 3)
+
+    def test_result_cache_invalidated_by_kb_writes(self):
+        self.assertNotIn("U2", self._evaluate("play something similar to justin bieber")[0][1])
+        self.eval_engine.kb_api.connect_entities("Justin Bieber", "U2", "similar to", 1)
+        self.assertIn("U2", self._evaluate("play something similar to justin bieber")[0][1])
+
+    def test_result_cache_ttl(self):
+        eval_engine = TreeEvalEngine(self.DB_path, self.player_controller, result_cache_ttl_seconds=-1)
+        self._evaluate("play something similar to justin bieber", eval_engine)
+        self._evaluate("play something similar to justin bieber", eval_engine)
+        self.assertEqual(eval_engine.result_cache_info()["hits"], 0, "Expected expired results to be recomputed.")
+
+    def test_result_cache_keeps_empty_results(self):
+        for _ in range(2):
+            self.assertEqual(self._evaluate("play songs by despacito"),
+                             [("respond", "I'm sorry, I couldn't find that for you.")])
+        self.assertEqual(self.eval_engine.result_cache_info()["hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from contextlib import closing
+
+from command_evaluation.tree_eval_engine import TreeEvalEngine
+from knowledge_base.api import KnowledgeBaseAPI
+from nlp.tree_parser import TreeParser
+from scripts import test_db_utils
+from tests.mock_objects import MockController
+
+
+class TestTreeParser(unittest.TestCase):
+    utterances = [
+        "play something similar to U2",
+        "play stuff like Justin Bieber",
+        "play songs by justin bieber and u2",
+        "play Despacito or Sorry",
+        "play songs by Justin Timberlake and Shawn Mendes or U2",
+        "play U2 or Sorry and songs by Justin Bieber",
+        "blah",
+    ]
+
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.keywords = TreeEvalEngine(self.DB_path, MockController({})).keywords
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def _parse_all(self, parser):
+        results = []
+        for utterance in self.utterances:
+            try:
+                results.append(parser(utterance).pformat(margin=1000))
+            except ValueError as e:
+                results.append(str(e))
+        return results
+
+    def test_parse_cache_matches_uncached_parses(self):
+        parser = TreeParser(self.DB_path, self.keywords)
+        uncached_parser = TreeParser(self.DB_path, self.keywords, parse_cache_size=0)
+        expected = self._parse_all(uncached_parser)
+        self.assertEqual(self._parse_all(parser), expected)
+        # All shapes are cached now.
+        self.assertEqual(self._parse_all(parser), expected)
+
+        info = parser.parse_cache_info()
+        self.assertEqual(info["misses"], 6, "Expected utterances of the same shape to share a parse.")
+        self.assertEqual(info["hits"], 8)
+        self.assertEqual(info["size"], 6)
+        self.assertEqual(uncached_parser.parse_cache_info(), None)
+
+    def test_parse_cache_eviction(self):
+        parser = TreeParser(self.DB_path, self.keywords, parse_cache_size=2)
+        self._parse_all(parser)
+        self.assertEqual(parser.parse_cache_info()["size"], 2)
+
+    def test_update_entities_matches_new_parser(self):
+        parser = TreeParser(self.DB_path, self.keywords)
+        self._parse_all(parser)
+        kb_api = KnowledgeBaseAPI(self.DB_path)
+        # An entity named like a command changes the parse of sentences that contain it.
+        added = ["Heart", "control_play", "Don't Stop"]
+        for name in added:
+            kb_api.add_artist(name)
+        with closing(kb_api.connection) as con:
+            with con:
+                con.execute("DELETE FROM songs WHERE node_id IN (SELECT id FROM nodes WHERE name = 'Sorry');")
+        parser.update_entities(added=added, removed=["Sorry"])
+
+        self.utterances = self.utterances + ["play heart", "play control_play"]
+        self.assertEqual(self._parse_all(parser),
+                         self._parse_all(TreeParser(self.DB_path, self.keywords, parse_cache_size=0)))
+        self.assertNotIn("Sorry", parser.entity_index)
+
+    def test_cached_trees_are_copies(self):
+        parser = TreeParser(self.DB_path, self.keywords)
+        tree = parser("play U2")
+        tree[1][0][0] = "Sorry"
+        self.assertEqual(parser("play Despacito").leaves(), ["control_play", "Despacito"])
+        self.assertEqual(parser("play U2").leaves(), ["control_play", "U2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from controller.system_entry import SystemEntry
+from caching.lru_cache import LRUCache
+from player_adaptor.recording_adaptor import RecordingController
+from scripts import test_db_utils
+
+
+class TestUtteranceCache(unittest.TestCase):
+    def setUp(self):
+        self.DB_path = test_db_utils.create_and_populate_db()
+        self.player_controller = RecordingController()
+
+    def tearDown(self):
+        test_db_utils.remove_db(self.DB_path)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(capacity=2)
+        cache.put("a", "A", 1)
+        cache.put("b", "B", 1)
+        self.assertEqual(cache.get("a", 1), "A")
+        cache.put("c", "C", 1)
+        self.assertEqual(cache.get("b", 1), None, "Expected the least recently used entry to be evicted.")
+        self.assertEqual(cache.get("a", 1), "A")
+        self.assertEqual(cache.get("c", 1), "C")
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_version_change_drops_entries(self):
+        cache = LRUCache()
+        cache.put("a", "A", 1)
+        self.assertEqual(cache.get("a", 2), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl_seconds=-1)
+        cache.put("a", "A")
+        self.assertEqual(cache.get("a"), None, "Expected expired entry to be treated as a miss.")
+        self.assertEqual(len(cache), 0)
+
+    def test_write_version_changes_on_write(self):
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=self.player_controller)
+        version = system_entry.kb_api.get_write_version()
+        self.assertEqual(system_entry.kb_api.get_write_version(), version)
+        system_entry.kb_api.add_artist("Heart")
+        self.assertNotEqual(system_entry.kb_api.get_write_version(), version)
+
+    def _check_cached(self, parser_type, utterance, equivalent_utterance):
+        system_entry = SystemEntry(db_path=self.DB_path,
+                                   player_controller=self.player_controller,
+                                   parser_type=parser_type)
+        system_entry(utterance)
+        expected_actions = self.player_controller.take_actions()
+        system_entry(equivalent_utterance)
+        self.assertEqual(self.player_controller.take_actions(), expected_actions)
+        self.assertEqual((system_entry.cache.hits, system_entry.cache.misses), (1, 1))
+
+        # A write to the KB invalidates the cached responses.
+        system_entry.kb_api.connect_entities("Justin Bieber", "U2", "similar to", 1)
+        system_entry(utterance)
+        self.assertIn("U2", self.player_controller.take_actions()[0][1])
+        self.assertEqual(system_entry.cache.misses, 2)
+
+    def test_bag_of_words(self):
+        self._check_cached("BagOfWords", "play artists like justin bieber", "Play artists like JUSTIN Bieber")
+
+    def test_tree(self):
+        self._check_cached("TREE", "play artists like justin bieber.", "play artists like justin bieber?")
+
+    def test_disabled(self):
+        system_entry = SystemEntry(db_path=self.DB_path, player_controller=self.player_controller, cache_size=0)
+        self.assertIsNone(system_entry.cache)
+        system_entry("play justin bieber")
+        self.assertEqual(self.player_controller.take_actions(), [("play", ["Justin Bieber"])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,6 +11,20 @@ Execution:
     # For use with another Knowledge Base:
     python3 cli -d ./some_other_knowledgebase.db
 
+    # Print the duration of each stage of every utterance:
+    python3 cli --timings
+
+    # Record a CPU profile (pstats, or collapsed stacks for flamegraphs)
+    # or a memory profile (top allocators at exit, and on SIGUSR2):
+    python3 cli --profile cpu --profile-output ./cli.pstats
+    python3 cli --profile cpu --profile-format collapsed
+    python3 cli --profile mem
+
+    # Process the utterances of a file (or stdin, with "-"), one per
+    # line, writing a JSON result per line, and a summary to stderr:
+    python3 cli --batch ./utterances.txt -o ./results.jsonl
+    cat ./utterances.txt | python3 cli -t --batch - --workers 4
+
 Example sentences:
         "Play Despacito"
         "Play some jazz music"
@@ -19,31 +33,135 @@ Example sentences:
         "Play her top songs"
 
 """
+import json
 import os
 import sys
+import time
 from argparse import ArgumentParser
+from contextlib import redirect_stdout
 
 sys.path.append('../')
 sys.path.append('.')
 from player_adaptor.dummy_adaptor import DummyController
+from player_adaptor.null_adaptor import NullController
 from controller.system_entry import SystemEntry
+from instrumentation import profiling
+from instrumentation.metrics import percentile
 
 DEFAULT_DB = "./knowledge_base/knowledge_base.db"
+DEFAULT_BATCH_SIZE = 1000
 
 
-def run_app(db_path, nlp_parser):
+def run_app(db_path, nlp_parser, timings=None):
     player_controller = DummyController()
     system_entry = SystemEntry(db_path=db_path,
                                player_controller=player_controller,
                                parser_type=nlp_parser,
+                               timings=timings,
                                )
     print("Welcome!")
     for text in sys.stdin:
         system_entry(text)
 
 
+def read_utterances(lines):
+    """Yields the utterances of the given lines, skipping empty ones.
+
+    A line is either a raw utterance, or a JSON object with an
+    "utterance" key (e.g. a line of the output of a previous batch).
+
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                line = json.loads(line)["utterance"]
+            except (ValueError, KeyError, TypeError):
+                pass
+        yield line
+
+
+def format_result(result):
+    """Converts a result of SystemEntry.process_batch to a JSON-serializable dict."""
+    parse = result["parse"]
+    formatted = dict(utterance=result["utterance"])
+    if parse is None:
+        formatted.update(entities=None)
+    elif isinstance(parse, tuple):
+        # Bag of Words parse.
+        subjects, intents, remaining_text = parse
+        formatted.update(entities=subjects, intents=intents, remaining_text=remaining_text)
+    else:
+        # Tree parse.
+        formatted.update(entities=[t[0] for t in parse.subtrees(lambda t: t.label() == "Entity")],
+                         tree=parse.pformat(margin=sys.maxsize),
+                         )
+    formatted.update(
+        response=[argument for action, argument in result["actions"] if action == "respond"],
+        actions=[[action, argument] for action, argument in result["actions"]],
+        error=result["error"],
+        timings={k: round(v, 3) for k, v in result["timings"].items()},
+    )
+    return formatted
+
+
+def run_batch(db_path, nlp_parser, input_path, output_path=None, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """Processes the utterances of a file (or stdin if input_path is "-"),
+    writing a JSON result per line to output_path (or stdout), and a summary
+    of throughput and latencies to stderr.
+
+    Player actions are recorded in the results, not performed.
+
+    """
+    out = open(output_path, "w") if output_path else sys.stdout
+    inp = sys.stdin if input_path == "-" else open(input_path)
+    latencies_ms = []
+    num_errors = 0
+    executor = None
+    try:
+        # Anything the system prints goes to stderr, to keep the output JSONL.
+        with redirect_stdout(sys.stderr):
+            system_entry = SystemEntry(db_path=db_path,
+                                       player_controller=NullController(),
+                                       parser_type=nlp_parser,
+                                       timings=False,
+                                       )
+            start = time.perf_counter()
+            if workers > 1:
+                # The workers are started once, and process every batch.
+                executor = system_entry.worker_pool(workers)
+            utterances = read_utterances(inp)
+            while True:
+                batch = [u for _, u in zip(range(batch_size), utterances)]
+                if not batch:
+                    break
+                for result in system_entry.process_batch(batch, workers=workers, executor=executor):
+                    out.write(json.dumps(format_result(result)) + "\n")
+                    latencies_ms.append(sum(result["timings"].values()))
+                    num_errors += result["error"] is not None
+            elapsed = time.perf_counter() - start
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if inp is not sys.stdin:
+            inp.close()
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
+
+    latencies_ms.sort()
+    print("Processed {} utterances ({} errors) in {:.2f} s: {:.0f} utterances/sec, "
+          "latency p50 {} ms, p90 {} ms, p99 {} ms, max {} ms".format(
+              len(latencies_ms), num_errors, elapsed, len(latencies_ms) / elapsed if elapsed else 0.0,
+              *("{:.3f}".format(x) if x is not None else "-"
+                for x in [percentile(latencies_ms, p) for p in (50, 90, 99, 100)])),
+          file=sys.stderr)
+
+
 def main():
-    print("Initializing app...")
 
     parser = ArgumentParser()
     parser.add_argument("-d", nargs="?", type=str, dest="db_path",
@@ -55,8 +173,34 @@ def main():
                              "Grammar to parse the input into a tree of command"
                              "expressions."                                                   "",
                         action="store_true")
+    parser.add_argument("--timings", action="store_true", default=None,
+                        help=" Print the duration of each stage of every utterance to stderr.")
+    parser.add_argument("--profile", choices=profiling.PROFILE_KINDS,
+                        help=" Record a 'cpu' or 'mem' profile of the session, written at exit.")
+    parser.add_argument("--profile-output", type=str, dest="profile_output_path",
+                        help=" Where to write the profile. Default: ./imr-<kind>-<pid>.<ext>")
+    parser.add_argument("--profile-format", choices=profiling.CPU_FORMATS, default="pstats",
+                        help=" Format of CPU profiles: 'pstats' (cProfile) or 'collapsed' "
+                             "(sampled stacks, for flamegraphs). Default: pstats")
+    parser.add_argument("--batch", type=str, metavar="PATH", dest="batch_input_path",
+                        help=" Process the utterances of this file ('-' for stdin), one per line, "
+                             "and write the results as JSON lines instead of running the app.")
+    parser.add_argument("-o", "--output", type=str, dest="output_path",
+                        help=" With --batch, write the results to this file instead of stdout.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=" With --batch, number of utterances processed together. "
+                             "Default: {}".format(DEFAULT_BATCH_SIZE))
+    parser.add_argument("--workers", type=int, default=1,
+                        help=" With --batch, number of worker processes. Default: 1")
     args = parser.parse_args()
 
+    # In batch mode, stdout may carry the results.
+    log_file = sys.stderr if args.batch_input_path else sys.stdout
+    print("Initializing app...", file=log_file)
+
+    if args.profile:
+        profiling.start(args.profile, args.profile_output_path, args.profile_format)
+
     db_path = args.db_path or DEFAULT_DB
 
     if not os.path.isfile(db_path):
@@ -68,8 +212,15 @@ def main():
 
     nlp_parser = 'TREE' if args.tree_parser else 'BagOfWords'
 
+    if args.batch_input_path:
+        if args.batch_input_path != "-" and not os.path.isfile(args.batch_input_path):
+            print("Error: input file \"{}\" not found.".format(args.batch_input_path), file=sys.stderr)
+            sys.exit(1)
+        run_batch(db_path, nlp_parser, args.batch_input_path, args.output_path, args.batch_size, args.workers)
+        return
+
     print("Running app...")
-    run_app(db_path, nlp_parser)
+    run_app(db_path, nlp_parser, args.timings)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+"""
+This is an executable script that serves the system over HTTP, from
+several worker processes forked from one warmed-up SystemEntry (see
+controller/prefork_server.py). Requires Python 3.7 or later, and os.fork
+(i.e. not Windows).
+
+Execution:
+    cd intelligent-music-recommender/
+
+    # One worker per CPU, on 127.0.0.1:8080:
+    python3 view/server.py
+
+    # 4 workers of the Tree parser, warmed up with the utterances of a file:
+    python3 view/server.py -t --workers 4 --port 8080 --warm-up ./utterances.txt
+
+    # Then:
+    curl -d 'play despacito' http://127.0.0.1:8080/utterance
+    curl http://127.0.0.1:8080/stats
+
+    # Replace the workers with new ones, up to date with the KB:
+    kill -HUP <server pid>
+
+"""
+import os
+import sys
+from argparse import ArgumentParser
+
+sys.path.append('../')
+sys.path.append('.')
+from controller.prefork_server import DEFAULT_ADDRESS, PreforkServer
+from view.cli import DEFAULT_DB, read_utterances
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-d", nargs="?", type=str, dest="db_path", default=DEFAULT_DB,
+                        help=" Specifies a relative path to the DB, (include "
+                             "the filename). Ex: -d ./some_db.sql")
+    parser.add_argument("-t", "--tree_parser", action="store_true",
+                        help=" Use a 'Tree' parser instead of a 'Bag of Words' parser.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help=" Number of worker processes. Default: the number of CPUs")
+    parser.add_argument("--host", type=str, default=DEFAULT_ADDRESS[0],
+                        help=" Address to listen on. Default: {}".format(DEFAULT_ADDRESS[0]))
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1],
+                        help=" Port to listen on. Default: {}".format(DEFAULT_ADDRESS[1]))
+    parser.add_argument("--warm-up", type=str, metavar="PATH", dest="warm_up_path",
+                        help=" Process the utterances of this file, one per line, before forking "
+                             "the workers, so that they start with warm caches.")
+    parser.add_argument("--hot-reload-seconds", type=float, default=0,
+                        help=" If positive, each worker checks the KB for changes at this interval.")
+    parser.add_argument("--graph-snapshot", type=str, metavar="PATH", dest="graph_snapshot_path",
+                        help=" Look up related entities in this graph snapshot "
+                             "(see scripts/export_graph_snapshot.py).")
+    args = parser.parse_args()
+
+    if sys.version_info < (3, 7):
+        print("Error: the server requires Python 3.7 or later (for gc.freeze).", file=sys.stderr)
+        sys.exit(1)
+
+    if not os.path.isfile(args.db_path):
+        print("Error: DB file \"{}\" not found.".format(args.db_path), file=sys.stderr)
+        sys.exit(1)
+
+    warm_up_utterances = []
+    if args.warm_up_path:
+        with open(args.warm_up_path) as f:
+            warm_up_utterances = list(read_utterances(f))
+
+    print("Initializing server...", file=sys.stderr)
+    server = PreforkServer(args.db_path,
+                           parser_type='TREE' if args.tree_parser else 'BagOfWords',
+                           workers=args.workers,
+                           address=(args.host, args.port),
+                           warm_up_utterances=warm_up_utterances,
+                           hot_reload_seconds=args.hot_reload_seconds,
+                           graph_snapshot_path=args.graph_snapshot_path,
+                           )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()